@@ -4,18 +4,41 @@
 """
 from langgraph.types import Command
 from langchain_core.messages import ToolMessage, HumanMessage
-from src.graph.graph_simple import graph
+import asyncio
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from core.config import get_settings
+from src.tools.http_client import get_http_client
+from src.utils.stream_frames import coalesce_chunks, coalesce_events, delta_frame, end_frame, error_frame, cancelled_frame
+from src.utils.sse import SSEHub, SessionEventLog
+from src.graph.graph_simple import get_graph, warmup_graph, fast_intent_classifier, rag_answer_cache, rag_agent_holder
+from src.rag.rag_agent import config as rag_config, get_reranker
+from llm_db_config.coalescing import get_llm_coalescer
+from llm_db_config.rate_limit import get_llm_rate_limiter
+from core.tracing import get_pipeline_metrics, new_turn_tracer
 
-from fastapi import FastAPI,WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI,WebSocket, WebSocketDisconnect, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import AsyncGenerator, Dict, Any, Optional
+from typing import AsyncGenerator, Dict, Any, Optional, Tuple
 
 # ========== FastAPI 初始化 ==========
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 后台线程预热重资源，不阻塞服务开始监听；预热完成前的请求按需加载
+    if get_settings().workflow.warmup_on_startup:
+        threading.Thread(target=warmup_graph, name="graph-warmup", daemon=True).start()
+    yield
+    # 关闭工具层共享的HTTP连接池
+    get_http_client().close()
+
 app = FastAPI(
     title="多模态设备运维 RAG Agent API",
     description="支持文本/图片/PDF多模态问答的设备运维助手",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 # 跨域配置（前端对接必需）
 app.add_middleware(
@@ -31,35 +54,74 @@ class ChatRequest(BaseModel):
     user_input: str
     session_id: str
     auth_token: Optional[str] = ""
+# 各会话正在执行的流式任务（WebSocket/SSE 共用）：同一会话收到新消息时取消旧任务（中止进行中的图执行）
+_active_runs: Dict[str, asyncio.Task] = {}
+# 会话级锁：串行化“取消旧任务 + 创建新任务”，同一会话并发请求时不会同时留下两个执行（无人持有时自动回收）
+_run_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _run_lock(session_id: str) -> asyncio.Lock:
+    lock = _run_locks.get(session_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _run_locks[session_id] = lock
+    return lock
+
 # ========== 核心函数（原有逻辑改异步） ==========
-async def interactive_graph_stream_async(
+async def graph_events_async(
         user_input: str,
         session_id: str,
         auth_token: str = ""
-) -> AsyncGenerator[str, None]:
-    """异步版本的 Agent 流式响应生成器"""
+) -> AsyncGenerator[Tuple[str, Any], None]:
+    """异步执行图并逐个产出事件：("delta", 文本) / ("tool", 工具名) / ("custom", 自定义数据)"""
+    graph = get_graph()
     config = {
         "configurable": {
             "thread_id": session_id,
             "auth_token": auth_token
         }
     }
-    # 处理中断恢复
-    if graph.get_s4tate(config).interrupts:
+    # 处理中断恢复（aget_state 为异步读取检查点，不阻塞事件循环）
+    state = await graph.aget_state(config)
+    if state.interrupts:
         send_message = Command([("resume", {"continue": user_input})])
         config["configurable"]["resume"] = True
     else:
         send_message = {"messages": [HumanMessage(content=user_input)]}
 
+    # 链路追踪：本轮对话的节点/LLM/检索/工具耗时经回调上报（指标见 /metrics）
+    tracer = new_turn_tracer(session_id)
+    if tracer is not None:
+        config["callbacks"] = [tracer]
+
     try:
-        # 异步流式调用 graph（若原有 graph.stream 是同步的，需包装为异步）
-        for event in graph.stream(send_message, config, subgraphs=True, stream_mode=["messages", "custom"]):
+        # 原生异步流式调用：节点内部走 ainvoke，单个慢请求不会阻塞其他会话
+        async for event in graph.astream(send_message, config, subgraphs=True, stream_mode=["messages", "custom"]):
             _, event_type, data = event
             if event_type == "messages" and data and len(data) > 0:
                 if isinstance(data[0], ToolMessage):
-                    yield "\n工具执行完成\n"
+                    yield "tool", data[0].name or ""
                 elif hasattr(data[0], "content") and data[0].content:
-                    yield data[0].content
+                    yield "delta", data[0].content
+            elif event_type == "custom":
+                yield "custom", data
+    finally:
+        if tracer is not None:
+            tracer.finish()  # 正常结束时已由根运行汇总；任务被取消时记为 cancelled
+
+
+async def interactive_graph_stream_async(
+        user_input: str,
+        session_id: str,
+        auth_token: str = ""
+) -> AsyncGenerator[str, None]:
+    """异步版本的 Agent 流式响应生成器（仅输出文本）"""
+    try:
+        async for event_type, data in graph_events_async(user_input, session_id, auth_token):
+            if event_type == "tool":
+                yield "\n工具执行完成\n"
+            elif event_type == "delta":
+                yield data
     except Exception as e:
         yield f"流式执行错误: {str(e)}"
 
@@ -73,21 +135,171 @@ async def chat(request: ChatRequest) -> Dict[str, Any]:
     - session_id: 会话ID（用于区分不同用户，如"user_123"）
     - auth_token: 可选认证令牌（开发环境留空）
     """
-    response_content = ""
+    chunks = []
     async for chunk in interactive_graph_stream_async(request.user_input, request.session_id, request.auth_token):
-        response_content += chunk
+        chunks.append(chunk)
     return {
         "code": 200,
         "message": "success",
         "data": {
             "session_id": request.session_id,
             "user_input": request.user_input,
-            "answer": response_content
+            "answer": "".join(chunks)
         }
     }
 
 
+# ========== SSE 接口（流式响应，支持心跳与断线续传） ==========
+sse_hub = SSEHub(max_sessions=get_settings().stream.sse_max_sessions,
+                 max_events=get_settings().stream.sse_replay_events)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # 禁止代理缓冲，保证逐事件下发
+
+
+async def _publish_graph_run(log: SessionEventLog, request: ChatRequest):
+    """后台执行图并把事件写入会话日志（与HTTP连接解耦，客户端断开后仍可续传）
+    连续的文本增量按 coalesce_ms / coalesce_bytes 合并后再写入，避免逐 token 事件很快挤出续传窗口"""
+    cfg = get_settings().stream
+    stream = graph_events_async(request.user_input, request.session_id, request.auth_token)
+    events = coalesce_events(stream, window_ms=cfg.coalesce_ms, max_bytes=cfg.coalesce_bytes,
+                             max_pending=cfg.max_pending_chunks)
+    try:
+        async for event_type, data in events:
+            if event_type == "delta":
+                await log.publish("delta", {"v": data})
+            elif event_type == "tool":
+                await log.publish("tool", {"name": data})
+            else:
+                await log.publish("custom", data)
+        await log.publish("end", {"session_id": request.session_id})
+    except asyncio.CancelledError:
+        await log.publish("cancel", {"session_id": request.session_id})
+        raise
+    except Exception as e:
+        await log.publish("error", {"message": f"流式执行错误: {str(e)}"})
+    finally:
+        await events.aclose()
+        await stream.aclose()
+        if _active_runs.get(request.session_id) is asyncio.current_task():
+            _active_runs.pop(request.session_id, None)
+
+
+def _last_event_id(http_request: Request, last_event_id: Optional[int]) -> int:
+    header = http_request.headers.get("last-event-id", "")
+    if header.isdigit():
+        return int(header)
+    return last_event_id or 0
+
+
+@app.post("/api/chat/stream", summary="SSE 流式对话接口")
+async def chat_stream(request: ChatRequest):
+    """
+    以 SSE 方式流式返回回答：事件 start / delta({"v": 片段}) / tool / custom / end / error / cancel；
+    每个事件带会话内递增的 id，断线后用 GET /api/chat/stream 携带 Last-Event-ID 续传。
+    同一会话发起新对话会中止进行中的回答。
+    """
+    async with _run_lock(request.session_id):
+        await _cancel_active_run(request.session_id)
+        log = sse_hub.get(request.session_id)
+        # 先同步写入 start 事件，保证订阅开始时执行已处于进行状态
+        start_id = await log.publish("start", {"session_id": request.session_id})
+        _active_runs[request.session_id] = asyncio.create_task(_publish_graph_run(log, request))
+    heartbeat = get_settings().stream.sse_heartbeat_seconds
+    return StreamingResponse(log.subscribe(start_id - 1, heartbeat), media_type="text/event-stream",
+                             headers=SSE_HEADERS)
+
+
+@app.get("/api/chat/stream", summary="SSE 断线续传")
+async def chat_stream_resume(http_request: Request, session_id: str, last_event_id: Optional[int] = None):
+    """从 Last-Event-ID 请求头（或 last_event_id 参数）之后继续接收事件；EventSource 重连时会自动携带该请求头"""
+    log = sse_hub.get(session_id, create=False)
+    if log is None:
+        raise HTTPException(status_code=404, detail="会话不存在或事件已过期")
+    heartbeat = get_settings().stream.sse_heartbeat_seconds
+    return StreamingResponse(log.subscribe(_last_event_id(http_request, last_event_id), heartbeat),
+                             media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 # ========== WebSocket 接口（流式响应，推荐前端使用） ==========
+
+
+async def _cancel_active_run(session_id: str) -> bool:
+    task = _active_runs.pop(session_id, None)
+    if task is None or task.done():
+        return False
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+    return True
+
+
+async def _stream_legacy(websocket: WebSocket, user_input: str, session_id: str, auth_token: str):
+    """兼容协议：每个片段一帧，带完整的 code/message/data 包装"""
+    stream = interactive_graph_stream_async(user_input, session_id, auth_token)
+    try:
+        async for chunk in stream:
+            await websocket.send_json({
+                "code": 200,
+                "message": "success",
+                "data": {
+                    "chunk": chunk,
+                    "session_id": session_id
+                }
+            })
+    finally:
+        await stream.aclose()
+    # 流式结束标记
+    await websocket.send_json({
+        "code": 200,
+        "message": "stream_end",
+        "data": {"session_id": session_id}
+    })
+
+
+async def _stream_delta(websocket: WebSocket, user_input: str, session_id: str, auth_token: str):
+    """delta 协议：按时间/大小窗口合并片段，紧凑增量帧，客户端慢时通过有界队列背压"""
+    cfg = get_settings().stream
+    stream = interactive_graph_stream_async(user_input, session_id, auth_token)
+    frames = coalesce_chunks(stream, window_ms=cfg.coalesce_ms, max_bytes=cfg.coalesce_bytes,
+                             max_pending=cfg.max_pending_chunks)
+    try:
+        async for frame in frames:
+            await websocket.send_text(delta_frame(frame))
+    finally:
+        await frames.aclose()
+        await stream.aclose()
+    await websocket.send_text(end_frame(session_id))
+
+
+async def _run_stream(websocket: WebSocket, protocol: str, user_input: str, session_id: str, auth_token: str):
+    try:
+        if protocol == "delta":
+            await _stream_delta(websocket, user_input, session_id, auth_token)
+        else:
+            await _stream_legacy(websocket, user_input, session_id, auth_token)
+    except asyncio.CancelledError:
+        # 被同一会话的新消息取消：通知前端丢弃未完成的回答
+        try:
+            if protocol == "delta":
+                await websocket.send_text(cancelled_frame(session_id))
+            else:
+                await websocket.send_json({"code": 200, "message": "stream_cancelled", "data": {"session_id": session_id}})
+        except Exception:
+            pass
+        raise
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        if protocol == "delta":
+            await websocket.send_text(error_frame(f"服务器错误: {str(e)}"))
+        else:
+            await websocket.send_json({"code": 500, "message": f"服务器错误: {str(e)}"})
+    finally:
+        if _active_runs.get(session_id) is asyncio.current_task():
+            _active_runs.pop(session_id, None)
+
+
 @app.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket):
     """
@@ -96,17 +308,24 @@ async def websocket_chat(websocket: WebSocket):
     {
         "user_input": "设备显示008通信故障怎么处理？",
         "session_id": "learning_session",
-        "auth_token": ""
+        "auth_token": "",
+        "protocol": "delta"   // 可选：legacy（默认，逐片段完整包装）/ delta（合并分帧的紧凑增量帧）
     }
+    也可通过连接参数指定协议：ws://host/ws/chat?protocol=delta
+    同一会话在回答未结束时发送新消息，会中止正在进行的回答（legacy 返回 stream_cancelled，delta 返回 {"t":"cancel"}）。
     """
     await websocket.accept()
+    default_protocol = websocket.query_params.get("protocol", "legacy")
+    session_id = ""
+    tasks = set()
     try:
         while True:
-            # 接收前端消息
+            # 接收前端消息（流式回答在独立任务中发送，期间仍可接收新消息）
             data = await websocket.receive_json()
             user_input = data.get("user_input", "")
             session_id = data.get("session_id", "")
             auth_token = data.get("auth_token", "")
+            protocol = data.get("protocol", default_protocol)
 
             if not user_input or not session_id:
                 await websocket.send_json({
@@ -115,23 +334,12 @@ async def websocket_chat(websocket: WebSocket):
                 })
                 continue
 
-            # 流式返回回答
-            async for chunk in interactive_graph_stream_async(user_input, session_id, auth_token):
-                await websocket.send_json({
-                    "code": 200,
-                    "message": "success",
-                    "data": {
-                        "chunk": chunk,
-                        "session_id": session_id
-                    }
-                })
-
-            # 流式结束标记
-            await websocket.send_json({
-                "code": 200,
-                "message": "stream_end",
-                "data": {"session_id": session_id}
-            })
+            async with _run_lock(session_id):
+                await _cancel_active_run(session_id)
+                task = asyncio.create_task(_run_stream(websocket, protocol, user_input, session_id, auth_token))
+                _active_runs[session_id] = task
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
     except WebSocketDisconnect:
         print(f"会话 {session_id} 已断开")
     except Exception as e:
@@ -139,13 +347,56 @@ async def websocket_chat(websocket: WebSocket):
             "code": 500,
             "message": f"服务器错误: {str(e)}"
         })
+    finally:
+        # 连接断开：中止该连接上仍在进行的回答
+        for task in list(tasks):
+            task.cancel()
 
 
 # ========== 测试接口 ==========
 @app.get("/health", summary="健康检查接口")
 async def health_check():
     """用于验证服务是否正常运行"""
-    return {"status": "healthy", "service": "rag-agent-api"}
+    return {"status": "healthy", "service": "rag-agent-api", "rag_ready": rag_agent_holder.ready}
+
+
+@app.get("/api/stats/intent", summary="快速意图分类统计")
+async def intent_stats():
+    """各分类层（keyword/embedding/llm）的调用次数、命中率与平均耗时，用于调节阈值"""
+    return {"code": 200, "message": "success", "data": fast_intent_classifier.stats()}
+
+
+@app.get("/api/stats/rag_cache", summary="RAG语义缓存统计")
+async def rag_cache_stats():
+    """语义答案缓存的条目数、命中/未命中次数、命中率与累计节省耗时（秒）"""
+    return {"code": 200, "message": "success", "data": rag_answer_cache.stats()}
+
+
+@app.get("/api/stats/rag_rerank", summary="RAG重排序统计")
+async def rag_rerank_stats():
+    """重排序阶段的平均候选数/保留数、批大小与批次数、截断前后的上下文token数，以及耗时分位数（毫秒）"""
+    data = {"enabled": rag_config.RERANK_ENABLED, "candidates": rag_config.RERANK_CANDIDATES,
+            "token_budget": rag_config.RERANK_TOKEN_BUDGET}
+    data.update(get_reranker().stats())
+    return {"code": 200, "message": "success", "data": data}
+
+
+@app.get("/api/stats/llm_coalesce", summary="LLM请求合并统计")
+async def llm_coalesce_stats():
+    """LLM请求总数、实际上游调用数、在途合并数、精确缓存命中数、节省比例，以及当前在途请求数与缓存条数"""
+    return {"code": 200, "message": "success", "data": get_llm_coalescer().stats()}
+
+
+@app.get("/api/stats/llm_rate_limit", summary="LLM限流与自适应并发统计")
+async def llm_rate_limit_stats():
+    """当前并发上限（AIMD调整）、在途/排队请求数、429次数、重试次数、排队超时、平均排队耗时、令牌桶余量"""
+    return {"code": 200, "message": "success", "data": get_llm_rate_limiter().stats()}
+
+
+@app.get("/metrics", summary="Prometheus指标", response_class=PlainTextResponse)
+async def metrics():
+    """图节点耗时、LLM首token/总耗时与token数、检索耗时与文档数、工具耗时（Prometheus文本格式）"""
+    return PlainTextResponse(get_pipeline_metrics().render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 if __name__ == "__main__":
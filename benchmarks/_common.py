@@ -0,0 +1,50 @@
+"""
+压测脚本公共工具：启动伪 OpenAI 服务、构造指向它的 ChatOpenAI
+"""
+import contextlib
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+@contextlib.contextmanager
+def fake_openai_server(port: int = 9999, ttft: float = 0.3, tokens: int = 20, interval: float = 0.02):
+    """以子进程方式启动伪 OpenAI 服务，退出上下文时关闭"""
+    proc = subprocess.Popen([
+        sys.executable, str(PROJECT_ROOT / "benchmarks" / "fake_openai_server.py"),
+        "--port", str(port), "--ttft", str(ttft), "--tokens", str(tokens), "--interval", str(interval),
+    ])
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 15
+        while time.time() < deadline:
+            try:
+                urllib.request.urlopen(f"{base_url}/stats", timeout=0.5)
+                break
+            except Exception:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError("伪 OpenAI 服务启动超时")
+        yield f"{base_url}/v1"
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def fake_llm(base_url: str):
+    """构造指向伪服务的流式 ChatOpenAI"""
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(base_url=base_url, api_key="fake", model="fake", temperature=0.1, streaming=True)
+
+
+def percentile(values, pct: float) -> float:
+    """简单分位数（values 非空）"""
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
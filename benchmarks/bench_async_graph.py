@@ -0,0 +1,82 @@
+"""
+并发压测：同步 graph.stream（旧实现） vs 原生 graph.astream（新实现）
+在同一个事件循环里并发跑 N 个会话，对比总耗时与吞吐，复现“一个慢请求卡住所有会话”的问题。
+
+运行：
+    python benchmarks/bench_async_graph.py --concurrency 1 8 32 128
+"""
+import argparse
+import asyncio
+import time
+
+from _common import fake_openai_server, fake_llm, percentile
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import StateGraph, END
+
+from src.intent_demo.intent_schemas import State
+from src.intent_demo.intent_cls import intent_cls_factory
+from src.chit_chat.chit_chat import create_chit_chat_node
+
+
+def build_bench_graph(llm):
+    """只包含 intent_cls → chit_chat 的精简图，避免依赖 Milvus/BGE"""
+    builder = StateGraph(State)
+    builder.add_node("intent_cls", intent_cls_factory(llm))
+    builder.add_node("chit_chat", create_chit_chat_node(llm))
+    builder.set_entry_point("intent_cls")
+    builder.add_edge("intent_cls", "chit_chat")
+    builder.add_edge("chit_chat", END)
+    return builder.compile(checkpointer=MemorySaver())
+
+
+async def legacy_turn(graph, session_id: str) -> float:
+    """旧实现：async 函数里迭代同步 graph.stream，阻塞事件循环"""
+    start = time.perf_counter()
+    config = {"configurable": {"thread_id": session_id}}
+    for _ in graph.stream({"messages": [HumanMessage(content="你好")]}, config, stream_mode=["messages", "custom"]):
+        await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+async def async_turn(graph, session_id: str) -> float:
+    """新实现：graph.astream + 节点 ainvoke"""
+    start = time.perf_counter()
+    config = {"configurable": {"thread_id": session_id}}
+    async for _ in graph.astream({"messages": [HumanMessage(content="你好")]}, config, stream_mode=["messages", "custom"]):
+        pass
+    return time.perf_counter() - start
+
+
+async def run_level(graph, turn_fn, concurrency: int, tag: str):
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[turn_fn(graph, f"{tag}-{concurrency}-{i}") for i in range(concurrency)])
+    wall = time.perf_counter() - start
+    return wall, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="graph.stream vs graph.astream 并发压测")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--skip-legacy-above", type=int, default=32, help="旧实现串行执行，超过该并发数跳过以免耗时过长")
+    args = parser.parse_args()
+
+    with fake_openai_server(port=args.port, ttft=args.ttft, tokens=args.tokens) as base_url:
+        graph = build_bench_graph(fake_llm(base_url))
+        print(f"{'mode':<8}{'conc':>6}{'wall(s)':>10}{'turns/s':>10}{'p50(s)':>9}{'p99(s)':>9}")
+        for concurrency in args.concurrency:
+            modes = [("astream", async_turn)]
+            if concurrency <= args.skip_legacy_above:
+                modes.insert(0, ("stream", legacy_turn))
+            for name, turn_fn in modes:
+                wall, latencies = asyncio.run(run_level(graph, turn_fn, concurrency, name))
+                print(f"{name:<8}{concurrency:>6}{wall:>10.2f}{concurrency / wall:>10.1f}"
+                      f"{percentile(latencies, 50):>9.2f}{percentile(latencies, 99):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+检查点存储测试：10k 活跃会话下每轮对话的检查点读写延迟
+模拟一轮对话的存取模式：get_tuple 读取最新检查点 → 每个节点一次 put_writes + put（默认3个节点）。
+对比 MemorySaver 与 SqliteCheckpointSaver（批量落盘，WAL）。
+
+运行：
+    python benchmarks/bench_checkpointer.py --threads 10000 --turns 2000
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from _common import percentile
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import MemorySaver
+
+from llm_db_config.sqlite_saver import SqliteCheckpointSaver
+
+
+def make_checkpoint(turn: int):
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": [
+        HumanMessage(content=f"第{turn}轮：查询深圳场站的设备分析列表"),
+        AIMessage(content="这是一个示例查询结果" * 20),
+    ]}
+    return checkpoint
+
+
+def run_turn(saver, thread_id: str, turn: int, nodes: int):
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    start = time.perf_counter()
+    saved = saver.get_tuple(config)
+    read_cost = time.perf_counter() - start
+    if saved is not None:
+        config = saved.config
+    start = time.perf_counter()
+    for step in range(nodes):
+        saver.put_writes(config, [("messages", [AIMessage(content="节点输出")])], task_id=f"task-{turn}-{step}")
+        config = saver.put(config, make_checkpoint(turn), {"source": "loop", "step": step}, {})
+    return read_cost, time.perf_counter() - start
+
+
+def bench(name: str, saver, threads: int, turns: int, nodes: int):
+    start = time.perf_counter()
+    for i in range(threads):
+        run_turn(saver, f"thread-{i}", 0, 1)
+    populate = time.perf_counter() - start
+    reads, writes = [], []
+    for turn in range(turns):
+        read_cost, write_cost = run_turn(saver, f"thread-{random.randrange(threads)}", turn + 1, nodes)
+        reads.append(read_cost)
+        writes.append(write_cost)
+    print(f"[{name}] 预填充{threads}个会话 {populate:.2f}s | 每轮读取 p50={percentile(reads, 50) * 1000:.2f}ms "
+          f"p99={percentile(reads, 99) * 1000:.2f}ms | 每轮写入({nodes}节点) p50={percentile(writes, 50) * 1000:.2f}ms "
+          f"p99={percentile(writes, 99) * 1000:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查点存储读写延迟测试")
+    parser.add_argument("--threads", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--nodes", type=int, default=3, help="每轮对话经过的节点数")
+    args = parser.parse_args()
+
+    bench("MemorySaver", MemorySaver(), args.threads, args.turns, args.nodes)
+    with tempfile.TemporaryDirectory() as tmp:
+        saver = SqliteCheckpointSaver(str(Path(tmp) / "checkpoints.sqlite"))
+        bench("SqliteCheckpointSaver", saver, args.threads, args.turns, args.nodes)
+        saver.close()
+        size = sum(p.stat().st_size for p in Path(tmp).iterdir())
+        print(f"数据库文件总大小：{size / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+查询向量微批处理测试：并发 1/8/32/128 下逐条前向计算与 MicroBatchEmbeddings 的 queries/sec 对比
+每个并发线程循环调用 embed_query（问题文本互不相同，避免命中任何缓存），统计吞吐与单次延迟分位数。
+
+运行：
+    python benchmarks/bench_embedding_batch.py --concurrency 1,8,32,128 --queries 512
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import percentile
+
+from src.rag.micro_batch_embeddings import MicroBatchEmbeddings
+from src.rag.rag_agent import config, get_embedding_device
+
+QUESTIONS = ["设备显示{}号通信故障怎么处理？", "{}号机组的巡检周期是多久？", "E-{}报警的可能原因有哪些？",
+             "更换{}号备件需要哪些步骤？"]
+
+
+def load_base():
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=config.EMBEDDING_MODEL,
+        model_kwargs={"device": get_embedding_device(), "trust_remote_code": True},
+        encode_kwargs={"normalize_embeddings": True},
+    )
+
+
+def bench(name: str, embeddings, concurrency: int, queries: int, offset: int):
+    texts = [QUESTIONS[i % len(QUESTIONS)].format(offset + i) for i in range(queries)]
+    latencies = []
+
+    def one(text: str):
+        t0 = time.perf_counter()
+        embeddings.embed_query(text)
+        latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, texts))
+    elapsed = time.perf_counter() - start
+    extra = ""
+    if isinstance(embeddings, MicroBatchEmbeddings):
+        extra = f" | 平均批大小 {embeddings.stats()['avg_batch_size']}"
+    print(f"[{name}] 并发{concurrency:>3}: {queries / elapsed:8.1f} q/s | p50={percentile(latencies, 50) * 1000:.1f}ms "
+          f"p99={percentile(latencies, 99) * 1000:.1f}ms{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询向量微批处理吞吐测试")
+    parser.add_argument("--concurrency", default="1,8,32,128")
+    parser.add_argument("--queries", type=int, default=512, help="每个并发档位的查询总数")
+    parser.add_argument("--window-ms", type=float, default=config.EMBEDDING_BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=config.EMBEDDING_MAX_BATCH)
+    args = parser.parse_args()
+
+    base = load_base()
+    base.embed_query("预热")
+    offset = 0
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        bench("逐条", base, concurrency, args.queries, offset)
+        offset += args.queries
+        micro = MicroBatchEmbeddings(base, window_ms=args.window_ms, max_batch=args.max_batch)
+        bench("微批", micro, concurrency, args.queries, offset)
+        offset += args.queries
+
+
+if __name__ == "__main__":
+    main()
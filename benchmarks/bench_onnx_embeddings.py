@@ -0,0 +1,80 @@
+"""
+ONNX 嵌入运行时测试：int8/fp32 ONNX 与 PyTorch 路径的吞吐对比及精度漂移
+    - 吞吐：批量 embed_documents（texts/s）与单条 embed_query 延迟 p50/p99；
+    - 漂移：逐条余弦相似度（最小/均值），以及以 PyTorch 结果为真值的近邻 recall@k（检索结果是否一致）。
+ONNX 模型不存在时先自动导出（需要 torch + onnxruntime）。
+
+运行：
+    python benchmarks/bench_onnx_embeddings.py --texts 2000 --threads 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from _common import percentile
+
+from src.rag.onnx_embeddings import load_onnx_embeddings
+from src.rag.rag_agent import config
+
+TEMPLATES = [
+    "设备显示{}号通信故障，请检查通信线缆与终端电阻，确认站号设置正确后重新上电。",
+    "E-{}：伺服驱动器过载报警，可能原因包括负载过大、机械卡滞或电机接线错误。",
+    "更换备件PN-{}A前，先断开主电源并挂牌上锁，确认电容放电完毕。",
+    "{}号机组巡检：检查轴承温度、振动值与润滑油位，记录异常并上报。",
+    "参数P{}设置为1时，运行指令由外部端子给定。",
+]
+
+
+def make_texts(n: int):
+    return [TEMPLATES[i % len(TEMPLATES)].format(i) * (1 + i % 3) for i in range(n)]
+
+
+def throughput(name: str, embeddings, texts, queries: int):
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    batch_cost = time.perf_counter() - start
+    latencies = []
+    for text in texts[:queries]:
+        t0 = time.perf_counter()
+        embeddings.embed_query(text)
+        latencies.append(time.perf_counter() - t0)
+    print(f"[{name}] 批量 {len(texts) / batch_cost:8.1f} texts/s | 单条查询 p50={percentile(latencies, 50) * 1000:.1f}ms "
+          f"p99={percentile(latencies, 99) * 1000:.1f}ms")
+    return vectors
+
+
+def drift(name: str, reference: np.ndarray, candidate: np.ndarray, k: int, queries: int):
+    cosines = np.sum(reference * candidate, axis=1)
+    ref_q, cand_q = reference[:queries], candidate[:queries]
+    ref_top = np.argsort(-(ref_q @ reference.T), axis=1)[:, 1:k + 1]
+    cand_top = np.argsort(-(cand_q @ candidate.T), axis=1)[:, 1:k + 1]
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)])
+    print(f"[{name}] 漂移：余弦 min={cosines.min():.5f} mean={cosines.mean():.5f} | 近邻 recall@{k}={recall:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX 与 PyTorch 嵌入吞吐/精度对比")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=config.ONNX_THREADS)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    texts = make_texts(args.texts)
+    torch_embeddings = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL, model_kwargs={"device": "cpu"},
+                                             encode_kwargs={"normalize_embeddings": True})
+    torch_embeddings.embed_query("预热")
+    reference = throughput("torch", torch_embeddings, texts, args.queries)
+    for quantize in (False, True):
+        name = f"onnx-{'int8' if quantize else 'fp32'}"
+        onnx_embeddings = load_onnx_embeddings(config.EMBEDDING_MODEL, config.ONNX_MODEL_DIR, quantize=quantize,
+                                               threads=args.threads, batch_size=config.ONNX_BATCH_SIZE,
+                                               drift_threshold=0.0)
+        onnx_embeddings.embed_query("预热")
+        drift(name, reference, throughput(name, onnx_embeddings, texts, args.queries), args.k, args.queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+PDF 图片 OCR 测试：串行（单个 PaddleOCR，逐张解码识别）与 ParallelPDFImageOCR（进程池 + 去重 + 小图过滤）对比
+输出总耗时、每页耗时与跳过统计；扫描版手册可按每页耗时估算整本入库时间。
+
+运行：
+    python benchmarks/bench_pdf_ocr.py docs/故障排查手册.pdf --workers 4 --pages 50
+"""
+import argparse
+import io
+import tempfile
+import time
+from pathlib import Path
+
+import _common  # noqa: F401  （把项目根目录加入 sys.path）
+
+import fitz
+import numpy as np
+from PIL import Image
+
+from src.rag.ocr_pipeline import ParallelPDFImageOCR, create_ocr, ocr_text
+
+
+def head_pages(pdf_path: str, pages: int) -> str:
+    """截取前 N 页到临时文件，控制测试时长"""
+    src = fitz.open(pdf_path)
+    out = fitz.open()
+    out.insert_pdf(src, to_page=min(pages, len(src)) - 1)
+    path = Path(tempfile.mkdtemp()) / "head.pdf"
+    out.save(str(path))
+    src.close()
+    out.close()
+    return str(path)
+
+
+def serial(pdf_path: str) -> int:
+    ocr = create_ocr()
+    doc = fitz.open(pdf_path)
+    count = 0
+    for page in doc:
+        for img in page.get_images(full=True):
+            image = doc.extract_image(img[0])
+            ocr_text(ocr, np.array(Image.open(io.BytesIO(image["image"])).convert("RGB")))
+            count += 1
+    doc.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF 图片 OCR 串行/并行对比")
+    parser.add_argument("pdf")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--skip-serial", action="store_true")
+    args = parser.parse_args()
+
+    pdf_path = head_pages(args.pdf, args.pages)
+    pages = len(fitz.open(pdf_path))
+    if not args.skip_serial:
+        start = time.perf_counter()
+        images = serial(pdf_path)
+        elapsed = time.perf_counter() - start
+        print(f"[串行] {pages}页/{images}张图片：{elapsed:.1f}s（{elapsed / pages:.2f}s/页）")
+
+    pipeline = ParallelPDFImageOCR(workers=args.workers)
+    try:
+        start = time.perf_counter()
+        for _ in pipeline.iter_pdf(pdf_path):
+            pass
+        elapsed = time.perf_counter() - start  # 含工作进程加载模型的时间
+        print(f"[并行×{pipeline.workers}] {pages}页：{elapsed:.1f}s（{elapsed / pages:.2f}s/页）| {pipeline.stats}")
+    finally:
+        pipeline.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+计划执行器测试：三个独立查询（看板类请求）串行 vs 并发
+每个伪工具固定耗时 --latency 秒，并发执行的总耗时应接近最慢的一个而不是三者之和。
+
+运行：
+    python benchmarks/bench_plan_executor.py --latency 0.5
+"""
+import argparse
+import asyncio
+import time
+
+from _common import PROJECT_ROOT  # noqa: F401  （把项目根目录加入 sys.path）
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import StructuredTool
+
+from src.intent_demo.plan_executor import PlanExecutor
+
+
+def make_tools(latency: float):
+    def build(name: str):
+        def query(userText: str = "") -> str:
+            time.sleep(latency)
+            return f"{name} 查询结果"
+
+        async def aquery(userText: str = "") -> str:
+            await asyncio.sleep(latency)
+            return f"{name} 查询结果"
+        return StructuredTool.from_function(func=query, coroutine=aquery, name=name, description=f"{name} 查询")
+    return [build(n) for n in ("device_stats", "alarm_stats", "charge_stats")]
+
+
+def make_state(tools, chain: bool):
+    steps = [{"id": f"call_{i}", "agent_tool": t.name, "params": {"userText": "看板"},
+              "depends_on": [f"call_{i - 1}"] if chain and i > 1 else []} for i, t in enumerate(tools, start=1)]
+    tool_calls = [{"name": s["agent_tool"], "args": s["params"], "id": s["id"]} for s in steps]
+    return {"messages": [AIMessage(content="", tool_calls=tool_calls)], "plan": {"type": "plan", "steps": steps}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="计划执行器并发测试")
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+    tools = make_tools(args.latency)
+    executor = PlanExecutor(tools, max_concurrent=8, step_timeout=30)
+
+    for label, chain in (("串行依赖（depends_on 链）", True), ("相互独立", False)):
+        state = make_state(tools, chain)
+        start = time.perf_counter()
+        result = executor.run(state)
+        sync_cost = time.perf_counter() - start
+        start = time.perf_counter()
+        asyncio.run(executor.arun(state))
+        async_cost = time.perf_counter() - start
+        print(f"{label}: 同步 {sync_cost:.3f}s  异步 {async_cost:.3f}s  消息数={len(result['messages'])}")
+
+
+if __name__ == "__main__":
+    main()
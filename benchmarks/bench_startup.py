@@ -0,0 +1,96 @@
+"""
+启动开销测试：模块导入耗时 + 服务首字节时间（TTFB）
+    - import：子进程中 `import src.graph.graph_simple` 的耗时（多次取分位数），延迟构建后不应再加载BGE/连接Milvus；
+    - serve：启动 uvicorn app:app，测量从进程启动到 /health 返回首字节的时间；
+    - chat（可选）：服务就绪后首个 /api/chat 请求的首字节时间（需要可用的LLM/Milvus）。
+
+运行：
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 3 --chat
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+from _common import PROJECT_ROOT, percentile
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import src.graph.graph_simple; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def measure_import(runs: int):
+    """每次用全新子进程测量导入耗时，排除模块缓存影响"""
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=str(PROJECT_ROOT),
+                             capture_output=True, text=True, check=True)
+        results.append(float(out.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def first_byte(url: str, data: bytes = None, timeout: float = 120) -> float:
+    """发起请求并返回读到首字节的耗时"""
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"} if data else {})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as resp:
+        resp.read(1)
+    return time.perf_counter() - start
+
+
+def measure_serve(port: int, chat: bool, deadline_seconds: float = 300):
+    """启动服务，返回 (进程启动到 /health 首字节耗时, 首个 /api/chat 首字节耗时或None)"""
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=str(PROJECT_ROOT), env=env, stdout=subprocess.DEVNULL)
+    try:
+        health_url = f"http://127.0.0.1:{port}/health"
+        while True:
+            if time.perf_counter() - start > deadline_seconds:
+                raise RuntimeError("服务启动超时")
+            try:
+                first_byte(health_url, timeout=0.5)
+                break
+            except Exception:
+                time.sleep(0.05)
+        ready = time.perf_counter() - start
+        chat_ttfb = None
+        if chat:
+            body = json.dumps({"user_input": "你好", "session_id": f"bench-startup-{time.time()}"}).encode("utf-8")
+            chat_ttfb = first_byte(f"http://127.0.0.1:{port}/api/chat", data=body)
+        return ready, chat_ttfb
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动开销测试")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--chat", action="store_true", help="额外测量首个 /api/chat 请求的首字节时间")
+    args = parser.parse_args()
+
+    imports = measure_import(args.runs)
+    print(f"import src.graph.graph_simple: p50={percentile(imports, 50):.3f}s  "
+          f"p99={percentile(imports, 99):.3f}s  (runs={args.runs})")
+
+    readies, chats = [], []
+    for _ in range(args.runs):
+        ready, chat_ttfb = measure_serve(args.port, args.chat)
+        readies.append(ready)
+        if chat_ttfb is not None:
+            chats.append(chat_ttfb)
+    print(f"/health 首字节（含进程启动）: p50={percentile(readies, 50):.3f}s  p99={percentile(readies, 99):.3f}s")
+    if chats:
+        print(f"首个 /api/chat 首字节: p50={percentile(chats, 50):.3f}s  p99={percentile(chats, 99):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
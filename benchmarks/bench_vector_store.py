@@ -0,0 +1,126 @@
+"""
+向量库检索测试：本地向量库（暴力 / IVF / HNSW）与 Milvus 的 recall@k 与单查询延迟 p50/p99
+数据为带簇结构的合成归一化向量（模拟同一手册内语义相近的文档块），查询为库内向量加噪声；
+真值由本地暴力检索（精确）给出。Milvus 部分需要 pymilvus 与可连接的服务，未指定 --milvus 时跳过。
+
+运行：
+    python benchmarks/bench_vector_store.py --sizes 10000,100000,1000000 --dim 768
+    python benchmarks/bench_vector_store.py --sizes 10000,100000 --milvus 127.0.0.1:19530
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from _common import percentile
+
+from src.rag.local_vector_store import LocalVectorStore, _HNSWIndex
+
+
+def make_vectors(rng: np.random.Generator, centers: np.ndarray, n: int) -> np.ndarray:
+    x = centers[rng.integers(0, len(centers), n)] + rng.normal(0, 0.6, (n, centers.shape[1])).astype(np.float32)
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def populate(path: str, n: int, dim: int, seed: int, batch: int = 50000):
+    """写入 n 条向量（元数据 chunk_id = 行号）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 1, (256, dim)).astype(np.float32)
+    store = LocalVectorStore(None, path=path, ann="none")
+    start = time.perf_counter()
+    for offset in range(0, n, batch):
+        size = min(batch, n - offset)
+        store.add_embeddings([f"chunk {offset + i}" for i in range(size)], make_vectors(rng, centers, size),
+                             [{"chunk_id": str(offset + i)} for i in range(size)])
+    store.close()
+    print(f"  写入{n}条向量 {time.perf_counter() - start:.1f}s")
+
+
+def make_queries(path: str, queries: int, seed: int) -> np.ndarray:
+    """从库内随机取向量加小噪声作为查询"""
+    store = LocalVectorStore(None, path=path, ann="none")
+    rng = np.random.default_rng(seed + 1)
+    rows = rng.integers(0, store._count, queries)
+    q = np.asarray(store._vectors.array[np.sort(rows)], dtype=np.float32)
+    store.close()
+    q += rng.normal(0, 0.02, q.shape).astype(np.float32)
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def run_local(path: str, ann: str, queries: np.ndarray, truth, k: int, nprobe: int):
+    start = time.perf_counter()
+    store = LocalVectorStore(None, path=path, ann=ann, ann_min_rows=0, nprobe=nprobe)
+    open_cost = time.perf_counter() - start
+    latencies, recalls = [], []
+    for q, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        results = store.similarity_search_with_score_by_vector(q, k=k)
+        latencies.append(time.perf_counter() - t0)
+        got = {doc.metadata["chunk_id"] for doc, _ in results}
+        recalls.append(len(got & expected) / k)
+    store.close()
+    return open_cost, latencies, recalls
+
+
+def run_milvus(address: str, path: str, queries: np.ndarray, truth, k: int, batch: int = 10000):
+    from pymilvus import MilvusClient
+    store = LocalVectorStore(None, path=path, ann="none")
+    client = MilvusClient(uri=f"http://{address}")
+    name = f"bench_vector_store_{int(time.time())}"
+    client.create_collection(name, dimension=store.dim, metric_type="L2", auto_id=False)
+    try:
+        start = time.perf_counter()
+        for offset in range(0, store._count, batch):
+            vectors = np.asarray(store._vectors.array[offset:offset + batch])
+            client.insert(name, [{"id": offset + i, "vector": v.tolist()} for i, v in enumerate(vectors)])
+        client.flush(name)
+        client.load_collection(name)
+        open_cost = time.perf_counter() - start
+        latencies, recalls = [], []
+        for q, expected in zip(queries, truth):
+            t0 = time.perf_counter()
+            hits = client.search(name, data=[q.tolist()], limit=k)[0]
+            latencies.append(time.perf_counter() - t0)
+            recalls.append(len({str(h["id"]) for h in hits} & expected) / k)
+        return open_cost, latencies, recalls
+    finally:
+        client.drop_collection(name)
+        store.close()
+
+
+def report(name: str, open_cost: float, latencies, recalls, k: int):
+    print(f"  [{name}] 打开/建索引 {open_cost:.2f}s | recall@{k}={np.mean(recalls):.4f} | "
+          f"p50={percentile(latencies, 50) * 1000:.2f}ms p99={percentile(latencies, 99) * 1000:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地向量库与Milvus检索对比")
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--milvus", default=None, help="Milvus地址 host:port，不指定则跳过")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    backends = ["none", "ivf"] + (["hnsw"] if _HNSWIndex.available() else [])
+    for n in (int(s) for s in args.sizes.split(",")):
+        print(f"=== {n} 条向量，维度 {args.dim} ===")
+        with tempfile.TemporaryDirectory() as tmp:
+            populate(tmp, n, args.dim, args.seed)
+            queries = make_queries(tmp, args.queries, args.seed)
+            exact = LocalVectorStore(None, path=tmp, ann="none")
+            # 行号即写入顺序，与 chunk_id 一致
+            truth = [{str(r) for r in rows} for rows, _ in exact.search_rows(queries, k=args.k, exact=True)]
+            exact.close()
+            for ann in backends:
+                report(f"local/{'brute' if ann == 'none' else ann}", *run_local(tmp, ann, queries, truth, args.k,
+                                                                                 args.nprobe), args.k)
+            if args.milvus:
+                report("milvus", *run_milvus(args.milvus, tmp, queries, truth, args.k), args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+WebSocket 分帧测试：逐 token 完整包装（legacy） vs 合并分帧的紧凑增量帧（delta）
+不依赖真实服务：用伪 token 流模拟长 RAG 回答，统计帧数、线上字节数与帧率；
+--send-delay 模拟慢客户端（每帧发送耗时），观察背压下帧的自动合并。
+
+运行：
+    python benchmarks/bench_ws_stream.py --tokens 2000 --interval 0.002
+    python benchmarks/bench_ws_stream.py --tokens 2000 --interval 0.002 --send-delay 0.02
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from _common import PROJECT_ROOT  # noqa: F401  （把项目根目录加入 sys.path）
+
+from src.utils.stream_frames import coalesce_chunks, delta_frame, end_frame
+
+TOKENS = ["设备", "显示", "008", "通信", "故障", "，", "请", "检查", "通信模块", "是否", "在线", "。\n"]
+
+
+async def fake_tokens(count: int, interval: float):
+    for i in range(count):
+        await asyncio.sleep(interval)
+        yield TOKENS[i % len(TOKENS)]
+
+
+async def run_legacy(args):
+    frames, size = 0, 0
+    start = time.perf_counter()
+    async for chunk in fake_tokens(args.tokens, args.interval):
+        payload = json.dumps({"code": 200, "message": "success",
+                              "data": {"chunk": chunk, "session_id": "bench_session"}})
+        frames += 1
+        size += len(payload.encode("utf-8"))
+        await asyncio.sleep(args.send_delay)
+    end = json.dumps({"code": 200, "message": "stream_end", "data": {"session_id": "bench_session"}})
+    return frames + 1, size + len(end.encode("utf-8")), time.perf_counter() - start
+
+
+async def run_delta(args):
+    frames, size = 0, 0
+    start = time.perf_counter()
+    async for frame in coalesce_chunks(fake_tokens(args.tokens, args.interval), window_ms=args.window_ms,
+                                       max_bytes=args.max_bytes):
+        payload = delta_frame(frame)
+        frames += 1
+        size += len(payload.encode("utf-8"))
+        await asyncio.sleep(args.send_delay)
+    return frames + 1, size + len(end_frame("bench_session").encode("utf-8")), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket 分帧测试")
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--interval", type=float, default=0.002, help="token 生成间隔（秒）")
+    parser.add_argument("--send-delay", type=float, default=0.0, help="每帧发送耗时（秒），模拟慢客户端")
+    parser.add_argument("--window-ms", type=float, default=30)
+    parser.add_argument("--max-bytes", type=int, default=256)
+    args = parser.parse_args()
+
+    for name, runner in (("legacy", run_legacy), ("delta", run_delta)):
+        frames, size, cost = asyncio.run(runner(args))
+        print(f"[{name:6}] 帧数={frames:6d}  线上字节={size / 1024:8.1f} KB  耗时={cost:6.2f}s  帧率={frames / cost:8.1f} 帧/秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+本地伪 OpenAI 兼容服务 - 压测专用
+功能：模拟 /v1/chat/completions（流式/非流式），按配置的首字延迟与逐token间隔返回，
+      用于在没有真实模型的情况下测试图执行的并发能力。
+
+启动：
+    python benchmarks/fake_openai_server.py --port 9999 --ttft 0.3 --tokens 20 --interval 0.02
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 延迟参数（启动时由命令行覆盖）
+FAKE_CONFIG = {"ttft": 0.3, "tokens": 20, "interval": 0.02}
+# 运行统计：当前并发数/峰值并发/总请求数
+STATS = {"in_flight": 0, "peak_in_flight": 0, "total": 0}
+
+app = FastAPI(title="fake-openai")
+
+INTENT_REPLY = json.dumps({
+    "intent_name": "chit_chat",
+    "intent_key": "chit_chat",
+    "confidence": 0.9,
+    "reason": "benchmark",
+}, ensure_ascii=False)
+
+
+def _reply_tokens(body: dict) -> list:
+    """根据请求内容决定回复：意图分类请求返回JSON，其余返回固定数量的token"""
+    messages = body.get("messages", [])
+    system_text = "".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+    if "意图分类器" in system_text:
+        return [INTENT_REPLY]
+    return ["好"] * FAKE_CONFIG["tokens"]
+
+
+def _chunk(completion_id: str, model: str, content: str = None, finish: str = None) -> str:
+    delta = {"content": content} if content is not None else {}
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake")
+    tokens = _reply_tokens(body)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    STATS["total"] += 1
+    STATS["in_flight"] += 1
+    STATS["peak_in_flight"] = max(STATS["peak_in_flight"], STATS["in_flight"])
+
+    if not body.get("stream"):
+        try:
+            await asyncio.sleep(FAKE_CONFIG["ttft"] + FAKE_CONFIG["interval"] * len(tokens))
+        finally:
+            STATS["in_flight"] -= 1
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": len(tokens), "total_tokens": 10 + len(tokens)},
+        })
+
+    async def event_stream():
+        try:
+            await asyncio.sleep(FAKE_CONFIG["ttft"])
+            for token in tokens:
+                yield _chunk(completion_id, model, token)
+                await asyncio.sleep(FAKE_CONFIG["interval"])
+            yield _chunk(completion_id, model, finish="stop")
+            yield "data: [DONE]\n\n"
+        finally:
+            STATS["in_flight"] -= 1
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def stats():
+    return STATS
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="本地伪 OpenAI 兼容服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--ttft", type=float, default=0.3, help="首token延迟（秒）")
+    parser.add_argument("--tokens", type=int, default=20, help="每次回复的token数")
+    parser.add_argument("--interval", type=float, default=0.02, help="token间隔（秒）")
+    args = parser.parse_args()
+    FAKE_CONFIG.update(ttft=args.ttft, tokens=args.tokens, interval=args.interval)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
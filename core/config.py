@@ -1,6 +1,6 @@
 from functools import lru_cache
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from core.config_model import LLMConfig, MCPConfig, WorkflowConfig
+from core.config_model import LLMConfig, MCPConfig, WorkflowConfig, StreamConfig, CheckpointerConfig, TracingConfig
 from typing import Dict, Any
 import os, yaml
 from pathlib import Path
@@ -18,6 +18,9 @@ class Settings(BaseSettings):
     llm: LLMConfig = LLMConfig()
     mcp: MCPConfig = MCPConfig()
     workflow: WorkflowConfig = WorkflowConfig()
+    stream: StreamConfig = StreamConfig()
+    checkpointer: CheckpointerConfig = CheckpointerConfig()
+    tracing: TracingConfig = TracingConfig()
 
 
 # 配置文件映射：环境名→配置文件路径
@@ -16,8 +16,30 @@ class LLMInferenceConfig(BaseSettings):
     """LLM推理配置"""
     max_tokens: int = 2048
     temperature: float = 0.1
-    timeout: int = 30
-    retry_count: int = 3
+    timeout: int = 30  # 单次HTTP请求超时（秒），传给ChatOpenAI
+    retry_count: int = 3  # 429/超时/连接错误/5xx 的重试次数（由限流器执行，客户端自身不重试）
+
+
+class LLMRateLimitConfig(BaseSettings):
+    """LLM调用限流与自适应并发配置（按托管端点的RPM/TPM配额设置）"""
+    enabled: bool = True
+    requests_per_minute: float = 600  # RPM配额（<=0表示不限）
+    tokens_per_minute: float = 1000000  # TPM配额，按提示词估算+预计输出计数（<=0表示不限）
+    burst_seconds: float = 10  # 令牌桶容量：允许突发的配额时长
+    min_concurrency: int = 1
+    max_concurrency: int = 32
+    initial_concurrency: int = 8  # 启动时的并发上限，之后按429与首token延迟AIMD调整
+    latency_target_seconds: float = 8.0  # 首token延迟超过该值时下调并发上限
+    completion_tokens_estimate: int = 512  # 放行时预扣的输出token数，完成后按实际用量修正
+    queue_timeout_seconds: float = 60  # 排队超过该时长放弃请求
+
+
+class LLMCoalesceConfig(BaseSettings):
+    """LLM请求合并与精确缓存配置"""
+    enabled: bool = True  # 相同请求（消息+参数完全一致）共享一次上游调用
+    cache_max_entries: int = 512  # 确定性回复的LRU缓存条数（0表示只合并不缓存）
+    cache_ttl_seconds: float = 300  # 缓存有效期（秒）
+    deterministic_max_temperature: float = 0.1  # 温度不高于该值的请求视为确定性，回复可缓存
 
 
 class LLMConfig(BaseSettings):
@@ -29,6 +51,8 @@ class LLMConfig(BaseSettings):
 
     local: LLLocalConfig = LLLocalConfig()
     inference: LLMInferenceConfig = LLMInferenceConfig()
+    coalesce: LLMCoalesceConfig = LLMCoalesceConfig()
+    rate_limit: LLMRateLimitConfig = LLMRateLimitConfig()
 
 
 class MCPConnectionPoolConfig(BaseSettings):
@@ -36,6 +60,7 @@ class MCPConnectionPoolConfig(BaseSettings):
     max_connections: int = 50
     max_keepalive_connections: int = 20
     keepalive_expiry: int = 300
+    max_per_host: int = 10  # 单个下游主机的最大并发请求数
 
 
 class MCPConfig(BaseSettings):
@@ -58,14 +83,47 @@ class WorkflowConfig(BaseSettings):
     """工作流配置"""
     max_concurrent: int = 100
     default_timeout: int = 300
+    warmup_on_startup: bool = True  # 服务启动后在后台线程预热重资源（BGE模型、Milvus连接等）
     retry_policy: WorkflowRetryConfig = WorkflowRetryConfig()
 
+
+class StreamConfig(BaseSettings):
+    """流式输出配置"""
+    coalesce_ms: int = 30  # delta 协议：token 合并的时间窗口（毫秒）
+    coalesce_bytes: int = 256  # delta 协议：单帧累计字节数达到该值立即发送
+    max_pending_chunks: int = 1024  # 待发送文本块上限，客户端消费慢时停止从图中拉取（背压）
+    sse_heartbeat_seconds: float = 15  # SSE：无事件时的心跳间隔
+    sse_replay_events: int = 512  # SSE：每个会话保留用于断线续传的事件数
+    sse_max_sessions: int = 1024  # SSE：保留事件日志的会话数上限
+
+
+class CheckpointerConfig(BaseSettings):
+    """会话检查点存储配置"""
+    backend: str = "sqlite"  # sqlite（持久化，多进程共享） / memory（进程内，仅调试）
+    path: str = "data/checkpoints.sqlite"  # 相对项目根目录
+    batch_size: int = 64  # 缓冲的检查点/写入条数达到该值立即落盘
+    flush_interval_ms: int = 50  # 后台落盘间隔（也是崩溃时最多丢失的时间窗口）
+    keep_last: int = 20  # 每个会话保留的最近检查点数（0表示不裁剪）
+    ttl_seconds: int = 604800  # 会话空闲超过该时长后整体删除（0表示不淘汰）
+    evict_interval: int = 600  # 空闲会话淘汰的检查间隔（秒）
+
+
+class TracingConfig(BaseSettings):
+    """链路追踪配置（节点耗时、LLM首token/总耗时与token数、检索与工具耗时）"""
+    enabled: bool = True  # 每轮对话注入追踪回调，指标见 GET /metrics
+    jsonl_path: str = ""  # 每轮对话写一行JSON记录（相对项目根目录，为空不写）
+    jsonl_max_mb: int = 100  # 单个记录文件大小上限，超过后轮转
+    jsonl_backups: int = 5  # 保留的轮转文件数
+
 # 代码说明：
 # 1. 功能定位：基于Pydantic定义系统各模块的配置结构，实现配置的类型校验与默认值管理；
 # 2. 配置分类：
-#    - LLM相关：本地模型、推理参数配置，适配不同部署方式的大模型；
+#    - LLM相关：本地模型、推理参数、请求合并与精确缓存、限流与自适应并发配置，适配不同部署方式的大模型；
 #    - MCP相关：协议与连接池配置，管理外部业务系统的连接；
 #    - Workflow相关：工作流并发、重试配置，保障LangGraph的稳定运行；
+#    - Stream相关：WebSocket/SSE 流式输出的分帧与背压参数；
+#    - Checkpointer相关：会话检查点的存储后端、批量落盘、裁剪与淘汰策略；
+#    - Tracing相关：链路追踪开关与JSON Lines记录文件；
 # 3. 技术特点：
 #    - 使用Field绑定环境变量，支持配置的动态注入；
 #    - 嵌套配置类，实现复杂配置的结构化管理；
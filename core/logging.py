@@ -1,5 +1,9 @@
 import logging
 from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
 
 @lru_cache()
 def get_logger(name: str) -> logging.Logger:
@@ -15,11 +19,26 @@ def get_logger(name: str) -> logging.Logger:
         logger.setLevel(logging.INFO)
     return logger
 
+@lru_cache()
+def get_file_logger(name: str, path: str, max_bytes: int = 100 * 1024 * 1024, backup_count: int = 5) -> logging.Logger:
+    """按大小轮转的文件日志实例（单例），每条记录原样写一行，用于JSON Lines等结构化输出"""
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        file_path = Path(path) if Path(path).is_absolute() else PROJECT_ROOT / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(file_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False  # 结构化记录不混入控制台日志
+    return logger
+
 # 代码说明：
 # 1. 功能定位：创建并缓存日志实例，为系统提供统一的日志输出能力；
 # 2. 核心逻辑：
 #    - 通过lru_cache实现单例，避免重复创建日志处理器；
 #    - 配置控制台输出与日志格式，便于调试与问题排查；
+#    - get_file_logger：按大小轮转的文件输出，只写消息本身（链路追踪的JSON Lines记录）；
 # 3. 技术特点：
 #    - 按需创建日志处理器，减少资源占用；
 #    - 统一日志级别为INFO，平衡日志信息量与性能；
@@ -0,0 +1,302 @@
+"""
+LangGraph 链路追踪 - 每轮对话一个回调处理器，按节点记录耗时与 token，导出 Prometheus 指标与 JSON Lines 记录
+    - 节点：LangGraph 为节点内的所有运行写入 metadata["langgraph_node"]，名称与之相同的最外层链运行即节点本身；
+    - LLM：首 token 延迟（on_llm_new_token 的首次回调）、总耗时、提示词/生成 token 数（usage_metadata 或 token_usage）；
+    - 检索：标准检索器走 on_retriever_*；rag_agent 的混合检索通过 record_retrieval 发出自定义事件；
+    - 工具：on_tool_* 记录每次工具调用耗时；
+    - 指标进程内累计，GET /metrics 按 Prometheus 文本格式输出；配置 jsonl_path 时每轮对话写一行完整记录。
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.callbacks.manager import dispatch_custom_event
+
+from core.config import get_settings
+from core.logging import get_file_logger
+
+RETRIEVAL_EVENT = "retrieval"
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DOCUMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50)
+_INTERRUPTS = ("GraphInterrupt", "NodeInterrupt", "ParentCommand")
+
+
+class _Metric:
+    """单个指标：counter 按标签累加；histogram 按标签记录各桶计数、总和与次数"""
+    def __init__(self, name: str, kind: str, help_text: str, labels: Sequence[str],
+                 buckets: Optional[Sequence[float]] = None):
+        self.name, self.kind, self.help, self.labels, self.buckets = name, kind, help_text, tuple(labels), buckets
+        self.values: Dict[Tuple[str, ...], Any] = {}
+
+    def observe(self, label_values: Tuple[str, ...], value: float):
+        if self.kind == "counter":
+            self.values[label_values] = self.values.get(label_values, 0) + value
+            return
+        counts, total, n = self.values.get(label_values) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+        counts[bisect_left(self.buckets, value)] += 1
+        self.values[label_values] = (counts, total + value, n + 1)
+
+    @staticmethod
+    def _labels(pairs: Sequence[Tuple[str, str]]) -> str:
+        if not pairs:
+            return ""
+        escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in sorted(self.values.items()):
+            pairs = list(zip(self.labels, label_values))
+            if self.kind == "counter":
+                lines.append(f"{self.name}{self._labels(pairs)} {value}")
+                continue
+            counts, total, n = value
+            cumulative = 0
+            for bound, count in zip([*map(str, self.buckets), "+Inf"], counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._labels(pairs + [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(pairs)} {round(total, 6)}")
+            lines.append(f"{self.name}_count{self._labels(pairs)} {n}")
+        return lines
+
+
+class PipelineMetrics:
+    """进程内指标注册表（不依赖 prometheus_client），render() 输出 Prometheus 文本格式"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        for name, kind, help_text, labels, buckets in (
+            ("agent_turn_duration_seconds", "histogram", "每轮对话总耗时", ("status",), LATENCY_BUCKETS),
+            ("agent_node_duration_seconds", "histogram", "图节点耗时", ("node", "status"), LATENCY_BUCKETS),
+            ("agent_llm_ttft_seconds", "histogram", "LLM首token延迟（含排队）", ("node",), LATENCY_BUCKETS),
+            ("agent_llm_duration_seconds", "histogram", "LLM调用总耗时", ("node",), LATENCY_BUCKETS),
+            ("agent_llm_tokens_total", "counter", "LLM token数", ("node", "type"), None),
+            ("agent_retrieval_duration_seconds", "histogram", "检索耗时", ("node", "mode"), LATENCY_BUCKETS),
+            ("agent_retrieval_documents", "histogram", "检索返回的文档块数", ("node", "mode"), DOCUMENT_BUCKETS),
+            ("agent_tool_duration_seconds", "histogram", "工具调用耗时", ("tool", "status"), LATENCY_BUCKETS),
+        ):
+            self._metrics[name] = _Metric(name, kind, help_text, labels, buckets)
+
+    def observe(self, name: str, value: float, **labels: str):
+        metric = self._metrics[name]
+        with self._lock:
+            metric.observe(tuple(str(labels.get(k, "")) for k in metric.labels), value)
+
+    def render(self) -> str:
+        with self._lock:
+            return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+
+@lru_cache()
+def get_pipeline_metrics() -> PipelineMetrics:
+    return PipelineMetrics()
+
+
+def record_retrieval(seconds: float, documents: int, mode: str = "hybrid"):
+    """在节点内报告一次检索（自定义回调事件，由当前运行的 TurnTracer 归属到节点）；不在图调用链内时忽略"""
+    try:
+        dispatch_custom_event(RETRIEVAL_EVENT, {"seconds": seconds, "documents": documents, "mode": mode})
+    except RuntimeError:  # 没有父运行（脚本中直接调用检索）
+        pass
+
+
+def _status(error: BaseException) -> str:
+    return "interrupt" if type(error).__name__ in _INTERRUPTS else "error"
+
+
+def _token_usage(response: Any) -> Tuple[Optional[int], Optional[int]]:
+    """(提示词token, 生成token)：优先取消息的 usage_metadata，其次取 llm_output.token_usage"""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens"), usage.get("output_tokens")
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+
+class TurnTracer(BaseCallbackHandler):
+    """单轮对话的追踪处理器：通过 config["callbacks"] 传入图调用，节点与其中的 LLM/检索/工具调用自动上报"""
+    run_inline = True  # 只做内存记录，异步调用链中直接在事件循环内执行，不切换线程池
+
+    def __init__(self, session_id: str = "", metrics: Optional[PipelineMetrics] = None, sink: Any = None):
+        self.session_id = session_id
+        self.metrics = metrics or get_pipeline_metrics()
+        self.sink = sink  # logging.Logger：每轮写一行 JSON
+        self.started = time.perf_counter()
+        self.root: Optional[UUID] = None
+        self.finished = False
+        self._lock = threading.Lock()
+        self._node_of: Dict[UUID, Optional[str]] = {}
+        self._open: Dict[UUID, Dict[str, Any]] = {}
+        self.spans: List[Dict[str, Any]] = []
+
+    # ---------- 公共 ----------
+    def _begin(self, run_id: UUID, kind: str, node: Optional[str], **fields: Any):
+        with self._lock:
+            self._open[run_id] = {"kind": kind, "node": node or "", "start": time.perf_counter(), **fields}
+
+    def _end(self, run_id: UUID) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            span = self._open.pop(run_id, None)
+            if span is not None:
+                span["seconds"] = time.perf_counter() - span.pop("start")
+                self.spans.append(span)
+        return span
+
+    @staticmethod
+    def _node(metadata: Optional[Dict[str, Any]]) -> Optional[str]:
+        return (metadata or {}).get("langgraph_node")
+
+    # ---------- 节点 ----------
+    def on_chain_start(self, serialized: Optional[Dict[str, Any]], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        node = self._node(metadata)
+        if parent_run_id is None and self.root is None:
+            self.root = run_id
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        # 节点内部的同名子运行（如节点本身的 RunnableLambda）归属同一节点，不重复计时
+        if node and name == node and self._node_of.get(parent_run_id) != node:
+            self._begin(run_id, "node", node)
+        self._node_of[run_id] = node
+
+    def _end_chain(self, run_id: UUID, status: str):
+        span = self._end(run_id)
+        if span is not None and span["kind"] == "node":
+            span["status"] = status
+            self.metrics.observe("agent_node_duration_seconds", span["seconds"], node=span["node"], status=status)
+        if run_id == self.root:
+            self.finish(status)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any):
+        self._end_chain(run_id, "ok")
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end_chain(run_id, _status(error))
+
+    # ---------- LLM ----------
+    def on_chat_model_start(self, serialized: Optional[Dict[str, Any]], messages: Any, *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        self._begin(run_id, "llm", self._node(metadata), ttft=None)
+
+    def on_llm_start(self, serialized: Optional[Dict[str, Any]], prompts: Any, *, run_id: UUID,
+                     metadata: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        self._begin(run_id, "llm", self._node(metadata), ttft=None)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        span = self._open.get(run_id)
+        if span is not None and span["ttft"] is None:
+            span["ttft"] = time.perf_counter() - span["start"]
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+        span = self._end(run_id)
+        if span is None:
+            return
+        node = span["node"]
+        span["prompt_tokens"], span["completion_tokens"] = _token_usage(response)
+        self.metrics.observe("agent_llm_duration_seconds", span["seconds"], node=node)
+        if span["ttft"] is not None:
+            self.metrics.observe("agent_llm_ttft_seconds", span["ttft"], node=node)
+        for kind in ("prompt", "completion"):
+            if span[f"{kind}_tokens"]:
+                self.metrics.observe("agent_llm_tokens_total", span[f"{kind}_tokens"], node=node, type=kind)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        span = self._end(run_id)
+        if span is not None:
+            span["status"] = _status(error)
+
+    # ---------- 检索 ----------
+    def on_retriever_start(self, serialized: Optional[Dict[str, Any]], query: str, *, run_id: UUID,
+                           metadata: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        self._begin(run_id, "retrieval", self._node(metadata), mode="retriever")
+
+    def on_retriever_end(self, documents: Sequence[Any], *, run_id: UUID, **kwargs: Any):
+        span = self._end(run_id)
+        if span is not None:
+            self._observe_retrieval(span, len(documents))
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_custom_event(self, name: str, data: Any, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None,
+                        **kwargs: Any):
+        if name != RETRIEVAL_EVENT:
+            return
+        span = {"kind": "retrieval", "node": self._node(metadata) or "", "mode": data.get("mode", ""),
+                "seconds": data["seconds"]}
+        with self._lock:
+            self.spans.append(span)
+        self._observe_retrieval(span, data["documents"])
+
+    def _observe_retrieval(self, span: Dict[str, Any], documents: int):
+        span["documents"] = documents
+        self.metrics.observe("agent_retrieval_duration_seconds", span["seconds"], node=span["node"], mode=span["mode"])
+        self.metrics.observe("agent_retrieval_documents", documents, node=span["node"], mode=span["mode"])
+
+    # ---------- 工具 ----------
+    def on_tool_start(self, serialized: Optional[Dict[str, Any]], input_str: str, *, run_id: UUID,
+                      metadata: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        tool = kwargs.get("name") or (serialized or {}).get("name") or ""
+        self._begin(run_id, "tool", self._node(metadata), tool=tool)
+
+    def _end_tool(self, run_id: UUID, status: str):
+        span = self._end(run_id)
+        if span is not None:
+            span["status"] = status
+            self.metrics.observe("agent_tool_duration_seconds", span["seconds"], tool=span["tool"], status=status)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._end_tool(run_id, "ok")
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end_tool(run_id, _status(error))
+
+    # ---------- 汇总 ----------
+    def finish(self, status: Optional[str] = None):
+        """结束本轮：记录总耗时并写出 JSON 行；只生效一次，根运行结束前由调用方兜底调用时记为 cancelled"""
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            seconds = time.perf_counter() - self.started
+            status = status or "cancelled"
+            spans = list(self.spans)
+        self.metrics.observe("agent_turn_duration_seconds", seconds, status=status)
+        if self.sink is not None:
+            record = {"ts": round(time.time(), 3), "session_id": self.session_id, "status": status,
+                      "duration_ms": round(seconds * 1000, 1), "spans": [_span_record(s) for s in spans]}
+            self.sink.info(json.dumps(record, ensure_ascii=False))
+
+
+def _span_record(span: Dict[str, Any]) -> Dict[str, Any]:
+    record = {k: v for k, v in span.items() if v is not None and k not in ("seconds", "ttft")}
+    record["ms"] = round(span["seconds"] * 1000, 1)
+    if span.get("ttft") is not None:
+        record["ttft_ms"] = round(span["ttft"] * 1000, 1)
+    return record
+
+
+def new_turn_tracer(session_id: str = "") -> Optional[TurnTracer]:
+    """按配置创建本轮对话的追踪处理器；未启用时返回 None"""
+    cfg = get_settings().tracing
+    if not cfg.enabled:
+        return None
+    sink = get_file_logger("trace", cfg.jsonl_path, cfg.jsonl_max_mb * 1024 * 1024, cfg.jsonl_backups) \
+        if cfg.jsonl_path else None
+    return TurnTracer(session_id, sink=sink)
+
+# 代码说明：
+# 1. 功能定位：回答“一轮对话的时间花在哪里”：意图分类、业务规划、工具执行、RAG检索与生成、闲聊各自的耗时与token；
+# 2. 核心逻辑：
+#    - TurnTracer：标准 LangChain 回调，节点、LLM、检索、工具按 run_id 配对开始/结束事件，归属到 langgraph_node；
+#    - record_retrieval：非 BaseRetriever 的检索（混合检索/BM25）以自定义事件上报，不需要把 config 逐层传入；
+#    - PipelineMetrics：进程内直方图/计数器，GET /metrics 输出 Prometheus 文本格式；
+#    - finish：根运行结束时汇总，配置 tracing.jsonl_path 后按轮写 JSON Lines（按大小轮转）；
+# 3. 注意事项：LLM首token延迟从模型运行开始计时，包含限流排队时间；合并或缓存命中的请求同样按各自的回调计时；
+# 4. 应用场景：app.py 在每次图调用的 config 中注入 TurnTracer，Prometheus 抓取 /metrics 做看板与告警。
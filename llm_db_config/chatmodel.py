@@ -1,5 +1,5 @@
-from langchain_openai import ChatOpenAI
 from core.config import get_settings
+from llm_db_config.coalescing import CoalescingChatOpenAI
 
 # 获取配置实例
 settings = get_settings()
@@ -7,22 +7,28 @@ settings = get_settings()
 # 1. 流式模型（启用thinking，默认）
 # 用途：各种Agent（configure_agent, log_agent, device_agent等）
 # 特点：streaming=True，支持流式输出，显示思考过程
-llm_stream = ChatOpenAI(
+llm_stream = CoalescingChatOpenAI(
     base_url=settings.llm.api_base,
     api_key=settings.llm.api_key,
     model=settings.llm.model,
     temperature=0.1,
-    streaming=True
+    streaming=True,
+    stream_usage=True,  # 流式返回 usage，限流器按实际 token 数修正 TPM 预扣
+    timeout=settings.llm.inference.timeout,
+    max_retries=0  # 重试由限流器执行（retry_count），429 才能驱动并发下调
 )
 
 # 2. 无思考模式模型（禁用thinking）
 # 用途：快速响应的问答/闲聊场景，减少不必要的思考过程
-llm_no_think = ChatOpenAI(
+llm_no_think = CoalescingChatOpenAI(
     base_url=settings.llm.api_base,
     api_key=settings.llm.api_key,
     model=settings.llm.model,
     temperature=0.1,
     streaming=True,
+    stream_usage=True,
+    timeout=settings.llm.inference.timeout,
+    max_retries=0,
     extra_body={"chat_template_kwargs": {"enable_thinking": False}}
 )
 
@@ -34,4 +40,7 @@ llm_no_think = ChatOpenAI(
 # 3. 技术特点：
 #    - 从配置中心读取LLM的API地址、密钥、模型名，实现配置与代码解耦；
 #    - 设置temperature=0.1，降低输出随机性，保证业务回答的稳定性；
+#    - CoalescingChatOpenAI：相同请求在途合并、确定性回复LRU精确缓存（见 coalescing.py）；
+#    - 上游调用经共享限流器排队（RPM/TPM令牌桶 + AIMD并发 + 优先级，见 rate_limit.py），
+#      inference.timeout 作为请求超时，inference.retry_count 作为限流器的重试次数；
 # 4. 应用场景：为整个Agent系统提供大模型推理能力，是LLM落地业务的核心入口。
\ No newline at end of file
@@ -1,9 +1,26 @@
-# 创建内存型检查点存储，用于LangGraph的状态持久化
+# 创建检查点存储，用于LangGraph的状态持久化（由 config 中的 checkpointer.backend 选择实现）
+from core.config import get_settings
 from langgraph.checkpoint.memory import MemorySaver
-checkpointer = MemorySaver()
-# 替换为文件型检查点存储（状态会保存到本地 .langgraph/checkpoints 文件夹）
-# from langgraph.checkpoint.local import LocalFileSaver
-# checkpointer = LocalFileSaver()
+
+def create_checkpointer():
+    cfg = get_settings().checkpointer
+    # 内存型：进程重启丢失会话，且会话绑定单个进程，仅适合本地调试
+    if cfg.backend == "memory":
+        return MemorySaver()
+    # SQLite（WAL）：持久化、批量写入、按会话裁剪、空闲会话淘汰，支持多个worker进程共享
+    if cfg.backend == "sqlite":
+        from llm_db_config.sqlite_saver import SqliteCheckpointSaver
+        return SqliteCheckpointSaver(
+            path=cfg.path,
+            batch_size=cfg.batch_size,
+            flush_interval=cfg.flush_interval_ms / 1000,
+            keep_last=cfg.keep_last,
+            ttl_seconds=cfg.ttl_seconds,
+            evict_interval=cfg.evict_interval,
+        )
+    raise ValueError(f"不支持的检查点存储类型: {cfg.backend}")
+
+checkpointer = create_checkpointer()
 """
 # 生成图
 class ChatState(BaseModel):
@@ -0,0 +1,317 @@
+"""
+LLM 请求合并与去重 - 包装 ChatOpenAI，相同请求共享一次上游调用
+    - 请求键：ChatOpenAI 实际发送的请求体（模型、消息、温度、工具、extra_body 等，去掉 stream 相关字段）
+      按键排序序列化后取 sha256，参数不同的请求不会合并；
+    - 在途合并：同一请求键只发起一次上游流式调用，上游结果按块广播，后到的请求先回放已生成的块，
+      再与首个请求同步接收后续 token（各自触发 on_llm_new_token，WebSocket 流式输出不受影响）；
+    - 精确缓存：温度 ≤ deterministic_max_temperature 的请求完成后写入 LRU 缓存（条数上限 + TTL），
+      命中时直接返回完整回复；
+    - 上游由独立线程/任务拉取，首个请求的客户端断开不影响其他等待者；全部等待者离开时停止拉取并关闭上游流；
+    - token 用量只归属发起上游调用的请求：合并回放与缓存命中的块去掉 usage_metadata，链路追踪不会重复计数。
+"""
+import asyncio
+import hashlib
+import json
+import operator
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, reduce
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+from langchain_core.outputs import ChatGenerationChunk
+
+from core.config import get_settings
+from llm_db_config.rate_limit import RateLimitedChatOpenAI, llm_priority
+
+_STREAM_KEYS = ("stream", "stream_options")
+
+
+class _Broadcast:
+    """一次上游调用的结果广播：按顺序保存全部块，每个订阅者从头读取"""
+    def __init__(self):
+        self.chunks: List[ChatGenerationChunk] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.cancelled = False  # 同步上游线程的停止标记（异步路径直接取消 task）
+        self._cond = threading.Condition()
+        self._async_waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def _wake(self):
+        for loop, event in list(self._async_waiters):
+            loop.call_soon_threadsafe(event.set)
+
+    def publish(self, chunk: ChatGenerationChunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+            self._wake()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+            self._wake()
+
+    def iter_sync(self) -> Iterator[ChatGenerationChunk]:
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                batch, done, error = self.chunks[i:], self.done, self.error
+            i += len(batch)
+            yield from batch
+            if done and i >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+    async def iter_async(self) -> AsyncIterator[ChatGenerationChunk]:
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            self._async_waiters.add(waiter)
+        try:
+            i = 0
+            while True:
+                waiter[1].clear()  # 先清除再读取：读取之后发布的块一定会再次唤醒
+                with self._cond:
+                    batch, done, error = self.chunks[i:], self.done, self.error
+                i += len(batch)
+                for chunk in batch:
+                    yield chunk
+                if done and i >= len(self.chunks):
+                    if error is not None:
+                        raise error
+                    return
+                if not batch:
+                    await waiter[1].wait()
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+
+class LLMResponseCoalescer:
+    """进程内请求合并器：在途请求表 + 确定性回复的 LRU 精确缓存（多个模型实例共享，请求键包含模型参数）"""
+    def __init__(self, enabled: bool = True, cache_max_entries: int = 512, cache_ttl_seconds: float = 300,
+                 deterministic_max_temperature: float = 0.1):
+        self.enabled = enabled
+        self.cache_max_entries = cache_max_entries
+        self.cache_ttl = cache_ttl_seconds
+        self.deterministic_max_temperature = deterministic_max_temperature
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Broadcast] = {}
+        self._cache: "OrderedDict[str, Tuple[float, ChatGenerationChunk]]" = OrderedDict()
+        self.requests = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    @staticmethod
+    def request_key(payload: Dict[str, Any]) -> str:
+        body = {k: v for k, v in payload.items() if k not in _STREAM_KEYS}
+        raw = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def is_deterministic(self, temperature: Optional[float]) -> bool:
+        return self.cache_max_entries > 0 and temperature is not None \
+            and temperature <= self.deterministic_max_temperature
+
+    def cache_get(self, key: str) -> Optional[ChatGenerationChunk]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.cache_ttl:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            self.requests += 1
+            self.cache_hits += 1
+            return entry[1]
+
+    def cache_put(self, key: str, chunks: List[ChatGenerationChunk]):
+        if not chunks:
+            return
+        merged = reduce(operator.add, chunks)
+        with self._lock:
+            self._cache[key] = (time.monotonic(), merged)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+
+    def join(self, key: str) -> Tuple[_Broadcast, bool]:
+        """加入在途请求：返回 (广播, 是否需要发起上游调用)"""
+        with self._lock:
+            self.requests += 1
+            broadcast = self._inflight.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._inflight[key] = _Broadcast()
+                self.upstream_calls += 1
+            else:
+                self.coalesced += 1
+            broadcast.subscribers += 1
+            return broadcast, leader
+
+    def leave(self, key: str, broadcast: _Broadcast):
+        """等待者离开；上游调用已无人等待时从在途表移除并停止（异步取消任务，同步置停止标记）"""
+        with self._lock:
+            broadcast.subscribers -= 1
+            abandon = broadcast.subscribers == 0 and not broadcast.done
+            if abandon and self._inflight.get(key) is broadcast:
+                del self._inflight[key]
+            if abandon and broadcast.task is None:
+                broadcast.cancelled = True
+        if abandon and broadcast.task is not None:
+            broadcast.task.get_loop().call_soon_threadsafe(broadcast.task.cancel)
+
+    def release(self, key: str, broadcast: _Broadcast):
+        with self._lock:
+            if self._inflight.get(key) is broadcast:
+                del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "requests": self.requests,
+                "upstream_calls": self.upstream_calls,
+                "coalesced": self.coalesced,
+                "cache_hits": self.cache_hits,
+                "saved_rate": round((self.coalesced + self.cache_hits) / self.requests, 4) if self.requests else 0.0,
+                "inflight": len(self._inflight),
+                "cache_entries": len(self._cache),
+            }
+
+
+@lru_cache()
+def get_llm_coalescer() -> LLMResponseCoalescer:
+    cfg = get_settings().llm.coalesce
+    return LLMResponseCoalescer(
+        enabled=cfg.enabled,
+        cache_max_entries=cfg.cache_max_entries,
+        cache_ttl_seconds=cfg.cache_ttl_seconds,
+        deterministic_max_temperature=cfg.deterministic_max_temperature,
+    )
+
+
+def _copy(chunk: ChatGenerationChunk, keep_usage: bool = True) -> ChatGenerationChunk:
+    # 每个等待者一份消息副本：LangChain 会为各自的运行写入 message.id
+    # 合并回放/缓存命中去掉 usage_metadata：同一次上游调用的 token 只计一次
+    update = {"usage_metadata": None} if not keep_usage and getattr(chunk.message, "usage_metadata", None) else {}
+    return ChatGenerationChunk(message=chunk.message.model_copy(update=update), generation_info=chunk.generation_info)
+
+
+class CoalescingChatOpenAI(RateLimitedChatOpenAI):
+    """带请求合并与精确缓存的 ChatOpenAI（流式调用路径；invoke 在 streaming=True 时同样经过该路径）
+    合并发生在限流之前：只有真正发往上游的调用排队领取配额，优先级取首个请求的 llm_priority"""
+
+    def _coalesce_key(self, messages: List[Any], stop: Optional[List[str]], kwargs: Dict[str, Any]) -> Tuple[str, bool]:
+        payload = self._get_request_payload(messages, stop=stop, **kwargs)
+        coalescer = get_llm_coalescer()
+        return coalescer.request_key(payload), coalescer.is_deterministic(payload.get("temperature", self.temperature))
+
+    def _pump(self, key: str, broadcast: _Broadcast, deterministic: bool, priority: int, messages, stop, kwargs):
+        coalescer = get_llm_coalescer()
+        stream = self._limited_stream(messages, stop, None, priority, kwargs)
+        try:
+            for chunk in stream:
+                if broadcast.cancelled:
+                    # 全部同步等待者已离开：不再读取，关闭流即断开上游连接，不完整的回复也不写缓存
+                    broadcast.finish(RuntimeError("全部等待者已离开，上游调用已停止"))
+                    return
+                broadcast.publish(chunk)
+        except BaseException as e:
+            broadcast.finish(e)
+        else:
+            if deterministic:
+                coalescer.cache_put(key, broadcast.chunks)
+            broadcast.finish()
+        finally:
+            stream.close()
+            coalescer.release(key, broadcast)
+
+    async def _apump(self, key: str, broadcast: _Broadcast, deterministic: bool, priority: int, messages, stop,
+                     kwargs):
+        coalescer = get_llm_coalescer()
+        try:
+            async for chunk in self._alimited_stream(messages, stop, None, priority, kwargs):
+                broadcast.publish(chunk)
+        except BaseException as e:  # 含取消：无人等待的任务结束即可，不再向外抛出
+            broadcast.finish(e)
+        else:
+            if deterministic:
+                coalescer.cache_put(key, broadcast.chunks)
+            broadcast.finish()
+        finally:
+            coalescer.release(key, broadcast)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        coalescer = get_llm_coalescer()
+        if not coalescer.enabled:
+            yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return
+        key, deterministic = self._coalesce_key(messages, stop, kwargs)
+        cached = coalescer.cache_get(key) if deterministic else None
+        leader = False
+        if cached is not None:
+            chunks = [cached]
+        else:
+            broadcast, leader = coalescer.join(key)
+            if leader:
+                threading.Thread(target=self._pump, name="llm-coalesce", daemon=True,
+                                 args=(key, broadcast, deterministic, llm_priority(run_manager), messages, stop,
+                                       kwargs)).start()
+            chunks = broadcast.iter_sync()
+        try:
+            for chunk in chunks:
+                chunk = _copy(chunk, keep_usage=leader)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            if cached is None:
+                coalescer.leave(key, broadcast)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        coalescer = get_llm_coalescer()
+        if not coalescer.enabled:
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+            return
+        key, deterministic = self._coalesce_key(messages, stop, kwargs)
+        cached = coalescer.cache_get(key) if deterministic else None
+        if cached is not None:
+            chunk = _copy(cached, keep_usage=False)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            return
+        broadcast, leader = coalescer.join(key)
+        if leader:
+            broadcast.task = asyncio.create_task(self._apump(key, broadcast, deterministic, llm_priority(run_manager),
+                                                             messages, stop, kwargs))
+        try:
+            async for chunk in broadcast.iter_async():
+                chunk = _copy(chunk, keep_usage=leader)
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            coalescer.leave(key, broadcast)
+
+# 代码说明：
+# 1. 功能定位：WebSocket 客户端重试、多名运维人员同时提出相同问题时，避免向模型服务重复发起相同的生成请求；
+# 2. 核心逻辑：
+#    - request_key：以 ChatOpenAI 的真实请求体为键，消息、温度、工具绑定、extra_body 任一不同都不会合并；
+#    - _Broadcast：保存上游已生成的块，同步订阅者用条件变量等待，异步订阅者按所在事件循环线程安全唤醒；
+#    - _pump / _apump：上游调用在独立线程/任务中执行，完成后（确定性请求）写入 LRU 缓存再移出在途表；
+#    - leave：全部等待者离开后立即停止上游调用（异步取消任务，同步线程检查停止标记后关闭流），不为已断开的客户端继续消耗 token；
+#    - _copy：只有发起上游调用的请求保留 usage_metadata，合并回放与缓存命中不重复计入 token 统计；
+# 3. 注意事项：合并与缓存只在进程内生效；温度高于阈值的请求只做在途合并，不缓存；
+#    上游调用经 RateLimitedChatOpenAI 限流（rate_limit.py），合并/命中缓存的请求不占用配额；
+# 4. 应用场景：llm_db_config/chatmodel.py 中的 llm_stream / llm_no_think，统计见 /api/stats/llm_coalesce。
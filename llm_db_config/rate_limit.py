@@ -0,0 +1,382 @@
+"""
+LLM 调用限流与自适应并发 - 所有图节点共享一个限流器，上游调用前排队领取配额
+    - 双令牌桶：请求数（RPM）与估算 token 数（TPM）各一个桶，按服务端配额匀速补充，允许短时突发；
+      请求完成后按实际用量（usage）多退少补；
+    - AIMD 自适应并发：首 token 延迟正常时并发上限加性增长，收到 429 时乘性减半并按 Retry-After 暂停放行，
+      首 token 延迟超过目标时小幅下调；
+    - 优先级队列：调用时通过 metadata 的 llm_priority 指定（high/normal/low），意图分类先于闲聊获得配额；
+    - 重试：客户端自身不重试（max_retries=0），429/超时/连接错误/5xx 在尚未产出任何块时由这里退避重试，
+      次数为 llm.inference.retry_count，每次重试重新排队，429 因此能驱动并发下调。
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import openai
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_openai import ChatOpenAI
+
+from core.config import get_settings
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+_CJK = re.compile("[\u3400-\u9fff\uf900-\ufaff]")
+_RETRYABLE = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class TokenBucket:
+    """令牌桶：rate_per_minute 为补充速率，容量为 burst_seconds 内的补充量；<=0 表示不限"""
+    def __init__(self, rate_per_minute: float, burst_seconds: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """距离可以取出 amount 的秒数（超过容量的请求只需等到桶满，取出后余额为负）"""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        need = min(amount, self.capacity)
+        return 0.0 if self.tokens >= need else (need - self.tokens) / self.rate
+
+    def take(self, amount: float, now: float):
+        if not self.unlimited:
+            self._refill(now)
+            self.tokens -= amount
+
+    def adjust(self, delta: float, now: float):
+        """按实际用量退还（delta>0）或补扣（delta<0）"""
+        if not self.unlimited:
+            self._refill(now)
+            self.tokens = min(self.capacity, self.tokens + delta)
+
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "granted", "cancelled", "wake", "enqueued", "started")
+
+    def __init__(self, priority: int, tokens: int, wake):
+        self.priority, self.tokens, self.wake = priority, tokens, wake
+        self.granted = self.cancelled = False
+        self.enqueued = time.monotonic()
+        self.started = 0.0
+
+
+class AdaptiveRateLimiter:
+    """共享限流器：acquire/aacquire 排队领取配额，release 回报结果（首 token 延迟、实际 token 数、异常）"""
+    def __init__(self, enabled: bool = True, requests_per_minute: float = 600, tokens_per_minute: float = 1_000_000,
+                 burst_seconds: float = 10, min_concurrency: int = 1, max_concurrency: int = 32,
+                 initial_concurrency: int = 8, latency_target_seconds: float = 8.0, latency_decrease: float = 0.9,
+                 throttle_decrease: float = 0.5, completion_tokens_estimate: int = 512,
+                 queue_timeout_seconds: float = 60, max_retries: int = 3, backoff_base_seconds: float = 1.0,
+                 backoff_max_seconds: float = 20.0):
+        self.enabled = enabled
+        self.rpm = TokenBucket(requests_per_minute, burst_seconds)
+        self.tpm = TokenBucket(tokens_per_minute, burst_seconds)
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.latency_target = latency_target_seconds
+        self.latency_decrease = latency_decrease
+        self.throttle_decrease = throttle_decrease
+        self.completion_tokens_estimate = completion_tokens_estimate
+        self.queue_timeout = queue_timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base_seconds
+        self.backoff_max = backoff_max_seconds
+        self._lock = threading.Lock()
+        self._queue: List[Any] = []
+        self._seq = itertools.count()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self.inflight = 0
+        self.requests = 0
+        self.granted = 0
+        self.throttled = 0
+        self.retries = 0
+        self.queue_timeouts = 0
+        self.queue_wait_total = 0.0
+
+    # ---------- 估算 ----------
+    def estimate_tokens(self, payload: Dict[str, Any]) -> int:
+        """提示词按字符估算（中文每字一个，其余每4字符一个）+ 预计输出 token 数"""
+        chars = cjk = 0
+        for message in payload.get("messages", []):
+            content = message.get("content")
+            text = content if isinstance(content, str) else str(content or "")
+            chars += len(text)
+            cjk += len(_CJK.findall(text))
+        return cjk + math.ceil((chars - cjk) / 4) + self.completion_tokens_estimate
+
+    # ---------- 排队与放行 ----------
+    @property
+    def concurrency(self) -> int:
+        return int(self.limit)
+
+    def _dispatch(self, now: float) -> Optional[float]:
+        """按优先级放行队首请求（持锁调用）；返回队首仍需等待的秒数，None 表示需等待在途请求结束"""
+        while self._queue:
+            waiter = self._queue[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if self.inflight >= self.concurrency:
+                return None
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            wait = max(self.rpm.wait_time(1, now), self.tpm.wait_time(waiter.tokens, now))
+            if wait > 0:
+                return wait
+            heapq.heappop(self._queue)
+            self.rpm.take(1, now)
+            self.tpm.take(waiter.tokens, now)
+            self.inflight += 1
+            self.granted += 1
+            self.queue_wait_total += now - waiter.enqueued
+            waiter.granted, waiter.started = True, now
+            waiter.wake()
+        return None
+
+    def _enqueue(self, priority: int, tokens: int, wake) -> _Waiter:
+        waiter = _Waiter(priority, tokens, wake)
+        with self._lock:
+            self.requests += 1
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        return waiter
+
+    def _poll(self, waiter: _Waiter, deadline: float) -> Optional[float]:
+        """放行一轮；返回本轮应等待的秒数，已放行返回 None；排队超时抛出 TimeoutError"""
+        now = time.monotonic()
+        with self._lock:
+            delay = self._dispatch(now)
+            if waiter.granted:
+                return None
+            if now >= deadline:
+                waiter.cancelled = True
+                self.queue_timeouts += 1
+                raise TimeoutError(f"LLM 请求排队超过 {self.queue_timeout}s（并发上限 {self.concurrency}）")
+        return min(delay if delay is not None else deadline - now, deadline - now)
+
+    def _abandon(self, waiter: _Waiter):
+        """排队中被取消（客户端断开）：未放行则出队，已放行则归还并发名额"""
+        with self._lock:
+            if not waiter.granted:
+                waiter.cancelled = True
+                return
+        self.release(waiter)
+
+    def acquire(self, priority: int, tokens: int) -> _Waiter:
+        event = threading.Event()
+        waiter = self._enqueue(priority, tokens, event.set)
+        deadline = waiter.enqueued + self.queue_timeout
+        try:
+            while (delay := self._poll(waiter, deadline)) is not None:
+                event.wait(delay)
+                event.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        return waiter
+
+    async def aacquire(self, priority: int, tokens: int) -> _Waiter:
+        loop, event = asyncio.get_running_loop(), asyncio.Event()
+        waiter = self._enqueue(priority, tokens, lambda: loop.call_soon_threadsafe(event.set))
+        deadline = waiter.enqueued + self.queue_timeout
+        try:
+            while (delay := self._poll(waiter, deadline)) is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        return waiter
+
+    # ---------- 结果反馈（AIMD） ----------
+    def _decrease(self, factor: float, now: float):
+        # 同一批在途请求几乎同时失败，一个延迟窗口内只下调一次，避免并发上限直接跌到底
+        if now - self._last_decrease >= min(self.latency_target, 1.0):
+            self.limit = max(self.min_concurrency, self.limit * factor)
+            self._last_decrease = now
+
+    def release(self, waiter: _Waiter, ttft: Optional[float] = None, used_tokens: Optional[int] = None,
+                error: Optional[BaseException] = None):
+        now = time.monotonic()
+        with self._lock:
+            self.inflight -= 1
+            if used_tokens is not None:
+                self.tpm.adjust(waiter.tokens - used_tokens, now)
+            if isinstance(error, openai.RateLimitError):
+                self.throttled += 1
+                self._decrease(self.throttle_decrease, now)
+                self._blocked_until = max(self._blocked_until, now + self.retry_after(error, 1))
+            elif error is None and ttft is not None:
+                if ttft > self.latency_target:
+                    self._decrease(self.latency_decrease, now)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            self._dispatch(now)
+
+    # ---------- 重试 ----------
+    def retryable(self, error: BaseException) -> bool:
+        return isinstance(error, _RETRYABLE)
+
+    def retry_after(self, error: BaseException, attempt: int) -> float:
+        """优先使用服务端 Retry-After，否则指数退避（带抖动）"""
+        response = getattr(error, "response", None)
+        header = response.headers.get("retry-after") if response is not None else None
+        try:
+            if header is not None:
+                return min(self.backoff_max, float(header))
+        except ValueError:
+            pass
+        return min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            self.rpm._refill(now)
+            self.tpm._refill(now)
+            return {
+                "enabled": self.enabled,
+                "concurrency_limit": round(self.limit, 2),
+                "inflight": self.inflight,
+                "queued": sum(1 for *_, w in self._queue if not w.cancelled),
+                "requests": self.requests,
+                "throttled_429": self.throttled,
+                "retries": self.retries,
+                "queue_timeouts": self.queue_timeouts,
+                "avg_queue_wait_ms": round(self.queue_wait_total / self.granted * 1000, 1) if self.granted else 0.0,
+                "rpm_available": None if self.rpm.unlimited else round(self.rpm.tokens, 1),
+                "tpm_available": None if self.tpm.unlimited else round(self.tpm.tokens),
+                "blocked_seconds": round(max(0.0, self._blocked_until - now), 2),
+            }
+
+
+@lru_cache()
+def get_llm_rate_limiter() -> AdaptiveRateLimiter:
+    settings = get_settings()
+    cfg = settings.llm.rate_limit
+    return AdaptiveRateLimiter(
+        enabled=cfg.enabled,
+        requests_per_minute=cfg.requests_per_minute,
+        tokens_per_minute=cfg.tokens_per_minute,
+        burst_seconds=cfg.burst_seconds,
+        min_concurrency=cfg.min_concurrency,
+        max_concurrency=cfg.max_concurrency,
+        initial_concurrency=cfg.initial_concurrency,
+        latency_target_seconds=cfg.latency_target_seconds,
+        completion_tokens_estimate=cfg.completion_tokens_estimate,
+        queue_timeout_seconds=cfg.queue_timeout_seconds,
+        max_retries=settings.llm.inference.retry_count,
+    )
+
+
+def llm_priority(run_manager: Any) -> int:
+    """从调用的 metadata 读取 llm_priority（high/normal/low 或整数，越小越优先）"""
+    value = (getattr(run_manager, "metadata", None) or {}).get("llm_priority", "normal")
+    return value if isinstance(value, int) else PRIORITIES.get(str(value), PRIORITIES["normal"])
+
+
+def _used_tokens(chunk: ChatGenerationChunk) -> Optional[int]:
+    usage = getattr(chunk.message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class RateLimitedChatOpenAI(ChatOpenAI):
+    """上游调用经过共享限流器的 ChatOpenAI（流式路径；invoke 在 streaming=True 时同样经过该路径）"""
+
+    def _limited_stream(self, messages, stop, run_manager, priority: int,
+                        kwargs: Dict[str, Any]) -> Iterator[ChatGenerationChunk]:
+        limiter = get_llm_rate_limiter()
+        if not limiter.enabled:
+            yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return
+        tokens = limiter.estimate_tokens(self._get_request_payload(messages, stop=stop, **kwargs))
+        attempt = 0
+        while True:
+            waiter = limiter.acquire(priority, tokens)
+            ttft = used = error = None
+            try:
+                for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    if ttft is None:
+                        ttft = time.monotonic() - waiter.started
+                    used = _used_tokens(chunk) or used
+                    yield chunk
+            except BaseException as e:
+                error = e
+                if ttft is not None or attempt >= limiter.max_retries or not limiter.retryable(e):
+                    raise
+            finally:
+                limiter.release(waiter, ttft, used, error)
+            if error is None:
+                return
+            attempt += 1
+            limiter.retries += 1
+            print(f"⚠️  LLM 调用失败（{type(error).__name__}），第{attempt}次重试")
+            time.sleep(limiter.retry_after(error, attempt))
+
+    async def _alimited_stream(self, messages, stop, run_manager, priority: int,
+                               kwargs: Dict[str, Any]) -> AsyncIterator[ChatGenerationChunk]:
+        limiter = get_llm_rate_limiter()
+        if not limiter.enabled:
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+            return
+        tokens = limiter.estimate_tokens(self._get_request_payload(messages, stop=stop, **kwargs))
+        attempt = 0
+        while True:
+            waiter = await limiter.aacquire(priority, tokens)
+            ttft = used = error = None
+            try:
+                async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    if ttft is None:
+                        ttft = time.monotonic() - waiter.started
+                    used = _used_tokens(chunk) or used
+                    yield chunk
+            except BaseException as e:
+                error = e
+                if ttft is not None or attempt >= limiter.max_retries or not limiter.retryable(e):
+                    raise
+            finally:
+                limiter.release(waiter, ttft, used, error)
+            if error is None:
+                return
+            attempt += 1
+            limiter.retries += 1
+            print(f"⚠️  LLM 调用失败（{type(error).__name__}），第{attempt}次重试")
+            await asyncio.sleep(limiter.retry_after(error, attempt))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        yield from self._limited_stream(messages, stop, run_manager, llm_priority(run_manager), kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self._alimited_stream(messages, stop, run_manager, llm_priority(run_manager), kwargs):
+            yield chunk
+
+# 代码说明：
+# 1. 功能定位：方舟托管端点有 RPM/TPM 配额，突发请求直接 429 会以“流式执行错误”暴露给用户；改为进程内排队限流；
+# 2. 核心逻辑：
+#    - TokenBucket：请求数与 token 数两个桶，放行时按估算值扣减，完成后按 usage 实际值修正；
+#    - AdaptiveRateLimiter：优先级堆 + 并发上限，_dispatch 在入队、轮询与请求结束时放行队首；
+#      release 根据 429 与首 token 延迟做 AIMD 调整，429 时按 Retry-After 暂停放行；
+#    - RateLimitedChatOpenAI：上游流式调用前排队，未产出块前的可重试错误退避后重新排队；
+# 3. 注意事项：严格按优先级放行，队首等待配额时低优先级请求不会插队；限流只在单进程内生效，多进程部署需按进程数折算配额；
+# 4. 应用场景：llm_db_config/chatmodel.py 的模型实例（经 CoalescingChatOpenAI 合并后只有真正的上游调用计入配额），
+#    统计见 /api/stats/llm_rate_limit。
@@ -0,0 +1,421 @@
+"""
+SQLite 检查点存储 - 替代进程内 MemorySaver
+    - WAL 模式 + busy_timeout：多个 uvicorn worker 进程共享同一个数据库文件，会话不再绑定单个进程；
+    - 批量写入：put / put_writes 先进入内存缓冲，达到 batch_size、超过 flush_interval 或发生读取时合并为一个事务落盘；
+    - 按会话裁剪：每个 thread_id 只保留最近 keep_last 个检查点（及其 pending writes）；
+    - 空闲淘汰：超过 ttl_seconds 未更新的会话由后台线程定期整体删除。
+表结构与 langgraph-checkpoint-sqlite 基本一致，另加 threads 表记录会话最后活跃时间。
+"""
+import atexit
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import run_in_executor
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+
+try:  # 新版本 langgraph：特殊通道（错误/中断等）的写入使用固定负数下标，需覆盖旧值
+    from langgraph.checkpoint.base import WRITES_IDX_MAP
+except ImportError:
+    WRITES_IDX_MAP: Dict[str, int] = {}
+
+try:  # 新版本 langgraph：把 config 中的元数据合并进检查点元数据
+    from langgraph.checkpoint.base import get_checkpoint_metadata
+except ImportError:
+    def get_checkpoint_metadata(config: RunnableConfig, metadata: CheckpointMetadata) -> CheckpointMetadata:
+        return metadata
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_threads_updated_at ON threads (updated_at);
+"""
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    """SQLite（WAL）检查点存储：批量写入、按会话裁剪、空闲会话TTL淘汰，多进程安全"""
+    def __init__(self, path: str, batch_size: int = 64, flush_interval: float = 0.05, keep_last: int = 20,
+                 ttl_seconds: float = 7 * 24 * 3600, evict_interval: float = 600, busy_timeout_ms: int = 5000,
+                 serde: Any = None):
+        super().__init__(serde=serde)
+        db_path = Path(path)
+        if not db_path.is_absolute():
+            db_path = PROJECT_ROOT / db_path
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(db_path)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.keep_last = keep_last
+        self.ttl_seconds = ttl_seconds
+        self.evict_interval = evict_interval
+        self.busy_timeout_ms = busy_timeout_ms
+
+        # 写连接由本进程所有线程共享（持锁使用）；读连接每线程一个，WAL 下读写互不阻塞
+        self._write_conn = self._connect()
+        self._write_conn.executescript(SCHEMA)
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+
+        # 写缓冲：检查点行按主键去重，writes 行按主键去重（特殊通道覆盖）
+        self._buffer_lock = threading.Lock()
+        self._pending_checkpoints: Dict[Tuple[str, str, str], tuple] = {}
+        self._pending_writes: Dict[Tuple[str, str, str, str, int], Tuple[tuple, bool]] = {}
+        self._touched_threads: Dict[Tuple[str, str], float] = {}
+
+        self._closed = threading.Event()
+        self._last_evict = time.time()
+        self._flusher = threading.Thread(target=self._background_loop, name="checkpoint-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # ---------- 连接 ----------
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                               timeout=self.busy_timeout_ms / 1000)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    def _read_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    # ---------- 缓冲与落盘 ----------
+    def _buffered(self) -> int:
+        return len(self._pending_checkpoints) + len(self._pending_writes)
+
+    def flush(self):
+        """把缓冲区的检查点与写入合并为一个事务落盘，并裁剪涉及会话的旧检查点"""
+        # 先取写锁再取出缓冲：并发的读取方在此等待正在进行的提交完成，不会读到旧状态
+        with self._write_lock:
+            with self._buffer_lock:
+                if not self._buffered():
+                    return
+                checkpoints = list(self._pending_checkpoints.values())
+                writes = list(self._pending_writes.values())
+                touched = dict(self._touched_threads)
+                self._pending_checkpoints.clear()
+                self._pending_writes.clear()
+                self._touched_threads.clear()
+            conn = self._write_conn
+            try:
+                # BEGIN 也在 try 内：其他进程持有写锁超过 busy_timeout（database is locked）时同样放回缓冲区
+                conn.execute("BEGIN IMMEDIATE")
+                if checkpoints:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, "
+                        "parent_checkpoint_id, type, checkpoint, metadata_type, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        checkpoints,
+                    )
+                replace_rows = [row for row, replace in writes if replace]
+                ignore_rows = [row for row, replace in writes if not replace]
+                sql = ("INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, "
+                       "task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+                if replace_rows:
+                    conn.executemany("INSERT OR REPLACE " + sql, replace_rows)
+                if ignore_rows:
+                    conn.executemany("INSERT OR IGNORE " + sql, ignore_rows)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO threads (thread_id, updated_at) VALUES (?, ?)",
+                    list({thread_id: ts for (thread_id, _), ts in touched.items()}.items()),
+                )
+                if self.keep_last > 0:
+                    for thread_id, checkpoint_ns in touched:
+                        self._prune(conn, thread_id, checkpoint_ns)
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                # 提交失败（如其他进程长时间持有写锁）时放回缓冲区，下次落盘重试；期间的新写入优先
+                with self._buffer_lock:
+                    for row in checkpoints:
+                        self._pending_checkpoints.setdefault(row[:3], row)
+                    for row, replace in writes:
+                        self._pending_writes.setdefault(row[:5], (row, replace))
+                    for key, ts in touched.items():
+                        self._touched_threads.setdefault(key, ts)
+                raise
+
+    def _try_flush(self) -> bool:
+        """写入/读取路径上的落盘：数据库被其他进程锁住时只记录日志，行留在缓冲区由后台线程重试"""
+        try:
+            self.flush()
+            return True
+        except sqlite3.Error as e:
+            print(f"⚠️ 检查点落盘失败，已保留在缓冲区稍后重试：{e}")
+            return False
+
+    def _prune(self, conn: sqlite3.Connection, thread_id: str, checkpoint_ns: str):
+        row = conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep_last - 1),
+        ).fetchone()
+        if row is None:
+            return
+        # 检查点ID单调递增：早于第 keep_last 新的检查点全部删除
+        for table in ("checkpoints", "writes"):
+            conn.execute(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, row[0]),
+            )
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """删除超过 ttl_seconds 未活跃的会话，返回删除的会话数"""
+        if self.ttl_seconds <= 0:
+            return 0
+        cutoff = (now or time.time()) - self.ttl_seconds
+        with self._write_lock:
+            conn = self._write_conn
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                expired = [r[0] for r in conn.execute("SELECT thread_id FROM threads WHERE updated_at < ?", (cutoff,))]
+                for start in range(0, len(expired), 500):
+                    batch = expired[start:start + 500]
+                    marks = ",".join("?" * len(batch))
+                    for table in ("checkpoints", "writes", "threads"):
+                        conn.execute(f"DELETE FROM {table} WHERE thread_id IN ({marks})", batch)
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        return len(expired)
+
+    def _background_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.time() - self._last_evict >= self.evict_interval:
+                    self._last_evict = time.time()
+                    evicted = self.evict_idle()
+                    if evicted:
+                        print(f"🧹 已淘汰{evicted}个空闲会话的检查点")
+            except sqlite3.Error as e:
+                print(f"⚠️ 检查点落盘失败，稍后重试：{e}")
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self.flush()
+
+    # ---------- 版本号（与 MemorySaver 一致的字符串版本，保证单调且可比较） ----------
+    def get_next_version(self, current: Optional[str], channel: Any) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ---------- 写入 ----------
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        type_, data = self.serde.dumps_typed(checkpoint)
+        meta_type, meta_data = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        row = (thread_id, checkpoint_ns, checkpoint["id"], configurable.get("checkpoint_id"),
+               type_, data, meta_type, meta_data)
+        with self._buffer_lock:
+            self._pending_checkpoints[(thread_id, checkpoint_ns, checkpoint["id"])] = row
+            self._touched_threads[(thread_id, checkpoint_ns)] = time.time()
+            full = self._buffered() >= self.batch_size
+        if full:
+            self._try_flush()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        checkpoint_id = configurable["checkpoint_id"]
+        with self._buffer_lock:
+            for idx, (channel, value) in enumerate(writes):
+                write_idx = WRITES_IDX_MAP.get(channel, idx)
+                type_, data = self.serde.dumps_typed(value)
+                key = (thread_id, checkpoint_ns, checkpoint_id, task_id, write_idx)
+                replace = channel in WRITES_IDX_MAP
+                if replace or key not in self._pending_writes:
+                    row = (thread_id, checkpoint_ns, checkpoint_id, task_id, write_idx, channel, type_, data, task_path)
+                    self._pending_writes[key] = (row, replace)
+            self._touched_threads[(thread_id, checkpoint_ns)] = time.time()
+            full = self._buffered() >= self.batch_size
+        if full:
+            self._try_flush()
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.flush()
+        with self._write_lock:
+            for table in ("checkpoints", "writes", "threads"):
+                self._write_conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    # ---------- 读取 ----------
+    def _to_tuple(self, conn: sqlite3.Connection, row: tuple) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, data, meta_type, meta_data = row
+        rows = conn.execute(
+            "SELECT task_id, idx, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? "
+            "AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        merged = {(task_id, idx): (channel, t, v) for task_id, idx, channel, t, v in rows}
+        # 落盘失败时 pending writes 仍在缓冲区，与已落盘的行合并（规则同 flush：特殊通道覆盖，其余保留先写入的）
+        with self._buffer_lock:
+            for (w_thread, w_ns, w_checkpoint, task_id, idx), (w_row, replace) in self._pending_writes.items():
+                if (w_thread, w_ns, w_checkpoint) == (thread_id, checkpoint_ns, checkpoint_id) and \
+                        (replace or (task_id, idx) not in merged):
+                    merged[(task_id, idx)] = w_row[5:8]
+        writes = [(task_id, *merged[(task_id, idx)]) for task_id, idx in sorted(merged)]
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((type_, data)),
+            metadata=self.serde.loads_typed((meta_type, meta_data)),
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                            "checkpoint_id": parent_id}} if parent_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def _buffered_checkpoint(self, thread_id: str, checkpoint_ns: str, checkpoint_id: Optional[str]) -> Optional[tuple]:
+        """缓冲区中尚未落盘的检查点行（指定 checkpoint_id 时精确匹配，否则取最新）"""
+        with self._buffer_lock:
+            if checkpoint_id:
+                return self._pending_checkpoints.get((thread_id, checkpoint_ns, checkpoint_id))
+            rows = [row for key, row in self._pending_checkpoints.items() if key[:2] == (thread_id, checkpoint_ns)]
+        return max(rows, key=lambda row: row[2]) if rows else None
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        # 读前落盘缓冲区，保证读到自己（以及本进程其他会话）刚写入的检查点；落盘失败时从缓冲区补读
+        self._try_flush()
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        conn = self._read_conn()
+        columns = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                   "metadata_type, metadata FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?")
+        if checkpoint_id:
+            row = conn.execute(columns + " AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+        else:
+            row = conn.execute(columns + " ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)).fetchone()
+        buffered = self._buffered_checkpoint(thread_id, checkpoint_ns, checkpoint_id)
+        if buffered is not None and (row is None or buffered[2] >= row[2]):
+            row = buffered
+        return self._to_tuple(conn, row) if row else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        self.flush()
+        sql = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+               "metadata_type, metadata FROM checkpoints")
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            checkpoint_id = get_checkpoint_id(config)
+            if checkpoint_id:
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and get_checkpoint_id(before):
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY checkpoint_id DESC"
+        conn = self._read_conn()
+        remaining = limit
+        for row in conn.execute(sql, params).fetchall():
+            item = self._to_tuple(conn, row)
+            # 元数据已序列化存储，过滤条件在内存中比较（与 MemorySaver 一致）
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            yield item
+            if remaining is not None:
+                remaining -= 1
+                if remaining <= 0:
+                    break
+
+    # ---------- 异步接口：SQLite 调用放到线程池执行 ----------
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await run_in_executor(None, self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        items: List[CheckpointTuple] = await run_in_executor(
+            None, lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        # 缓冲达到 batch_size 时 put 会同步落盘，统一放到线程池执行，避免阻塞事件循环
+        return await run_in_executor(None, self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await run_in_executor(None, self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await run_in_executor(None, self.delete_thread, thread_id)
+
+# 代码说明：
+# 1. 功能定位：持久化 LangGraph 会话状态，服务重启不丢会话，多个 worker 进程可共享同一数据库；
+# 2. 核心逻辑：
+#    - 写入：put/put_writes 只序列化并放入缓冲区，后台线程每 flush_interval 秒（或缓冲达到 batch_size）一次性提交；
+#    - 读取：get_tuple/list 先落盘缓冲再查询，保证同进程读到最新状态；get_tuple 落盘失败时合并缓冲区中的行；
+#    - 容错：put/put_writes/get_tuple 触发的落盘遇到数据库被锁只记录日志，行留在缓冲区由后台线程重试，不让本轮图执行失败；
+#    - 裁剪：提交时对涉及的会话只保留最近 keep_last 个检查点；
+#    - 淘汰：后台线程每 evict_interval 秒删除 threads.updated_at 超过 ttl_seconds 的会话；
+# 3. 技术特点：WAL 模式下读不阻塞写；写事务使用 BEGIN IMMEDIATE 并配合 busy_timeout，多进程写入互斥重试；
+# 4. 注意事项：进程崩溃最多丢失最近 flush_interval 内的检查点；其他进程最多延迟 flush_interval 看到新状态。
@@ -11,16 +11,15 @@
 - create_react_agent：创建 React Agent（自动工具调用）
 - bind_tools：将工具绑定到 LLM
 - InjectedState：从 LangGraph 状态中注入消息
-- trim_messages：清理上下文消息
+- build_context：基于增量上下文窗口清理上下文消息
 """
-from langchain_core.messages import trim_messages
-from langchain_core.messages.utils import count_tokens_approximately
 from typing_extensions import Annotated
 from langgraph.prebuilt import create_react_agent, InjectedState
 from langchain.tools import tool
 from llm_db_config.chatmodel import llm_no_think
 from src.tools.query_tools import query_tool
 from src.prompts.agent_prompts import query_prompt
+from src.utils.context_window import build_context
 
 # ========== 步骤1：创建 React Agent ==========
 # React Agent 会自动：
@@ -57,19 +56,8 @@ def tool_agent_tool(state: Annotated[dict, InjectedState], dummy: str = '') -> s
         → 调用 simple_query_tool
         → 返回查询结果
     """
-    # 从状态中获取消息历史
-    messages = state.get("messages", [])
-
-    # 清理上下文消息（避免 token 超限）
-    cleaned_messages = trim_messages(
-        messages[-9:],
-        strategy="last",
-        token_counter=count_tokens_approximately,
-        max_tokens=16384,
-        start_on="human",
-        end_on=("human", "tool"),
-        include_system=True
-    )
+    # 清理上下文消息（避免 token 超限）：复用状态中的增量上下文窗口，保留最近9条
+    cleaned_messages, _ = build_context(state, last_n=9)
 
     # 调用 React Agent 处理消息
     result = tool_assistant.invoke({"messages": cleaned_messages})
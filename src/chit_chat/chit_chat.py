@@ -3,11 +3,12 @@
 核心功能：意图识别 + LLM调用
 """
 from typing import List, Optional
-from langchain_core.messages import AIMessage, HumanMessage, BaseMessage
+from langchain_core.messages import AIMessage, HumanMessage, BaseMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
 from llm_db_config.chatmodel import llm_no_think
 from src.prompts.agent_prompts import chit_chat_prompt
-from src.utils import trim_msg, get_last_user_input
+from src.utils import get_last_user_input, build_context
 
 def create_chit_chat_node(llm):
     """
@@ -15,34 +16,59 @@ def create_chit_chat_node(llm):
     Args:
         llm: 语言模型实例
     Returns:
-        节点函数 (state, config) -> partial_state
+        节点 Runnable，同时支持 invoke(state, config) 与 ainvoke(state, config)
     """
-    def chit_chat_node(state, config):
-        """闲聊节点：处理非业务对话"""
+    # 提示词与调用链只在创建节点时构建一次；系统提示词为静态消息（不做模板解析），
+    # 每次请求的前缀完全一致，服务端前缀/KV缓存可以命中
+    prompt_template = ChatPromptTemplate.from_messages([
+        SystemMessage(content=chit_chat_prompt),
+        ("placeholder", "{messages}")# 可以注入 多轮对话历史（比如包含多个人类消息、助手消息的列表），无需手动拼接每一轮的角色
+    ])
+    # 闲聊优先级最低：LLM限流排队时让位于意图分类与业务问答
+    chain = prompt_template | llm.with_config(metadata={"llm_priority": "low"})
+
+    def prepare(state):
+        """提取用户输入并清理上下文，返回(消息列表, 上下文窗口)；无输入时返回None"""
         # 1. 提取用户输入
         user_input = get_last_user_input(state.get("messages", []))
         if not user_input:
+            return None
+        # 2. 清理上下文（增量上下文窗口，保留最近10条消息）
+        return build_context(state, last_n=10)
+
+    def postprocess(result, window):
+        result_content = result.content if hasattr(result, 'content') else str(result)
+        # 字数限制：超过100字截断
+        if len(result_content) > 100:
+            result_content = result_content[:100] + "..."
+        # 窗口写回状态，下一轮只需对新增消息计数
+        return {"messages": [AIMessage(content=result_content)], "context_window": window}
+
+    def chit_chat_node(state, config):
+        """闲聊节点：处理非业务对话"""
+        prepared = prepare(state)
+        if prepared is None:
             return {"messages": [AIMessage(content="抱歉，我无法理解您的问题。")]}
-        # 2. 清理上下文（保留最近10条消息）
-        trimmed_state = trim_msg(state)
-        cleaned_messages = trimmed_state['messages'][-10:]
-        # 4. 构建提示词并调用LLM
-        prompt_template = ChatPromptTemplate.from_messages([
-            ("system", chit_chat_prompt),
-            ("placeholder", "{messages}")# 可以注入 多轮对话历史（比如包含多个人类消息、助手消息的列表），无需手动拼接每一轮的角色
-        ])
-        chain = prompt_template | llm
+        cleaned_messages, window = prepared
         try:
             result = chain.invoke({"messages": cleaned_messages}, config=config)
-            result_content = result.content if hasattr(result, 'content') else str(result)
-            # 字数限制：超过100字截断
-            if len(result_content) > 100:
-                result_content = result_content[:100] + "..."
-            return {"messages": [AIMessage(content=result_content)]}
+            return postprocess(result, window)
+        except Exception as e:
+            return {"messages": [AIMessage(content="抱歉，我无法回答这个问题。")]}
+
+    async def achit_chat_node(state, config):
+        """闲聊节点（异步）：graph.astream 下通过 ainvoke 调用LLM"""
+        prepared = prepare(state)
+        if prepared is None:
+            return {"messages": [AIMessage(content="抱歉，我无法理解您的问题。")]}
+        cleaned_messages, window = prepared
+        try:
+            result = await chain.ainvoke({"messages": cleaned_messages}, config=config)
+            return postprocess(result, window)
         except Exception as e:
             return {"messages": [AIMessage(content="抱歉，我无法回答这个问题。")]}
 
-    return chit_chat_node
+    return RunnableLambda(chit_chat_node, afunc=achit_chat_node, name="chit_chat")
 
 def test_chat_node():
     prompt_template = ChatPromptTemplate.from_messages([
@@ -99,8 +125,10 @@ if __name__ == "__main__":
 #    - is_business_intent：通过关键词匹配检测用户输入是否包含业务意图（设备/运维相关），避免闲聊模块处理业务问题；
 #    - create_chit_chat_node：工厂函数，生成可嵌入LangGraph的闲聊节点，核心逻辑包含用户输入提取、业务意图检测、上下文清理、LLM调用与结果处理；
 #    - chit_chat_node：实际的闲聊节点函数，实现“输入校验→意图检测→上下文裁剪→LLM响应→异常处理”的完整流程；
+#    - achit_chat_node：闲聊节点的异步版本，供graph.astream使用，LLM调用走ainvoke不阻塞事件循环；
 # 3. 技术特点：
-#    - 上下文裁剪：仅保留最近10条消息，减少LLM输入token消耗，提升响应效率；
+#    - 上下文裁剪：基于增量上下文窗口仅保留最近10条消息，窗口随状态保存，每轮只对新增消息计数；
+#    - 预编译：提示词与调用链在工厂函数中构建一次，系统提示词作为静态前缀，利于服务端前缀缓存；
 #    - 结果截断：对LLM回复做100字长度限制，适配端侧展示场景；
 #    - 异常兜底：通过try-except捕获LLM调用异常，返回友好提示；
 # 4. 应用场景：作为LangGraph工作流的分支节点，承接用户的闲聊类请求（如日常对话、非业务咨询），提升Agent的交互体验，是智能客服类场景的重要组成部分。
\ No newline at end of file
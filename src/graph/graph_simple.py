@@ -5,20 +5,27 @@ LangGraph 图构建 - 简化版
 1. RAG Agent (src/rag/)：基于向量检索的知识问答
 2. 工具链 Agent (src/agent/)：基于工具调用的操作执行
 """
+import time
+from functools import lru_cache
 from typing import Dict
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import AIMessage
 from langgraph.prebuilt import ToolNode
+from langchain_core.runnables import RunnableLambda
 from src.intent_demo.intent_schemas import State
 from src.intent_demo.intent_map import INTENT_STR_KEY
 from src.intent_demo.intent_cls import intent_cls_factory
-from src.intent_demo.planner import planner_node
+from src.intent_demo.fast_intent import TieredIntentClassifier, build_tiered_intent_classifier
+from src.intent_demo.planner import planner_node, aplanner_node
+from src.intent_demo.plan_executor import create_plan_executor_node
 from llm_db_config.chatmodel import llm_no_think
 from llm_db_config.checkpointer import checkpointer
 from src.agent.tool_agent import tool_agent_tool  # 工具链Agent
-from src.rag.rag_agent import create_simple_rag_node  # RAG Agent
+from src.rag.rag_agent import create_simple_rag_node, get_embeddings, LazySimplePDFRAGAgent, config as rag_config  # RAG Agent
+from src.rag.semantic_cache import SemanticAnswerCache
 from src.chit_chat.chit_chat import create_chit_chat_node
 from src.tools.query_tools import QUERY_TOOLS
+from src.utils.context_window import build_context
 
 def tool_react_agent_node(state: State, config):
     """
@@ -36,8 +43,15 @@ def tool_react_agent_node(state: State, config):
         → Agent 调用 simple_query_tool
         → 返回查询结果
     """
-    result = tool_agent_tool.invoke(state, config)
-    return {"messages": [AIMessage(content=result)]}
+    _, window = build_context(state)
+    result = tool_agent_tool.invoke({**state, "context_window": window}, config)
+    return {"messages": [AIMessage(content=result)], "context_window": window}
+
+async def atool_react_agent_node(state: State, config):
+    """工具链 Agent 节点（异步版本，供 graph.astream 使用）"""
+    _, window = build_context(state)
+    result = await tool_agent_tool.ainvoke({**state, "context_window": window}, config)
+    return {"messages": [AIMessage(content=result)], "context_window": window}
 
 def rag_agent_node(state: State, config):
     """
@@ -60,8 +74,9 @@ def rag_agent_node(state: State, config):
 
 def tool_Structured_Agent_node(builder):
     # 注册Planner相关节点
-    builder.add_node("business", planner_node)
-    builder.add_node("tools", ToolNode(tools=QUERY_TOOLS))
+    builder.add_node("business", RunnableLambda(planner_node, afunc=aplanner_node, name="business"))
+    # 计划执行节点：按 depends_on 并发执行互不依赖的工具调用（并发上限/单步超时取自 workflow 配置）
+    builder.add_node("tools", create_plan_executor_node(QUERY_TOOLS))
     return builder
 
 def should_continue(state: State) -> str:
@@ -72,23 +87,24 @@ def should_continue(state: State) -> str:
         return "tools"
     return END
 
-def build_graph(llm, intent_str_key: Dict[str, str] = None):
+def build_graph(llm, intent_str_key: Dict[str, str] = None, fast_classifier: TieredIntentClassifier = None,
+                rag_answer_cache: SemanticAnswerCache = None, rag_agent: LazySimplePDFRAGAgent = None):
     """构建LangGraph工作流图"""
     builder = StateGraph(State)
     agent_sign = 1
-    # 注册意图分类节点
-    intent_cls_node = intent_cls_factory(llm, intent_str_key or INTENT_STR_KEY)
+    # 注册意图分类节点（fast_classifier 不为空时先走规则/向量快速通道）
+    intent_cls_node = intent_cls_factory(llm, intent_str_key or INTENT_STR_KEY, fast_classifier)
     builder.add_node("intent_cls", intent_cls_node)
 
     # 两种 agent 设计模式：
     if agent_sign == 1: # plan+tool_calls（先规划后执行），灵活度高，但复杂
         tool_Structured_Agent_node(builder)
     elif agent_sign == 2: # chain.bind_tools（规划执行一体） 简易的ReAct agent
-        builder.add_node("business", tool_react_agent_node)
+        builder.add_node("business", RunnableLambda(tool_react_agent_node, afunc=atool_react_agent_node, name="business"))
     elif agent_sign == 3: # React_agent流程
         builder.add_node("tools", ToolNode(tools=QUERY_TOOLS))
-    # 注册RAG Agent 节点（知识问答）
-    builder.add_node("rag_agent", create_simple_rag_node(llm))
+    # 注册RAG Agent 节点（知识问答，BGE模型与Milvus连接在首次使用时才初始化）
+    builder.add_node("rag_agent", create_simple_rag_node(llm, answer_cache=rag_answer_cache, lazy_agent=rag_agent))
 
     # 注册闲聊节点
     chit_chat_node = create_chit_chat_node(llm)
@@ -107,7 +123,7 @@ def build_graph(llm, intent_str_key: Dict[str, str] = None):
     builder.set_entry_point("intent_cls")
     # 添加意图分类后的条件路由（intent_cls_node → 其他节点）
     builder.add_conditional_edges(
-        "intent_cls_node",
+        "intent_cls",
         route_after_intent,
         {
             "business": "business",
@@ -129,13 +145,44 @@ def build_graph(llm, intent_str_key: Dict[str, str] = None):
         # 上面没有END，则继续下一轮ReAct循环
         builder.add_edge("tools", "intent_cls")
     builder.add_edge("rag_agent", END)    # RAG Agent 完成
-    builder.add_edge("tool_agent", END)  # 工具链 Agent 完成
     builder.add_edge("chit_chat", END)   # 闲聊完成
 
     # 编译图并返回
     return builder.compile(checkpointer=checkpointer)
 
-graph = build_graph(llm=llm_no_think)
+# 快速意图分类器：规则层 + BGE向量质心层（与RAG共用嵌入模型），统计信息见 fast_intent_classifier.stats()
+fast_intent_classifier = build_tiered_intent_classifier(INTENT_STR_KEY, embeddings_factory=get_embeddings)
+# RAG语义答案缓存：命中/未命中次数与节省耗时见 rag_answer_cache.stats()
+rag_answer_cache = SemanticAnswerCache(
+    threshold=rag_config.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=rag_config.SEMANTIC_CACHE_MAX_ENTRIES,
+    ttl_seconds=rag_config.SEMANTIC_CACHE_TTL,
+)
+# RAG Agent 延迟构建器：导入本模块不加载模型、不连接Milvus
+rag_agent_holder = LazySimplePDFRAGAgent(llm_no_think, answer_cache=rag_answer_cache)
+
+@lru_cache()
+def get_graph():
+    """获取编译后的工作流图（单例，首次调用时构建；重资源由各节点延迟加载）"""
+    return build_graph(llm=llm_no_think, fast_classifier=fast_intent_classifier,
+                       rag_answer_cache=rag_answer_cache, rag_agent=rag_agent_holder)
+
+def warmup_graph():
+    """预热重资源：构建图、加载BGE并连接Milvus、计算意图质心；失败只打印警告，首个请求时会再次尝试"""
+    start = time.perf_counter()
+    get_graph()
+    for name, warm in (("RAG Agent", rag_agent_holder.warmup), ("意图质心", fast_intent_classifier.warmup)):
+        try:
+            warm()
+        except Exception as e:
+            print(f"⚠️ {name} 预热失败：{e}")
+    print(f"🔥 预热完成，耗时{time.perf_counter() - start:.2f}s")
+
+def __getattr__(name):
+    # 兼容旧写法 `from src.graph.graph_simple import graph`
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # 代码说明：
 # 1. 功能定位：整合RAG Agent、工具链Agent与闲聊系统的核心工作流，实现基于意图的多分支处理；
@@ -147,4 +194,6 @@ graph = build_graph(llm=llm_no_think)
 #    - 含"是什么/为什么"等关键词 → RAG Agent；
 #    - 含"查询/执行"等关键词 → 工具链Agent；
 #    - 无业务关键词 → 闲聊节点；
-# 4. 应用场景：作为设备运维智能体的总调度中心，实现不同类型用户请求的精细化处理，是多Agent协作的核心载体。
\ No newline at end of file
+# 4. 执行方式：各节点同时提供同步/异步实现，graph.stream（命令行）与graph.astream（FastAPI服务）共用同一张图；
+# 5. 启动开销：get_graph() 延迟构图，RAG Agent 与意图质心在首次使用或 warmup_graph() 预热时才加载；
+# 6. 应用场景：作为设备运维智能体的总调度中心，实现不同类型用户请求的精细化处理，是多Agent协作的核心载体。
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""
+快速意图分类 - 分层（规则 → 向量质心 → LLM）
+第一层：由 INTENT_STR_KEY 与意图分类提示词中的规则编译出的关键词/正则匹配器；
+第二层：基于 BGE 向量的最近质心分类器（示例语句向量只计算一次并缓存）；
+两层置信度都不足时才调用 LLM 意图分类链。每层的命中率与耗时均有统计，便于调节阈值。
+"""
+import math
+import re
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from src.intent_demo.intent_map import INTENT_STR_KEY, INTENT_EXAMPLES
+
+
+class FastIntentConfig:
+    # 规则层：命中置信度 ≥ 该值才直接采用
+    KEYWORD_THRESHOLD: float = 0.9
+    # 向量层：与最近质心的余弦相似度 ≥ 该值，且领先第二名至少 EMBEDDING_MARGIN 才直接采用
+    EMBEDDING_THRESHOLD: float = 0.8
+    EMBEDDING_MARGIN: float = 0.05
+
+
+class IntentMatch(NamedTuple):
+    """快速分类结果"""
+    intent_name: str
+    intent_key: str
+    confidence: float
+    tier: str  # keyword / embedding
+
+
+# 业务无关意图的中文名称（与意图分类提示词保持一致）
+NON_BUSINESS_NAMES: Dict[str, str] = {"question": "question", "chit_chat": "chit_chat"}
+
+# 提示词规则对应的正则（规则来源：build_intent_chain 中的“业务无关”分类规则）
+GREETING_PATTERN = r"^(你好|您好|嗨|hi|hello|早上好|中午好|下午好|晚上好|早安|晚安|再见|拜拜|谢谢|多谢|感谢)[呀啊呢哦~～!！。.，, ]*$"
+CHAT_TOPIC_PATTERN = r"(天气怎么样|讲个笑话|聊聊天|陪我聊)"
+QUESTION_PATTERN = r"([?？]\s*$|^(什么是|如何|怎么|怎样|为什么)|(是什么|的电话|的地址|的联系方式))"
+# 出现业务对象但未命中具体业务意图时，规则层不做判断，交给后续层
+BUSINESS_HINT_PATTERN = r"(设备|场站|运维|充电桩|桩|SN)"
+
+
+class KeywordIntentMatcher:
+    """第一层：预编译的关键词/正则匹配器"""
+    def __init__(self, intent_str_key: Dict[str, str] = None):
+        intent_str_key = intent_str_key or INTENT_STR_KEY
+        # 业务意图：意图名称按长度降序，保证更具体的名称优先命中
+        names = sorted(intent_str_key.keys(), key=len, reverse=True)
+        self.business_pattern = re.compile("|".join(re.escape(n) for n in names)) if names else None
+        self.intent_str_key = dict(intent_str_key)
+        self.greeting_pattern = re.compile(GREETING_PATTERN, re.IGNORECASE)
+        self.chat_topic_pattern = re.compile(CHAT_TOPIC_PATTERN)
+        self.question_pattern = re.compile(QUESTION_PATTERN)
+        self.business_hint_pattern = re.compile(BUSINESS_HINT_PATTERN, re.IGNORECASE)
+
+    def match(self, text: str) -> Optional[IntentMatch]:
+        text = text.strip()
+        if not text:
+            return None
+        if self.business_pattern is not None:
+            hit = self.business_pattern.search(text)
+            if hit:
+                name = hit.group(0)
+                return IntentMatch(name, self.intent_str_key[name], 0.95, "keyword")
+        if self.greeting_pattern.match(text):
+            return IntentMatch(NON_BUSINESS_NAMES["chit_chat"], "chit_chat", 0.95, "keyword")
+        # 提示词规则：以问号结尾的询问一律归为提问，因此先于闲聊话题判断（“今天天气怎么样？”是提问）
+        if self.question_pattern.search(text):
+            # 含业务对象的提问可能是业务查询，降低置信度交给下一层判断
+            confidence = 0.6 if self.business_hint_pattern.search(text) else 0.9
+            return IntentMatch(NON_BUSINESS_NAMES["question"], "question", confidence, "keyword")
+        if self.chat_topic_pattern.search(text):
+            return IntentMatch(NON_BUSINESS_NAMES["chit_chat"], "chit_chat", 0.9, "keyword")
+        return None
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class CentroidIntentClassifier:
+    """第二层：示例语句向量的最近质心分类器"""
+    def __init__(self, embeddings_factory: Callable[[], object], examples: Dict[str, List[str]] = None,
+                 intent_str_key: Dict[str, str] = None):
+        self.embeddings_factory = embeddings_factory
+        self.examples = examples or INTENT_EXAMPLES
+        key_to_name = {v: k for k, v in (intent_str_key or INTENT_STR_KEY).items()}
+        key_to_name.update(NON_BUSINESS_NAMES)
+        self.key_to_name = key_to_name
+        self._embeddings = None
+        self._centroids: Optional[Dict[str, List[float]]] = None
+        self._lock = threading.Lock()
+        self._building = False
+
+    @property
+    def ready(self) -> bool:
+        return self._centroids is not None
+
+    def warmup(self):
+        self._ensure_centroids()
+
+    def _ensure_centroids(self):
+        """首次使用时计算并缓存各意图的质心向量"""
+        if self._centroids is not None:
+            return
+        with self._lock:
+            if self._centroids is not None:
+                return
+            embeddings = self.embeddings_factory()
+            centroids = {}
+            for key, sentences in self.examples.items():
+                if not sentences:
+                    continue
+                vectors = embeddings.embed_documents(sentences)
+                dim = len(vectors[0])
+                mean = [sum(v[i] for v in vectors) / len(vectors) for i in range(dim)]
+                centroids[key] = _normalize(mean)
+            self._embeddings = embeddings
+            self._centroids = centroids
+
+    def _score(self, query_vector: List[float]) -> Optional[IntentMatch]:
+        query_vector = _normalize(query_vector)
+        scores = sorted(
+            ((sum(q * c for q, c in zip(query_vector, centroid)), key) for key, centroid in self._centroids.items()),
+            reverse=True,
+        )
+        if not scores:
+            return None
+        best_score, best_key = scores[0]
+        margin = best_score - scores[1][0] if len(scores) > 1 else best_score
+        # 与第二名区分度不足时视为不确定，置信度折半
+        confidence = best_score if margin >= FastIntentConfig.EMBEDDING_MARGIN else best_score / 2
+        return IntentMatch(self.key_to_name.get(best_key, best_key), best_key, max(0.0, min(1.0, confidence)), "embedding")
+
+    def classify(self, text: str) -> Optional[IntentMatch]:
+        self._ensure_centroids()
+        return self._score(self._embeddings.embed_query(text))
+
+    def build_in_background(self):
+        """在后台线程加载嵌入模型并计算质心（只启动一次，失败后下次调用可重新触发）"""
+        with self._lock:
+            if self._building or self._centroids is not None:
+                return
+            self._building = True
+
+        def build():
+            try:
+                self._ensure_centroids()
+            except Exception as e:
+                print(f"⚠️ 意图质心计算失败：{e}")
+            finally:
+                self._building = False
+
+        threading.Thread(target=build, name="intent-centroids", daemon=True).start()
+
+    async def aclassify(self, text: str) -> Optional[IntentMatch]:
+        # 冷启动时质心未就绪：模型加载与示例向量化放到后台线程，本次直接交给LLM层，不阻塞事件循环
+        if not self.ready:
+            self.build_in_background()
+            return None
+        return self._score(await self._embeddings.aembed_query(text))
+
+
+class TieredIntentClassifier:
+    """分层快速意图分类器：规则层 → 向量层，均不满足阈值时返回None（由调用方走LLM）"""
+    TIERS = ("keyword", "embedding", "llm")
+
+    def __init__(self, keyword_matcher: Optional[KeywordIntentMatcher] = None,
+                 centroid_classifier: Optional[CentroidIntentClassifier] = None,
+                 keyword_threshold: float = FastIntentConfig.KEYWORD_THRESHOLD,
+                 embedding_threshold: float = FastIntentConfig.EMBEDDING_THRESHOLD):
+        self.keyword_matcher = keyword_matcher
+        self.centroid_classifier = centroid_classifier
+        self.keyword_threshold = keyword_threshold
+        self.embedding_threshold = embedding_threshold
+        self._lock = threading.Lock()
+        self._total = 0
+        self._stats = {tier: {"calls": 0, "hits": 0, "seconds": 0.0} for tier in self.TIERS}
+
+    def _record(self, tier: str, hit: bool, seconds: float):
+        with self._lock:
+            stat = self._stats[tier]
+            stat["calls"] += 1
+            stat["hits"] += int(hit)
+            stat["seconds"] += seconds
+
+    def _try_keyword(self, text: str) -> Optional[IntentMatch]:
+        if self.keyword_matcher is None:
+            return None
+        start = time.perf_counter()
+        match = self.keyword_matcher.match(text)
+        hit = match is not None and match.confidence >= self.keyword_threshold
+        self._record("keyword", hit, time.perf_counter() - start)
+        return match if hit else None
+
+    def _accept_embedding(self, match: Optional[IntentMatch], start: float) -> Optional[IntentMatch]:
+        hit = match is not None and match.confidence >= self.embedding_threshold
+        self._record("embedding", hit, time.perf_counter() - start)
+        return match if hit else None
+
+    def classify(self, text: str) -> Optional[IntentMatch]:
+        with self._lock:
+            self._total += 1
+        match = self._try_keyword(text)
+        if match is not None or self.centroid_classifier is None:
+            return match
+        start = time.perf_counter()
+        return self._accept_embedding(self.centroid_classifier.classify(text), start)
+
+    async def aclassify(self, text: str) -> Optional[IntentMatch]:
+        with self._lock:
+            self._total += 1
+        match = self._try_keyword(text)
+        if match is not None or self.centroid_classifier is None:
+            return match
+        start = time.perf_counter()
+        return self._accept_embedding(await self.centroid_classifier.aclassify(text), start)
+
+    def warmup(self):
+        """预先加载嵌入模型并计算质心，避免首个请求承担该开销"""
+        if self.centroid_classifier is not None:
+            self.centroid_classifier.warmup()
+
+    def record_llm(self, seconds: float):
+        """记录兜底LLM分类的耗时"""
+        self._record("llm", True, seconds)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各层命中率（占总请求数）与平均耗时（毫秒）"""
+        with self._lock:
+            total = self._total
+            result = {"total": total}
+            for tier, stat in self._stats.items():
+                result[tier] = {
+                    "calls": stat["calls"],
+                    "hits": stat["hits"],
+                    "hit_rate": round(stat["hits"] / total, 4) if total else 0.0,
+                    "avg_latency_ms": round(stat["seconds"] * 1000 / stat["calls"], 3) if stat["calls"] else 0.0,
+                }
+            return result
+
+
+def build_tiered_intent_classifier(intent_str_key: Dict[str, str] = None,
+                                   embeddings_factory: Optional[Callable[[], object]] = None) -> TieredIntentClassifier:
+    """构造默认的分层意图分类器；未提供 embeddings_factory 时只启用规则层"""
+    intent_str_key = intent_str_key or INTENT_STR_KEY
+    centroid = CentroidIntentClassifier(embeddings_factory, intent_str_key=intent_str_key) if embeddings_factory else None
+    return TieredIntentClassifier(KeywordIntentMatcher(intent_str_key), centroid)
+
+# 代码说明：
+# 1. 功能定位：意图分类的快速通道，拦截“你好”、以问号结尾的提问等简单输入，避免每轮都付出一次LLM往返；
+# 2. 核心逻辑：
+#    - KeywordIntentMatcher：由意图映射表与提示词规则预编译正则，微秒级完成匹配；
+#    - CentroidIntentClassifier：首次使用时对示例语句批量向量化并求质心，之后每次只需一次query向量化；
+#      异步路径（aclassify）在质心未就绪时于后台线程构建，本次直接交给LLM层，冷启动不阻塞事件循环；
+#    - TieredIntentClassifier：逐层尝试，置信度不足则返回None交由LLM分类链处理；
+# 3. 可观测性：stats() 输出每层调用次数、命中率与平均耗时，用于调节 FastIntentConfig 中的阈值；
+# 4. 应用场景：由 intent_cls_factory 在调用LLM分类链之前使用。
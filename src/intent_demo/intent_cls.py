@@ -1,19 +1,28 @@
-from typing import Dict
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
 from src.intent_demo.intent_schemas import IntentSchema, State
 from src.intent_demo.intent_map import INTENT_STR_KEY
+from src.intent_demo.fast_intent import TieredIntentClassifier, IntentMatch
 from src.utils.model_hook import get_last_user_input
 
 
-def build_intent_chain(llm, intent_str_key: Dict[str, str]):
-    # 系统提示词：定义意图分类器的角色与输出格式
-    system_text = ( # 查询统计、设备管理、健康自检、提单系统
+# 初始化Pydantic解析器，用于将LLM输出转换为IntentSchema对象 [泛型指定](用户传进的类对象)
+INTENT_PARSER = PydanticOutputParser[IntentSchema](pydantic_object=IntentSchema)
+
+
+@lru_cache(maxsize=16)
+def build_intent_system_text(intent_items: Tuple[Tuple[str, str], ...]) -> str:
+    # 系统提示词：定义意图分类器的角色与输出格式（同一意图映射只拼接一次，格式说明直接写入，不再每次调用时填充）
+    return ( # 查询统计、设备管理、健康自检、提单系统
         "你是一个严格的意图分类器。只返回JSON，且必须符合给定的Pydantic。"
         "\n##意图分类期规则："
 "\n1. **业务相关**：如果问题与设备业务相关（涉及场站、设备、运维等），则在以下映射中选择最贴近的意图（名称->key）："
-        + "\n".join([f" {k} -> {v}" for k, v in intent_str_key.items()])  # "\n 设备分析列表 -> devicesList"
+        + "\n".join([f" {k} -> {v}" for k, v in intent_items])  # "\n 设备分析列表 -> devicesList"
         + "\n 如果完全没有匹配但与设备业务相关，可以选择最接近的一个"  # "文本1"+"文本2"→"文本1文本2"
 "\n2. **业务无关**：如果问题与设备业务无关，按以下规则分类："
 "\n - **提问类（question）**：所有询问信息的问题，包括但不限于："
@@ -35,32 +44,26 @@ def build_intent_chain(llm, intent_str_key: Dict[str, str]):
 "\n- '查询深圳场站信息' → 核心='查询场站信息' → stationInfo"
 "\n- 'Autel Europe UK Ltd的电话是什么？' → 业务无关，提问类（询问联系方式） → question"
 "\n- '今天天气怎么样' → 业务无关，闲聊类（闲聊话题） → chit_chat"
-"\n严格按照此JSON模式输出：\n{format_instructions}"
-    )
-    # 初始化Pydantic解析器，用于将LLM输出转换为IntentSchema对象 [泛型指定](用户传进的类对象)
-    parser = PydanticOutputParser[IntentSchema](pydantic_object=IntentSchema)
-    # 构造提示词模板（包含系统角色与用户查询）
+"\n严格按照此JSON模式输出：\n"
+    ) + INTENT_PARSER.get_format_instructions()
+
+
+def build_intent_chain(llm, intent_str_key: Dict[str, str]):
+    # 构造提示词模板（静态系统消息 + 用户查询）：系统消息不做模板解析，每次请求的前缀逐字一致，服务端前缀缓存可命中
     prompt = ChatPromptTemplate.from_messages([
-        ("system", system_text),
+        SystemMessage(content=build_intent_system_text(tuple(intent_str_key.items()))),
         ("user", "{query}")
-    ]).partial(format_instructions=parser.get_format_instructions())
+    ])
     # 构建“提示词→LLM→解析器”的处理链，逻辑依赖下的唯一合理顺序
-    return prompt | llm | parser
+    # 意图分类决定后续走向，LLM限流排队时优先放行
+    return prompt | llm.with_config(metadata={"llm_priority": "high"}) | INTENT_PARSER
 
-def intent_cls_factory(llm, intent_str_key: Dict[str, str] = None):
+def intent_cls_factory(llm, intent_str_key: Dict[str, str] = None,
+                       fast_classifier: Optional[TieredIntentClassifier] = None):
     # 构建意图分类链（默认使用DEFAULT_INTENT_MAP）
     chain = build_intent_chain(llm, intent_str_key or INTENT_STR_KEY)
 
-    def node(state: State):
-        # 从状态中获取对话消息列表
-        messages = state.get("messages", [])
-        user_text = ""
-        # 反向遍历消息，提取最新的用户输入
-        user_text = get_last_user_input(messages)
-        # 若无用户输入，返回空消息
-        if not user_text: return {"messages": []}
-        # 调用分类链，获取意图识别结果
-        result: IntentSchema = chain.invoke({"query": user_text})
+    def build_update(messages, result: IntentSchema):
         # 构造AI消息，记录意图分类结果
         ai_msg = AIMessage(content=result.model_dump_json(), name="intent_cls")
         # 返回更新后的状态（包含新消息、意图标识、意图名称、置信度）
@@ -70,13 +73,53 @@ def intent_cls_factory(llm, intent_str_key: Dict[str, str] = None):
             "intent_key": result.intent_key,
             "confidence": result.confidence,
         }
-    return node
+
+    def from_fast_match(match: IntentMatch) -> IntentSchema:
+        # 快速通道命中：直接构造与LLM输出一致的结构
+        return IntentSchema(intent_name=match.intent_name, intent_key=match.intent_key,
+                            confidence=match.confidence, reason=f"快速分类命中（{match.tier}）")
+
+    def node(state: State):
+        # 从状态中获取对话消息列表
+        messages = state.get("messages", [])
+        # 反向遍历消息，提取最新的用户输入
+        user_text = get_last_user_input(messages)
+        # 若无用户输入，返回空消息
+        if not user_text: return {"messages": []}
+        # 先走快速通道（规则→向量），置信度足够则跳过LLM
+        match = fast_classifier.classify(user_text) if fast_classifier else None
+        if match is not None:
+            return build_update(messages, from_fast_match(match))
+        # 调用分类链，获取意图识别结果
+        start = time.perf_counter()
+        result: IntentSchema = chain.invoke({"query": user_text})
+        if fast_classifier: fast_classifier.record_llm(time.perf_counter() - start)
+        return build_update(messages, result)
+
+    async def anode(state: State):
+        # 异步版本：graph.astream 下走 ainvoke，不阻塞事件循环
+        messages = state.get("messages", [])
+        user_text = get_last_user_input(messages)
+        if not user_text: return {"messages": []}
+        match = await fast_classifier.aclassify(user_text) if fast_classifier else None
+        if match is not None:
+            return build_update(messages, from_fast_match(match))
+        start = time.perf_counter()
+        result: IntentSchema = await chain.ainvoke({"query": user_text})
+        if fast_classifier: fast_classifier.record_llm(time.perf_counter() - start)
+        return build_update(messages, result)
+
+    # 同时提供同步/异步实现：graph.stream 调用 node，graph.astream 调用 anode
+    return RunnableLambda(node, afunc=anode, name="intent_cls")
 
 # 代码说明：
 # 1. 功能定位：该文件是LLM Agent的“意图分类模块”，负责将用户输入转换为标准化的意图信息；
 # 2. 核心逻辑：
+#    - build_intent_system_text：按意图映射缓存拼接好的系统提示词（含JSON格式说明），作为稳定的静态前缀；
 #    - build_intent_chain：构建“提示词+LLM+解析器”的处理链，定义意图分类的规则与输出格式；
 #    - intent_classifier_node_factory：生成意图分类节点，从对话中提取用户输入，调用分类链得到意图结果，并更新状态；
+#    - 节点同时提供同步（invoke）与异步（ainvoke）实现，异步服务中不会阻塞事件循环；
+#    - 传入fast_classifier时先走规则/向量快速通道，只有置信度不足才调用LLM分类链；
 # 3. 技术特点：
 #    - 使用PydanticOutputParser确保LLM输出符合IntentSchema结构；
 #    - 支持自定义意图映射表，适配不同业务场景；
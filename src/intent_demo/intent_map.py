@@ -1,16 +1,45 @@
-from typing import Dict
+from typing import Dict, List, Union
 # 意图映射表：将用户意图的自然语言描述映射为统一的意图标识
 INTENT_STR_KEY: Dict[str, str] = {
     "设备分析列表": "devicesList"
 }
-# 意图-工具映射表：将意图标识映射为对应的处理工具
-INTENT_KEY_AGENT: Dict[str, str] = {
+# 意图-工具映射表：将意图标识映射为对应的处理工具（值为列表时拆成多个并发执行的步骤）
+INTENT_KEY_AGENT: Dict[str, Union[str, List[str]]] = {
     "devicesList": "query_tool"
 }
 
+# 意图示例语句：供快速意图分类（向量质心层）计算各意图的中心向量，新增意图时同步补充3~10条典型说法
+INTENT_EXAMPLES: Dict[str, List[str]] = {
+    "devicesList": [
+        "查询设备分析列表",
+        "看一下设备分析数据",
+        "深圳场站的设备分析列表",
+        "帮我统计下设备运行情况",
+        "列出场站下所有设备的分析结果",
+    ],
+    "question": [
+        "什么是通信模块？",
+        "设备显示008通信故障怎么处理？",
+        "如何更换充电枪？",
+        "Autel Europe UK Ltd的电话是什么？",
+        "为什么设备会离线？",
+        "怎样重置设备密码",
+    ],
+    "chit_chat": [
+        "你好",
+        "早上好",
+        "谢谢你",
+        "再见",
+        "今天天气怎么样",
+        "讲个笑话",
+        "陪我聊聊天",
+    ],
+}
+
 # 代码说明：
 # 1. 核心作用：该文件是意图与工具的映射配置中心，实现“用户自然语言意图→统一意图标识→处理工具”的两层映射；
 # 2. 映射逻辑：
 #    - DEFAULT_INTENT_MAP：将用户输入的自然语言意图（如“设备分析列表”）转换为标准化的意图标识（如“devicesList”）；
 #    - INTENT_TO_AGENT：将意图标识映射为具体的处理工具（如“query_tool”）；
+#    - INTENT_EXAMPLES：各意图的典型说法，用于快速意图分类的向量质心计算；
 # 3. 应用场景：配合planner模块使用，实现用户意图到工具调用的自动化匹配，是LLM Agent中意图路由的关键配置，提升意图识别与工具调度的可维护性。
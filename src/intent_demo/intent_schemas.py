@@ -11,6 +11,7 @@ class State(TypedDict):
     confidence: Optional[float]              # 意图识别置信度（0~1）
     plan: Optional[Dict[str, Any]]           # 执行计划
     authToken: Optional[str]                 # 认证令牌
+    context_window: Optional[Dict[str, Any]] # 增量上下文窗口（见 src/utils/context_window.py）
 
 # 意图Schema：规范意图识别的输出结构
 class IntentSchema(BaseModel):# Pydantic 的 BaseModel 是所有 “数据模型类” 的基类，核心能力是 自动数据验证、类型转换和序列化
@@ -21,9 +22,11 @@ class IntentSchema(BaseModel):# Pydantic 的 BaseModel 是所有 “数据模型
 
 # 执行步骤：定义单步工具调用的结构（所有字段可选）
 class Step(TypedDict, total=False):
+    id: str                            # 步骤ID（与对应tool_call的id一致）
     agent_tool: str                          # 工具名称
     params: Dict[str, Any]             # 工具参数
     summary_after: Optional[bool]      # 执行后是否需要总结
+    depends_on: List[str]              # 依赖的步骤ID；无依赖的步骤会并发执行
 
 # 执行计划：定义多步工具调用的结构（所有字段可选）
 class Plan(TypedDict, total=False):
@@ -35,7 +38,7 @@ class Plan(TypedDict, total=False):
 # 2. 结构分类：
 #    - State：存储工作流的运行时数据，是Agent各节点间传递信息的载体；
 #    - IntentSchema：约束意图识别的输出，确保LLM输出符合预期结构；
-#    - PlanStep/Plan：定义工具执行计划的层级结构，规范多步工具调用的参数与逻辑；
+#    - PlanStep/Plan：定义工具执行计划的层级结构，规范多步工具调用的参数与逻辑，depends_on 描述步骤间依赖；
 # 3. 技术特点：
 #    - 使用TypedDict定义State，兼顾类型约束与运行时的字典灵活性；
 #    - 使用Pydantic的BaseModel定义IntentSchema，实现结构化输出的校验；
@@ -0,0 +1,214 @@
+"""
+计划执行器 - 按依赖关系并发执行 planner_node 生成的工具调用
+替代图中 planner 之后的 ToolNode：
+    - 每个 Step 的 id 与对应 tool_call 的 id 一致，depends_on 列出需要先完成的步骤 id；
+    - 依赖已满足的步骤立即派发，互不依赖的步骤并发执行（并发上限 WorkflowConfig.max_concurrent）；
+    - 每个步骤的超时取 WorkflowConfig.default_timeout，超时/失败的步骤返回错误 ToolMessage，依赖它的步骤被跳过；
+多个独立查询的总耗时约等于最慢的一个，而不是所有调用耗时之和。
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from langchain_core.tools import BaseTool
+
+from core.config import get_settings
+from src.intent_demo.intent_schemas import State
+
+
+def _error_message(call: Dict[str, Any], content: str) -> ToolMessage:
+    return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"], status="error")
+
+
+class PlanExecutor:
+    """依赖感知的并发工具执行器，同时提供同步（线程池）与异步（事件循环）实现"""
+    def __init__(self, tools: Sequence[BaseTool], max_concurrent: Optional[int] = None,
+                 step_timeout: Optional[float] = None):
+        workflow = get_settings().workflow
+        self.tools_by_name = {t.name: t for t in tools}
+        self.max_concurrent = max(1, max_concurrent or workflow.max_concurrent)
+        self.step_timeout = step_timeout or workflow.default_timeout
+        # 同步：共享线程池，线程数即进程内工具调用的并发上限
+        self._pool: Optional[ContextThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        # 异步：信号量绑定事件循环，按当前循环惰性创建
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ---------- 计划解析 ----------
+    @staticmethod
+    def _pending_calls(state: State) -> List[Dict[str, Any]]:
+        messages = state.get("messages", [])
+        last = messages[-1] if messages else None
+        return list(getattr(last, "tool_calls", None) or []) if isinstance(last, AIMessage) else []
+
+    @staticmethod
+    def _dependencies(state: State, calls: List[Dict[str, Any]]) -> Dict[str, set]:
+        """tool_call id → 依赖的 tool_call id 集合（忽略不在本轮调用中的依赖）"""
+        ids = {c["id"] for c in calls}
+        steps = (state.get("plan") or {}).get("steps", [])
+        deps = {c["id"]: set() for c in calls}
+        for step in steps:
+            step_id = step.get("id")
+            if step_id in deps:
+                deps[step_id] = {d for d in step.get("depends_on", []) if d in ids and d != step_id}
+        return deps
+
+    @staticmethod
+    def _ready(deps: Dict[str, set], done: set, started: set) -> List[str]:
+        return [cid for cid, d in deps.items() if cid not in started and d <= done]
+
+    @staticmethod
+    def _skip_blocked(deps: Dict[str, set], failed: set, started: set,
+                      calls_by_id: Dict[str, Dict[str, Any]], results: Dict[str, ToolMessage]):
+        """依赖失败的步骤（含间接依赖）直接跳过"""
+        changed = True
+        while changed:
+            changed = False
+            for cid, d in deps.items():
+                if cid not in started and d & failed:
+                    started.add(cid)
+                    failed.add(cid)
+                    results[cid] = _error_message(calls_by_id[cid], f"已跳过：依赖的步骤 {sorted(d & failed)} 执行失败")
+                    changed = True
+
+    @staticmethod
+    def _finish(calls: List[Dict[str, Any]], results: Dict[str, ToolMessage]) -> Dict[str, List[ToolMessage]]:
+        # 未执行的步骤只可能来自循环依赖
+        messages = [results.get(c["id"]) or _error_message(c, "未执行：存在循环依赖") for c in calls]
+        return {"messages": messages}
+
+    # ---------- 单步执行 ----------
+    def _lookup(self, call: Dict[str, Any]) -> Optional[BaseTool]:
+        return self.tools_by_name.get(call["name"])
+
+    def _unknown_tool(self, call: Dict[str, Any]) -> ToolMessage:
+        return _error_message(call, f"Error: {call['name']} is not a valid tool, try one of [{', '.join(self.tools_by_name)}].")
+
+    def _run_step(self, call: Dict[str, Any], config: Optional[Dict[str, Any]]) -> ToolMessage:
+        tool = self._lookup(call)
+        if tool is None:
+            return self._unknown_tool(call)
+        return tool.invoke({**call, "type": "tool_call"}, config)
+
+    async def _arun_step(self, call: Dict[str, Any], config: Optional[Dict[str, Any]]) -> ToolMessage:
+        tool = self._lookup(call)
+        if tool is None:
+            return self._unknown_tool(call)
+        async with self._async_semaphore():
+            return await asyncio.wait_for(tool.ainvoke({**call, "type": "tool_call"}, config), self.step_timeout)
+
+    def _executor(self) -> ContextThreadPoolExecutor:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ContextThreadPoolExecutor(max_workers=self.max_concurrent,
+                                                           thread_name_prefix="plan-step")
+        return self._pool
+
+    def _async_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    # ---------- 同步执行 ----------
+    def run(self, state: State, config: Optional[Dict[str, Any]] = None) -> Dict[str, List[ToolMessage]]:
+        calls = self._pending_calls(state)
+        calls_by_id = {c["id"]: c for c in calls}
+        deps = self._dependencies(state, calls)
+        results: Dict[str, ToolMessage] = {}
+        done, failed, started = set(), set(), set()
+        running: Dict[Future, tuple] = {}  # future → (call_id, deadline)
+        pool = self._executor()
+
+        while True:
+            for cid in self._ready(deps, done, started):
+                started.add(cid)
+                future = pool.submit(self._run_step, calls_by_id[cid], config)
+                running[future] = (cid, time.monotonic() + self.step_timeout)
+            if not running:
+                break
+            nearest = min(deadline for _, deadline in running.values())
+            finished, _ = wait(list(running), timeout=max(0.0, nearest - time.monotonic()),
+                               return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in list(running):
+                cid, deadline = running[future]
+                if future in finished:
+                    try:
+                        results[cid] = future.result()
+                        (failed if results[cid].status == "error" else done).add(cid)
+                    except Exception as e:
+                        results[cid] = _error_message(calls_by_id[cid], f"Error: {e!r}")
+                        failed.add(cid)
+                elif now >= deadline:
+                    # 线程无法强制终止，超时后不再等待其结果
+                    future.cancel()
+                    results[cid] = _error_message(calls_by_id[cid], f"执行超时（{self.step_timeout}s）")
+                    failed.add(cid)
+                else:
+                    continue
+                del running[future]
+            self._skip_blocked(deps, failed, started, calls_by_id, results)
+        return self._finish(calls, results)
+
+    # ---------- 异步执行 ----------
+    async def arun(self, state: State, config: Optional[Dict[str, Any]] = None) -> Dict[str, List[ToolMessage]]:
+        calls = self._pending_calls(state)
+        calls_by_id = {c["id"]: c for c in calls}
+        deps = self._dependencies(state, calls)
+        results: Dict[str, ToolMessage] = {}
+        done, failed, started = set(), set(), set()
+        running: Dict[asyncio.Task, str] = {}
+
+        try:
+            while True:
+                for cid in self._ready(deps, done, started):
+                    started.add(cid)
+                    running[asyncio.ensure_future(self._arun_step(calls_by_id[cid], config))] = cid
+                if not running:
+                    break
+                finished, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    cid = running.pop(task)
+                    try:
+                        results[cid] = task.result()
+                        (failed if results[cid].status == "error" else done).add(cid)
+                    except asyncio.TimeoutError:
+                        results[cid] = _error_message(calls_by_id[cid], f"执行超时（{self.step_timeout}s）")
+                        failed.add(cid)
+                    except Exception as e:
+                        results[cid] = _error_message(calls_by_id[cid], f"Error: {e!r}")
+                        failed.add(cid)
+                self._skip_blocked(deps, failed, started, calls_by_id, results)
+        finally:
+            # 节点被取消（如 /ws/chat 的 cancel）时一并取消仍在执行的步骤，避免工具调用成为孤儿任务
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        return self._finish(calls, results)
+
+
+def create_plan_executor_node(tools: Sequence[BaseTool], max_concurrent: Optional[int] = None,
+                              step_timeout: Optional[float] = None) -> RunnableLambda:
+    """创建计划执行节点（同步/异步），用于替换 planner 之后的 ToolNode"""
+    executor = PlanExecutor(tools, max_concurrent=max_concurrent, step_timeout=step_timeout)
+    return RunnableLambda(executor.run, afunc=executor.arun, name="tools")
+
+# 代码说明：
+# 1. 功能定位：让 planner_node 拆出的多个工具调用按依赖关系并发执行，缩短多查询请求（如看板类请求）的总耗时；
+# 2. 核心逻辑：
+#    - _dependencies：由 plan.steps 的 id/depends_on 构建依赖表，tool_call id 与 step id 一一对应；
+#    - run：共享线程池派发就绪步骤，FIRST_COMPLETED 等待，任一步骤完成后立即派发新就绪的步骤；
+#    - arun：asyncio 任务 + 信号量限流，asyncio.wait_for 实现单步超时；节点被取消时一并取消在途步骤；
+#    - 失败/超时步骤的下游直接跳过，循环依赖的步骤返回错误消息；
+# 3. 输出：与 ToolNode 相同，按 tool_calls 原始顺序返回 ToolMessage 列表；
+# 4. 应用场景：graph_simple 中 agent_sign == 1（plan+tool_calls）模式下的 "tools" 节点。
@@ -8,35 +8,43 @@ def planner_node(state: State, config):
     key = (state.get("intent_key") or "").strip()
     # 若意图标识为空，返回无法识别意图的结果
     if not key:return {"messages": [AIMessage(content="无法识别用户意图")]}
-    # 根据意图标识匹配对应的Agent
+    # 根据意图标识匹配对应的Agent（可配置为多个工具，如看板类意图需要同时查询多项数据）
     agent_tool = INTENT_KEY_AGENT.get(key)
     # 若匹配不到Agent，返回不支持该意图的结果
     if not agent_tool:return {"messages": [AIMessage(content=f"暂不支持该意图: {key}")]}
+    agent_tools = [agent_tool] if isinstance(agent_tool, str) else list(agent_tool)
     # 从对话消息中提取最新的用户输入
     user_text = get_last_user_input(state.get("messages", []))
-    # 构造执行计划：包含工具、参数、执行后总结的配置
+    # 构造执行计划：包含工具、参数、执行后总结的配置；各步骤互不依赖，由计划执行器并发执行
     plan: Plan = {
         "type": "plan",
         "steps": [{
-            "agent_tool": agent_tool,
+            "id": f"call_{idx}",
+            "agent_tool": tool_name,
             "params": {"userText": user_text},
             "summary_after": True,
-        }],
+            "depends_on": [],
+        } for idx, tool_name in enumerate(agent_tools, start=1)],
     }
-    # 处理执行计划并生成工具调用消息
+    # 处理执行计划并生成工具调用消息（tool_call id 与 step id 一致，计划执行器据此关联依赖）
     tool_calls = [{
         "name": step["agent_tool"],
         "args": step.get("params", {}),
-        "id": f"call_{idx}"
-    } for idx, step in enumerate(plan.get("steps", []), start=1)]# plan主要是为了拆解出step给出tool_calls的调用顺序再给graph
+        "id": step["id"]
+    } for step in plan.get("steps", [])]# plan主要是为了拆解出step给出tool_calls的调用顺序再给graph
     tool_str =",".join([i.get("name","") for i in tool_calls])
     return {"plan": plan,"messages": [AIMessage(content=f"调用工具：{tool_str}", tool_calls=tool_calls)]}
+
+async def aplanner_node(state: State, config):
+    # 规划过程为纯内存计算，异步版本直接复用同步逻辑，避免graph.astream下切换到线程池执行
+    return planner_node(state, config)
 # 只返回部分 key 是完全允许的 ——graph（如 LangChain StateGraph）会自动做「状态合并」：用你返回的新 key 覆盖旧状态，未返回的 key 保留原有值
 # 代码说明：
 # 1. 功能定位：这是LLM Agent框架中的“计划器”模块，负责根据用户意图生成工具执行计划；
 # 2. 核心逻辑：
 #    - 提取用户意图标识，匹配对应的处理Agent；
 #    - 从对话历史中获取最新用户输入；
-#    - 构造包含工具、参数、执行后总结的执行计划；
+#    - 构造包含工具、参数、执行后总结、依赖关系（depends_on）的执行计划；
 #    - 处理意图识别失败、Agent匹配失败的异常场景；
+#    - aplanner_node：异步图执行（graph.astream）下使用的等价版本；
 # 3. 应用场景：在LangChain的多Agent/工具链流程中，作为意图到执行的中间层，实现用户需求到工具调用的自动化映射，是Agent决策流程的关键组件。
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""
+本地内容寻址二进制存储 - 图片等大对象落盘，向量库元数据只保存哈希引用
+存储结构：
+    <root>/<前2位>/<后续2位>/<sha256十六进制>    原始字节（写入临时文件后原子重命名）
+    引用格式：sha256:<十六进制>，相同内容只存一份，写入天然幂等，多进程可同时写同一目录。
+读取按需进行：检索结果、提示词中只流转引用，需要图片的多模态回答才读盘解码。
+"""
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from src.rag.manifest import PROJECT_ROOT
+
+REF_PREFIX = "sha256:"
+
+
+class BlobStore:
+    """内容寻址的本地文件存储：put 返回引用，get/open_image 按引用读取"""
+    def __init__(self, root: str):
+        self.root = Path(root)
+        if not self.root.is_absolute():
+            self.root = PROJECT_ROOT / self.root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, ref: str) -> Path:
+        if not ref.startswith(REF_PREFIX):
+            raise ValueError(f"❌ 无效的二进制引用：{ref}")
+        digest = ref[len(REF_PREFIX):]
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise ValueError(f"❌ 无效的二进制引用：{ref}")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def _commit(self, tmp_path: str, ref: str) -> str:
+        target = self.path(ref)
+        if target.exists():  # 内容相同，已存在即无需写入
+            os.unlink(tmp_path)
+            return ref
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, target)
+        return ref
+
+    def put(self, data: bytes) -> str:
+        ref = REF_PREFIX + hashlib.sha256(data).hexdigest()
+        if self.path(ref).exists():
+            return ref
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return self._commit(tmp_path, ref)
+
+    def put_file(self, file_path: str, chunk_size: int = 1 << 20) -> str:
+        """分块复制并计算哈希，大文件不整体读入内存"""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as out, open(file_path, "rb") as src:
+            while chunk := src.read(chunk_size):
+                digest.update(chunk)
+                out.write(chunk)
+        return self._commit(tmp_path, REF_PREFIX + digest.hexdigest())
+
+    def exists(self, ref: str) -> bool:
+        return self.path(ref).exists()
+
+    def get(self, ref: str) -> bytes:
+        return self.path(ref).read_bytes()
+
+    def open_image(self, ref: str) -> Any:
+        """按引用读取并解码为 PIL 图片（仅在确实需要图片时调用）"""
+        from PIL import Image
+        with Image.open(self.path(ref)) as img:
+            return img.convert("RGB")
+
+    def iter_refs(self) -> Iterator[str]:
+        for path in self.root.glob("??/??/*"):
+            yield REF_PREFIX + path.name
+
+    def stats(self) -> dict:
+        count, size = 0, 0
+        for ref in self.iter_refs():
+            count += 1
+            size += self.path(ref).stat().st_size
+        return {"blobs": count, "bytes": size}
+
+
+@lru_cache()
+def get_blob_store(root: Optional[str] = None) -> BlobStore:
+    return BlobStore(root or os.getenv("RAG_BLOB_DIR", "data/blobs"))
+
+# 代码说明：
+# 1. 功能定位：多模态知识库中的图片原件不再以 base64 写入向量库元数据，改为本地内容寻址存储；
+# 2. 核心逻辑：
+#    - put / put_file：sha256 作为文件名，临时文件 + os.replace 原子落盘，重复内容直接复用；
+#    - path：校验引用格式后映射到两级分片目录，避免单目录文件过多；
+#    - open_image：读取时才解码，检索与提示词拼接全程只传递引用字符串；
+# 3. 应用场景：rag_agent0 的图片/PDF图片入库写入 image_ref，多模态回答需要原图时按引用加载。
@@ -0,0 +1,253 @@
+"""
+BM25 稀疏索引 - 进程内倒排索引，与 Milvus 向量检索做倒数排名融合（RRF）
+手册中大量出现精确的故障码（"008"、"E-203"）与备件号，稠密向量对这类字面匹配不敏感：
+    - 分词：中文用 jieba 搜索引擎模式（未安装时退化为汉字二元组），字母数字代码整体保留为一个词；
+    - 索引：chunk_id → 词频，词 → 倒排表，随入库增删增量更新，JSON 文件原子落盘；
+      索引文件 mtime 变化（其他进程入库后保存）时重新加载，多个 worker 看到同一份索引；
+    - 融合：reciprocal_rank_fusion 按排名（而非分数）合并多路结果，不需要对齐 BM25 与余弦分数的量纲；
+    - 代码类查询：is_code_dominated 判断查询主要由代码组成时，可只走稀疏检索，省去向量化前向计算。
+"""
+import heapq
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from src.rag.manifest import PROJECT_ROOT
+
+# 字母数字片段（可含 - _ . / 连接符），包含数字的视为代码：008、E-203、PN-4411A、3.2.1
+_TERM_RE = re.compile(r"[A-Za-z0-9]+(?:[-_./][A-Za-z0-9]+)*|[一-鿿]+")
+_CODE_SEP_RE = re.compile(r"[-_./]")
+_CJK_RE = re.compile(r"[一-鿿]")
+_STOPWORDS = {"的", "了", "是", "在", "和", "与", "及", "或", "把", "被", "吗", "呢", "啊", "请", "怎么", "如何", "什么"}
+
+
+@lru_cache()
+def _jieba():
+    try:
+        import jieba
+    except ImportError:
+        print("⚠️  未安装jieba，BM25中文分词退化为汉字二元组")
+        return None
+    jieba.setLogLevel(60)
+    return jieba
+
+
+def warmup_tokenizer():
+    """提前加载jieba词典（首次分词约1s），在后台预热阶段调用"""
+    jieba = _jieba()
+    if jieba is not None:
+        jieba.initialize()
+
+
+def _is_code(term: str) -> bool:
+    return any(ch.isdigit() for ch in term)
+
+
+def _cjk_terms(run: str) -> List[str]:
+    jieba = _jieba()
+    if jieba is not None:
+        return [w for w in jieba.lcut_for_search(run) if w not in _STOPWORDS]
+    if len(run) == 1:
+        return [] if run in _STOPWORDS else [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text: str) -> List[str]:
+    """BM25分词：代码整体保留（并附加去掉连接符的写法，E-203 与 E203 可互相匹配），中文按词切分"""
+    terms = []
+    for match in _TERM_RE.finditer(text):
+        run = match.group()
+        if _CJK_RE.match(run):
+            terms.extend(_cjk_terms(run))
+            continue
+        term = run.lower()
+        terms.append(term)
+        compact = _CODE_SEP_RE.sub("", term)
+        if compact != term:
+            terms.append(compact)
+    return terms
+
+
+def code_terms(text: str) -> List[str]:
+    return [m.group() for m in _TERM_RE.finditer(text) if not _CJK_RE.match(m.group()) and _is_code(m.group())]
+
+
+def is_code_dominated(query: str, ratio: float = 0.5) -> bool:
+    """查询中代码字符占有效字符（去掉空白与标点）的比例 ≥ ratio 时视为精确代码查询"""
+    codes = code_terms(query)
+    if not codes:
+        return False
+    meaningful = sum(1 for ch in query if ch.isalnum())
+    return meaningful > 0 and sum(len(_CODE_SEP_RE.sub("", c)) for c in codes) / meaningful >= ratio
+
+
+def _doc_key(doc: Document) -> str:
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+
+def reciprocal_rank_fusion(result_lists: Iterable[List[Document]], k: int = 60,
+                           top_n: Optional[int] = None) -> List[Document]:
+    """倒数排名融合：score(d) = Σ 1 / (k + rank)，按 chunk_id 去重（无 chunk_id 的旧数据按正文去重）"""
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    if top_n is not None:
+        ranked = ranked[:top_n]
+    return [docs[key] for key in ranked]
+
+
+class BM25Index:
+    """单个集合的BM25倒排索引（进程内，线程安全），JSON 文件存储，保存时原子替换"""
+    def __init__(self, path: Optional[Path] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = Path(path) if path is not None else None
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # chunk_id → {"text", "metadata", "tf": {词: 频次}, "len": 词数}
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        # 词 → {chunk_id: 频次}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_len = 0
+        self._dirty = False
+        self._mtime_ns = self._file_mtime()
+        if self._mtime_ns is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for cid, entry in json.load(f).get("docs", {}).items():
+                    self._insert(cid, entry["text"], entry.get("metadata", {}), entry["tf"])
+
+    @classmethod
+    def for_collection(cls, collection_name: str, index_dir: str, k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        directory = Path(index_dir)
+        if not directory.is_absolute():
+            directory = PROJECT_ROOT / directory
+        return cls(directory / f"{collection_name}.json", k1=k1, b=b)
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return self.path.stat().st_mtime_ns if self.path is not None else None
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> bool:
+        """索引文件被其他进程替换（mtime 变化）时重新加载；本进程有未保存的修改时不覆盖，返回是否重新加载"""
+        mtime = self._file_mtime()
+        if mtime is None or mtime == self._mtime_ns or self._dirty:
+            return False
+        # 解析与建倒排表在锁外进行，完成后整体替换，检索不会被长时间阻塞
+        fresh = BM25Index(self.path, k1=self.k1, b=self.b)
+        with self._lock:
+            if self._dirty:
+                return False
+            self._docs, self._postings, self._total_len = fresh._docs, fresh._postings, fresh._total_len
+            self._mtime_ns = fresh._mtime_ns
+        return True
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._docs
+
+    def has_all(self, chunk_ids: Iterable[str]) -> bool:
+        self.refresh()
+        return all(cid in self._docs for cid in chunk_ids)
+
+    def _insert(self, chunk_id: str, text: str, metadata: Dict[str, Any], tf: Dict[str, int]):
+        """写入一个块（调用方持有锁或处于构造阶段）"""
+        self._docs[chunk_id] = {"text": text, "metadata": metadata, "tf": tf, "len": sum(tf.values())}
+        self._total_len += self._docs[chunk_id]["len"]
+        for term, count in tf.items():
+            self._postings.setdefault(term, {})[chunk_id] = count
+
+    def add(self, chunk_id: str, text: str, metadata: Optional[Dict[str, Any]] = None):
+        tf = dict(Counter(tokenize(text)))
+        with self._lock:
+            if chunk_id in self._docs:
+                self._remove(chunk_id)
+            self._insert(chunk_id, text, dict(metadata or {}), tf)
+            self._dirty = True
+
+    def add_documents(self, docs: Iterable[Document]):
+        for doc in docs:
+            self.add(doc.metadata["chunk_id"], doc.page_content, doc.metadata)
+
+    def _remove(self, chunk_id: str) -> bool:
+        entry = self._docs.pop(chunk_id, None)
+        if entry is None:
+            return False
+        self._total_len -= entry["len"]
+        for term in entry["tf"]:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self._postings[term]
+        return True
+
+    def remove(self, chunk_ids: Iterable[str]) -> int:
+        with self._lock:
+            removed = sum(1 for cid in chunk_ids if self._remove(cid))
+            self._dirty = self._dirty or removed > 0
+        return removed
+
+    def search(self, query: str, k: int = 6) -> List[Tuple[Document, float]]:
+        """返回BM25得分最高的 k 个块（仅包含至少命中一个查询词的块）"""
+        terms = set(tokenize(query))
+        self.refresh()
+        with self._lock:
+            n_docs = len(self._docs)
+            if not terms or n_docs == 0:
+                return []
+            avg_len = self._total_len / n_docs or 1.0
+            scores: Dict[str, float] = {}
+            for term in terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1.0 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for cid, freq in posting.items():
+                    norm = self.k1 * (1.0 - self.b + self.b * self._docs[cid]["len"] / avg_len)
+                    scores[cid] = scores.get(cid, 0.0) + idf * freq * (self.k1 + 1.0) / (freq + norm)
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(Document(page_content=self._docs[cid]["text"], metadata=dict(self._docs[cid]["metadata"])), score)
+                    for cid, score in top]
+
+    def save(self):
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            payload = {"docs": {cid: {"text": e["text"], "metadata": e["metadata"], "tf": e["tf"]}
+                                for cid, e in self._docs.items()}}
+            self._dirty = False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.path.parent), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.path)
+        self._mtime_ns = self._file_mtime()  # 自己保存的版本无需重新加载
+
+# 代码说明：
+# 1. 功能定位：弥补纯向量检索对故障码、备件号等精确字面匹配召回不足的问题，减少运维人员反复改写提问；
+# 2. 核心逻辑：
+#    - tokenize：代码类片段整体成词（另附去连接符写法），中文优先 jieba 搜索引擎模式，英文单词小写；
+#    - BM25Index：增删均为增量更新倒排表，检索只遍历查询词的倒排表，k1/b 为标准BM25参数；
+#      检索前比较索引文件 mtime，其他进程保存了新索引时在锁外重新加载后整体替换；
+#    - reciprocal_rank_fusion：与向量检索结果按排名融合，两路都靠前的块排名最高；
+#    - is_code_dominated：代码字符占比达到阈值的查询可跳过向量化，只用稀疏索引回答；
+# 3. 注意事项：索引随入库清单一同维护，已有集合首次启用时，重新执行一次入库即可补齐（未变化的块不会重新向量化）；
+#    save 整份重写索引文件，批量入库（src.rag.ingest、load_pdfs_to_db）每次运行只保存一次；
+# 4. 应用场景：SimplePDFRAGAgent 的混合检索，以及 load_pdf_to_db / src.rag.ingest 入库时的同步更新。
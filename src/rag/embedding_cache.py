@@ -0,0 +1,221 @@
+"""
+持久化向量缓存 - 包装 HuggingFaceEmbeddings，相同文本只做一次前向计算
+存储结构（每个模型一个目录，只追加写入）：
+    keys.bin     每行16字节：blake2b(命名空间 + 文本) 摘要，第 i 个摘要对应第 i 行向量
+    vectors.f32  float32 矩阵（行数 × 维度），通过 numpy.memmap 只读映射
+    meta.json    模型名与向量维度
+写入时持有文件锁，先写向量再写摘要（摘要即提交标记），多个 worker 进程可同时读写同一目录。
+只有文档向量落盘；查询向量放在进程内有界 LRU 中（用户提问无限增长，落盘会让缓存目录只增不减）。
+"""
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables.config import run_in_executor
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DIGEST_SIZE = 16
+
+try:
+    import fcntl
+
+    @contextlib.contextmanager
+    def _locked(lock_path: Path):
+        with open(lock_path, "a+b") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+except ImportError:  # Windows
+    import msvcrt
+
+    @contextlib.contextmanager
+    def _locked(lock_path: Path):
+        with open(lock_path, "a+b") as f:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class DiskEmbeddingStore:
+    """内容寻址的向量存储：摘要 → 行号索引常驻内存，向量矩阵内存映射"""
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.keys_path = self.directory / "keys.bin"
+        self.vectors_path = self.directory / "vectors.f32"
+        self.meta_path = self.directory / "meta.json"
+        self.lock_path = self.directory / ".lock"
+        self.dim: Optional[int] = None
+        self._index: Dict[bytes, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        if self.meta_path.exists():
+            self.dim = json.loads(self.meta_path.read_text(encoding="utf-8"))["dim"]
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _refresh(self):
+        """增量读取其他进程追加的摘要，并按需重新映射向量矩阵（调用方持有线程锁）"""
+        if not self.keys_path.exists():
+            return
+        rows = self.keys_path.stat().st_size // DIGEST_SIZE
+        known = len(self._index)
+        if rows <= known:
+            return
+        if self.dim is None:
+            self.dim = json.loads(self.meta_path.read_text(encoding="utf-8"))["dim"]
+        with open(self.keys_path, "rb") as f:
+            f.seek(known * DIGEST_SIZE)
+            data = f.read((rows - known) * DIGEST_SIZE)
+        for i in range(rows - known):
+            self._index.setdefault(data[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE], known + i)
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def get_many(self, digests: List[bytes]) -> Dict[bytes, List[float]]:
+        with self._lock:
+            if any(d not in self._index for d in digests):
+                self._refresh()
+            found = {d: self._index[d] for d in digests if d in self._index}
+            return {d: self._matrix[row].tolist() for d, row in found.items()}
+
+    def put_many(self, digests: List[bytes], vectors: List[List[float]]):
+        if not digests:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        with self._lock, _locked(self.lock_path):
+            if self.dim is None:
+                self.dim = int(matrix.shape[1])
+                self.meta_path.write_text(json.dumps({"dim": self.dim}), encoding="utf-8")
+            self._refresh()
+            # 其他进程可能已写入相同文本，只追加仍缺失的
+            fresh, seen = [], set()
+            for i, d in enumerate(digests):
+                if d not in self._index and d not in seen:
+                    fresh.append(i)
+                    seen.add(d)
+            if not fresh:
+                return
+            rows = self.keys_path.stat().st_size // DIGEST_SIZE if self.keys_path.exists() else 0
+            # 行号由摘要文件决定：向量写在 rows 行处（覆盖上次崩溃残留的未提交数据）
+            mode = "r+b" if self.vectors_path.exists() else "w+b"
+            with open(self.vectors_path, mode) as f:
+                f.seek(rows * self.dim * 4)
+                f.write(matrix[fresh].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(digests[i] for i in fresh))
+                f.flush()
+            self._refresh()
+
+
+class CachedEmbeddings(Embeddings):
+    """带缓存的 Embeddings 包装器：文档向量持久化（键为 模型名 + 文本哈希），查询向量进程内 LRU"""
+    def __init__(self, base: Embeddings, model_name: str, cache_dir: str, query_cache_size: int = 2048):
+        self.base = base
+        self.model_name = model_name
+        directory = Path(cache_dir)
+        if not directory.is_absolute():
+            directory = PROJECT_ROOT / directory
+        self.store = DiskEmbeddingStore(directory / model_name.replace("/", "__"))
+        self.query_cache_size = query_cache_size
+        self._queries: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._query_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, namespace: str, text: str) -> bytes:
+        # 查询与文档分命名空间：部分模型对 query 会加指令前缀，两者向量不一定相同
+        return hashlib.blake2b(f"{self.model_name}\0{namespace}\0{text}".encode("utf-8"),
+                               digest_size=DIGEST_SIZE).digest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        digests = [self._digest("doc", t) for t in texts]
+        cached = self.store.get_many(digests)
+        missing: Dict[bytes, str] = {}
+        for d, t in zip(digests, texts):
+            if d not in cached:
+                missing.setdefault(d, t)
+        self.hits += len(texts) - sum(1 for d in digests if d not in cached)
+        self.misses += len(missing)
+        if missing:
+            miss_digests = list(missing.keys())
+            vectors = self.base.embed_documents([missing[d] for d in miss_digests])
+            self.store.put_many(miss_digests, vectors)
+            cached.update(zip(miss_digests, vectors))
+        return [list(cached[d]) for d in digests]
+
+    def _query_get(self, digest: bytes) -> Optional[List[float]]:
+        with self._query_lock:
+            vector = self._queries.get(digest)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._queries.move_to_end(digest)
+            self.hits += 1
+            return list(vector)
+
+    def _query_put(self, digest: bytes, vector: List[float]):
+        if self.query_cache_size <= 0:
+            return
+        with self._query_lock:
+            self._queries[digest] = list(vector)
+            self._queries.move_to_end(digest)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        digest = self._digest("query", text)
+        cached = self._query_get(digest)
+        if cached is not None:
+            return cached
+        vector = self.base.embed_query(text)
+        self._query_put(digest, vector)
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await run_in_executor(None, self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # 查询缓存在内存中，直接查；未命中时等待底层模型的异步接口（微批处理时不占用线程池线程）
+        digest = self._digest("query", text)
+        cached = self._query_get(digest)
+        if cached is not None:
+            return cached
+        vector = await self.base.aembed_query(text)
+        self._query_put(digest, vector)
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.store),
+            "query_entries": len(self._queries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+# 代码说明：
+# 1. 功能定位：无GPU节点上BGE前向计算是入库与查询的主要开销，重复入库或重复提问时改为一次查表；
+# 2. 核心逻辑：
+#    - DiskEmbeddingStore：摘要文件与向量文件按行对应，只追加；读取时增量加载新摘要并重新memmap；
+#    - 写入流程：文件锁 → 刷新索引去重 → 在“已提交行数”处写向量并fsync → 追加摘要（提交）；
+#    - CachedEmbeddings：批量查缓存，仅对缺失文本调用底层模型，结果写回缓存；
+#    - 查询向量只进进程内有界LRU（query_cache_size条），不落盘、不fsync、不持有文件锁；
+# 3. 技术特点：多进程共享同一缓存目录；崩溃时未提交的向量数据会在下次写入时被覆盖；
+# 4. 应用场景：包装 SimplePDFRAGAgent / MultiModalRAGAgent 使用的 HuggingFaceEmbeddings。
@@ -0,0 +1,308 @@
+"""
+知识库批量入库流水线 - 目录/通配符批量导入PDF
+流水线：页面抽取（进程池） → 结构感知流式切片 → 定长批量向量化 → 有界批量写入Milvus（带背压）
+所有阶段之间都是有界缓冲，内存占用与语料总量无关；基于入库清单增量同步，只向量化变化的部分。
+
+运行：
+    python -m src.rag.ingest "docs/**/*.pdf" --workers 4
+"""
+import argparse
+import glob
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from langchain_core.documents import Document
+
+from src.rag.manifest import chunk_id, delete_chunks, file_sha256
+
+
+class IngestConfig:
+    PAGES_PER_TASK: int = 16        # 每个进程池任务抽取的页数
+    INSERT_BATCH_SIZE: int = 512    # 单次写入Milvus的向量条数
+    MAX_PENDING_INSERTS: int = 4    # 待写入批次上限，超过后向量化阶段阻塞（背压）
+
+    @staticmethod
+    def default_workers() -> int:
+        return max(1, (os.cpu_count() or 2) - 1)
+
+    @staticmethod
+    def default_embed_batch_size(device: str) -> int:
+        """CPU 上按核数给出批大小（过大只会增加延迟不增加吞吐），GPU 上用大批次"""
+        if device.startswith("cuda"):
+            return 128
+        return max(8, min(64, 4 * (os.cpu_count() or 2)))
+
+
+def expand_paths(patterns: Iterable[str]) -> List[str]:
+    """展开目录与通配符，返回去重后的PDF路径列表"""
+    paths = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            matched = glob.glob(str(path / "**" / "*.pdf"), recursive=True)
+        else:
+            matched = glob.glob(pattern, recursive=True)
+        paths.extend(p for p in matched if p.lower().endswith(".pdf"))
+    return sorted(set(paths))
+
+
+def _count_pages(pdf_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(pdf_path).pages)
+
+
+def _extract_pages(task: Tuple[str, int, int]) -> Tuple[str, List[Tuple[int, str]]]:
+    """进程池任务：抽取 [start, end) 页的文本，页码与 PyPDFLoader 一致（从0开始）"""
+    from pypdf import PdfReader
+    pdf_path, start, end = task
+    reader = PdfReader(pdf_path)
+    return pdf_path, [(i, reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def _iter_tasks(pdf_paths: List[str], pages_per_task: int) -> Iterator[Tuple[str, int, int]]:
+    for pdf_path in pdf_paths:
+        total = _count_pages(pdf_path)
+        for start in range(0, total, pages_per_task):
+            yield pdf_path, start, min(start + pages_per_task, total)
+
+
+def _iter_page_batches(pdf_paths: List[str], workers: int, pages_per_task: int) -> Iterator[Tuple[str, List[Tuple[int, str]]]]:
+    """有界提交：在途任务数不超过 2×workers，按提交顺序产出结果"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for task in _iter_tasks(pdf_paths, pages_per_task):
+            pending.append(executor.submit(_extract_pages, task))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class _Inserter(threading.Thread):
+    """写入线程：从有界队列中按顺序执行删除/写入操作，Milvus写入成功后同步更新BM25稀疏索引"""
+    def __init__(self, vector_store: Any, max_pending: int, bm25: Any = None):
+        super().__init__(daemon=True, name="milvus-inserter")
+        self.vector_store = vector_store
+        self.bm25 = bm25
+        self.batches: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self.error: Exception = None
+        self.inserted = 0
+        self.deleted = 0
+
+    def run(self):
+        while True:
+            op = self.batches.get()
+            if op is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                if op[0] == "delete":
+                    self.deleted += delete_chunks(self.vector_store, op[1])
+                    if self.bm25 is not None:
+                        self.bm25.remove(op[1])
+                else:
+                    _, texts, vectors, metadatas = op
+                    # 先按ID删除再写入（upsert），中断后重跑不会产生重复块
+                    delete_chunks(self.vector_store, [m["chunk_id"] for m in metadatas])
+                    self.vector_store.add_embeddings(texts=texts, embeddings=vectors, metadatas=metadatas)
+                    self.inserted += len(texts)
+                    if self.bm25 is not None:
+                        for text, metadata in zip(texts, metadatas):
+                            self.bm25.add(metadata["chunk_id"], text, metadata)
+            except Exception as e:
+                self.error = e
+
+
+def ingest_pdfs(agent: Any, pdf_paths: List[str], workers: int = None, embed_batch_size: int = None,
+                insert_batch_size: int = IngestConfig.INSERT_BATCH_SIZE,
+                pages_per_task: int = IngestConfig.PAGES_PER_TASK, prune: bool = False) -> Dict[str, float]:
+    """
+    批量增量入库，返回吞吐统计
+    Args:
+        agent: SimplePDFRAGAgent 实例（提供 embeddings / vector_store / chunker / manifest / bm25）
+        pdf_paths: PDF路径列表
+        prune: 是否删除清单中存在、但本次路径列表中已不存在的文件的全部文档块
+    """
+    from src.rag.rag_agent import config as rag_config, get_embedding_device
+
+    workers = workers or IngestConfig.default_workers()
+    # ONNX 运行时固定在 CPU 上推理
+    device = get_embedding_device() if rag_config.EMBEDDING_RUNTIME == "torch" else "cpu"
+    embed_batch_size = embed_batch_size or IngestConfig.default_embed_batch_size(device)
+    manifest = agent.manifest
+    bm25 = agent.bm25
+    inserter = _Inserter(agent.vector_store, IngestConfig.MAX_PENDING_INSERTS, bm25)
+    inserter.start()
+
+    stats = {"files": len(pdf_paths), "files_skipped": 0, "pages": 0, "chunks": 0, "chunks_unchanged": 0}
+    embed_seconds = 0.0
+    buffer: List[Document] = []
+    pending_insert: Tuple[List[str], List[List[float]], List[Dict]] = ([], [], [])
+    start = time.perf_counter()
+
+    # 文件级增量：哈希未变（且稀疏索引完整）的文件不进入抽取流程
+    file_hashes = {}
+    for pdf_path in pdf_paths:
+        file_hash = file_sha256(pdf_path)
+        if agent.is_source_synced(pdf_path, file_hash):
+            stats["files_skipped"] += 1
+        else:
+            file_hashes[pdf_path] = file_hash
+    # 当前文件的切片流与块级比对状态
+    current = {"source": None, "stream": None, "old_ids": set(), "seen_ids": [], "seen_set": set()}
+    load_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def flush_insert(force: bool = False):
+        texts, vectors, metadatas = pending_insert
+        while texts and (force or len(texts) >= insert_batch_size):
+            # put 在队列满时阻塞，向量化阶段随之暂停，实现背压
+            inserter.batches.put(("insert", texts[:insert_batch_size], vectors[:insert_batch_size],
+                                  metadatas[:insert_batch_size]))
+            del texts[:insert_batch_size], vectors[:insert_batch_size], metadatas[:insert_batch_size]
+
+    def embed(docs: List[Document]):
+        nonlocal embed_seconds
+        t0 = time.perf_counter()
+        texts = [d.page_content for d in docs]
+        vectors = agent.embeddings.embed_documents(texts)
+        embed_seconds += time.perf_counter() - t0
+        pending_insert[0].extend(texts)
+        pending_insert[1].extend(vectors)
+        pending_insert[2].extend(d.metadata for d in docs)
+        stats["chunks"] += len(docs)
+        flush_insert()
+
+    def take(docs: List[Document]):
+        """切片产出的块：与清单比对，未变化的跳过，新块进入向量化缓冲"""
+        for doc in docs:
+            cid = chunk_id(current["source"], doc.page_content)
+            if cid in current["seen_set"]:
+                continue
+            current["seen_ids"].append(cid)
+            current["seen_set"].add(cid)
+            if cid in current["old_ids"]:
+                stats["chunks_unchanged"] += 1
+                # 未变化的块无需向量化，仅在稀疏索引缺失时补齐
+                if bm25 is not None and cid not in bm25:
+                    bm25.add(cid, doc.page_content, dict(doc.metadata, chunk_id=cid))
+                continue
+            doc.metadata.update({
+                "chunk_id": cid,
+                "load_time": load_time,
+                "content_type": "text",
+                "embedding_model": rag_config.EMBEDDING_MODEL,
+            })
+            buffer.append(doc)
+
+    def finish_file():
+        """文件全部页处理完：输出切片流中剩余的块，删除消失的块并更新清单"""
+        source = current["source"]
+        if source is None:
+            return
+        take(current["stream"].close())
+        removed = current["old_ids"] - current["seen_set"]
+        if removed:
+            inserter.batches.put(("delete", list(removed)))
+        manifest.set(source, file_hashes[source], current["seen_ids"])
+
+    try:
+        for pdf_path, pages in _iter_page_batches(list(file_hashes), workers, pages_per_task):
+            if pdf_path != current["source"]:
+                finish_file()
+                current.update(source=pdf_path, stream=agent.chunker.stream({"source": pdf_path}),
+                               old_ids=manifest.chunk_ids(pdf_path), seen_ids=[], seen_set=set())
+            stats["pages"] += len(pages)
+            # 按页顺序喂入切片流：跨页的段落/表格在下一批页面到达后才输出
+            for page_no, text in pages:
+                take(current["stream"].feed(page_no, text))
+            while len(buffer) >= embed_batch_size:
+                embed(buffer[:embed_batch_size])
+                del buffer[:embed_batch_size]
+            if inserter.error is not None:
+                raise inserter.error
+        finish_file()
+        while len(buffer) >= embed_batch_size:
+            embed(buffer[:embed_batch_size])
+            del buffer[:embed_batch_size]
+        if buffer:
+            embed(buffer)
+            buffer.clear()
+        flush_insert(force=True)
+        if prune:
+            wanted = set(pdf_paths)
+            for source in manifest.sources():
+                if source not in wanted:
+                    inserter.batches.put(("delete", list(manifest.remove(source))))
+    finally:
+        inserter.batches.put(None)
+        inserter.join()
+    if inserter.error is not None:
+        raise inserter.error
+    # 全部写入成功后再落盘清单，失败时下次重跑会重新比对（写入为upsert，不会重复）
+    manifest.save()
+    if bm25 is not None:
+        bm25.save()
+    if inserter.inserted or inserter.deleted:
+        agent._on_collection_changed()
+
+    elapsed = time.perf_counter() - start
+    stats.update({
+        "chunks_deleted": inserter.deleted,
+        "seconds": round(elapsed, 3),
+        "embed_seconds": round(embed_seconds, 3),
+        "pages_per_sec": round(stats["pages"] / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_sec": round(stats["chunks"] / elapsed, 2) if elapsed else 0.0,
+        "workers": workers,
+        "embed_batch_size": embed_batch_size,
+    })
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导入PDF到RAG知识库")
+    parser.add_argument("patterns", nargs="+", help="PDF文件、目录或通配符（支持 **）")
+    parser.add_argument("--workers", type=int, default=None, help="页面抽取进程数")
+    parser.add_argument("--embed-batch-size", type=int, default=None)
+    parser.add_argument("--insert-batch-size", type=int, default=IngestConfig.INSERT_BATCH_SIZE)
+    parser.add_argument("--prune", action="store_true", help="删除清单中已不存在于本次路径列表的文件")
+    args = parser.parse_args()
+
+    from llm_db_config.chatmodel import llm_no_think
+    from src.rag.rag_agent import SimplePDFRAGAgent
+
+    pdf_paths = expand_paths(args.patterns)
+    if not pdf_paths:
+        print("❌ 未匹配到任何PDF文件")
+        return
+    print(f"📚 共匹配 {len(pdf_paths)} 个PDF，开始入库...")
+    agent = SimplePDFRAGAgent(llm=llm_no_think)
+    stats = ingest_pdfs(agent, pdf_paths, workers=args.workers, embed_batch_size=args.embed_batch_size,
+                        insert_batch_size=args.insert_batch_size, prune=args.prune)
+    print(f"✅ 入库完成：{stats['files']}个文件（跳过未变化{stats['files_skipped']}个） / {stats['pages']}页 / "
+          f"新增{stats['chunks']}个文档块（未变化{stats['chunks_unchanged']}，删除{stats['chunks_deleted']}），"
+          f"耗时{stats['seconds']}s（向量化{stats['embed_seconds']}s）")
+    print(f"⏱️ 吞吐：{stats['pages_per_sec']} pages/s，{stats['chunks_per_sec']} chunks/s")
+
+
+if __name__ == "__main__":
+    main()
+
+# 代码说明：
+# 1. 功能定位：大批量手册入库的命令行工具，替代逐个文件调用 load_pdf_to_db 的单线程流程；
+# 2. 流水线设计：
+#    - 页面抽取：按 PAGES_PER_TASK 页切分任务交给进程池，在途任务数有上限，大文件也不会整本驻留内存；
+#    - 切片：沿用 agent.chunker 的流式切片（每个文件一个切片流），保证与 load_pdf_to_db 产出一致的文档块与元数据；
+#    - 向量化：按批大小调用 embed_documents，CPU 批大小随核数调整；
+#    - 写入：独立线程 + 有界队列，写入跟不上时向量化阶段阻塞等待（背压）；
+#    - 增量：文件哈希未变则跳过，块ID已在清单中则不再向量化，消失的块按ID删除；
+#    - 稀疏索引：写入线程在Milvus写入/删除成功后同步更新BM25索引，与清单一起落盘；
+# 3. 可观测性：返回并打印 pages/s、chunks/s、跳过/删除数量与向量化耗时；
+# 4. 应用场景：首次构建知识库，以及手册更新后的增量重新同步。
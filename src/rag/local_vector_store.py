@@ -0,0 +1,756 @@
+"""
+本地向量库 - 进程内嵌入式后端（SimplePDFRAGAgent 可在 Milvus 与本后端之间切换）
+    - 向量：float32 矩阵按行追加写入内存映射文件（np.memmap），不需要整体读入内存，多进程可共享页缓存；
+    - 文本与元数据：SQLite（WAL）docs 表，行号即矩阵行号，chunk_id 建索引，元数据过滤用 json_extract；
+    - 检索：小规模按块批量点积暴力检索（结果精确）；规模超过阈值后使用 IVF（NumPy k-means 粗聚类）
+      或 HNSW（可选依赖 hnswlib）近似索引，索引之后新增的行仍走暴力检索，不会漏召回；
+    - 删除：逻辑删除（存活位图），死行比例超过阈值时压缩重写，文件按代数（generation）命名，切换是原子的；
+    - 多进程：写入持有目录文件锁；info.version 在每次增删后递增，检索/写入前发现版本变化时在文件锁内
+      增量读取其他进程追加的行（有删除或压缩时整体重读），多个 worker 共享同一目录。
+距离与 Milvus 的 L2 度量一致（平方欧氏距离），cosine_similarity_score_fn 可直接复用。
+"""
+import atexit
+import json
+import math
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from src.rag.embedding_cache import _locked
+from src.rag.manifest import PROJECT_ROOT
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    row INTEGER PRIMARY KEY,
+    chunk_id TEXT,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_docs_chunk_id ON docs (chunk_id);
+CREATE TABLE IF NOT EXISTS info (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_FILTER_KEY_RE = re.compile(r"^\w+$")
+_SQL_BATCH = 900  # 单条 SQL 的参数个数上限（SQLite 默认 999）
+
+
+class _MatrixFile:
+    """按行追加的 float32 内存映射矩阵，容量不足时按倍数扩容"""
+    def __init__(self, path: Path, dim: int):
+        self.path = path
+        self.dim = dim
+        self.path.touch(exist_ok=True)
+        self.capacity = self.path.stat().st_size // (4 * dim)
+        self.array: Optional[np.memmap] = self._open()
+
+    def _open(self) -> Optional[np.memmap]:
+        if self.capacity == 0:
+            return None
+        return np.memmap(self.path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def ensure(self, rows: int):
+        if rows <= self.capacity:
+            return
+        self.flush()
+        # 旧映射交给 GC 释放，正在使用旧映射的检索不受影响
+        self.capacity = max(rows, self.capacity * 2, 1024)
+        with open(self.path, "r+b") as f:
+            f.truncate(self.capacity * self.dim * 4)
+        self.array = self._open()
+
+    def reopen(self):
+        """其他进程扩容了文件时重新映射"""
+        capacity = self.path.stat().st_size // (4 * self.dim)
+        if capacity > self.capacity:
+            self.capacity = capacity
+            self.array = self._open()
+
+    def flush(self):
+        if self.array is not None:
+            self.array.flush()
+
+
+def _topk(dists: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """取距离最小的 k 个（升序），跳过已删除/被过滤（inf）的行"""
+    if len(dists) > k:
+        idx = np.argpartition(dists, k)[:k]
+        dists, rows = dists[idx], rows[idx]
+    order = np.argsort(dists, kind="stable")
+    dists, rows = dists[order], rows[order]
+    keep = np.isfinite(dists)
+    return rows[keep], dists[keep]
+
+
+def _sq_l2(vectors: np.ndarray, norms: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """平方欧氏距离矩阵（len(queries) × len(vectors)）：|x|² - 2·q·x + |q|²"""
+    q_norms = np.einsum("ij,ij->i", queries, queries)
+    dists = norms[None, :] - 2.0 * (queries @ vectors.T)
+    dists += q_norms[:, None]
+    np.maximum(dists, 0.0, out=dists)
+    return dists
+
+
+def _nearest_centroid(x: np.ndarray, centroids: np.ndarray, block_rows: int = 8192) -> np.ndarray:
+    c_norms = np.einsum("ij,ij->i", centroids, centroids)
+    out = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), block_rows):
+        block = np.asarray(x[start:start + block_rows], dtype=np.float32)
+        out[start:start + len(block)] = np.argmin(c_norms[None, :] - 2.0 * (block @ centroids.T), axis=1)
+    return out
+
+
+class _IVFIndex:
+    """倒排文件索引：k-means 粗聚类，查询时只扫描距离最近的 nprobe 个簇"""
+    kind = "ivf"
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, rows: np.ndarray, built: int):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.built = built  # 建索引时的总行数，之后追加的行由暴力检索补充
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, alive: np.ndarray, count: int, iters: int = 8,
+              seed: int = 0) -> "_IVFIndex":
+        live = np.flatnonzero(alive[:count])
+        nlist = int(min(4096, len(live), max(16, math.sqrt(len(live)))))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(live, min(len(live), nlist * 64), replace=False))
+        x = np.asarray(vectors[sample], dtype=np.float32)
+        centroids = x[rng.choice(len(x), nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = _nearest_centroid(x, centroids)
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=nlist)
+            nonempty = np.flatnonzero(counts)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+            centroids[nonempty] = np.add.reduceat(x[order], starts, axis=0) / counts[nonempty, None]
+        # 全量分配按块读取内存映射文件，不一次性复制全部向量
+        assign = np.concatenate([_nearest_centroid(vectors[live[start:start + 65536]], centroids)
+                                 for start in range(0, len(live), 65536)])
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+        return cls(centroids, offsets, live[order], count)
+
+    def search(self, vectors: np.ndarray, norms: np.ndarray, alive: np.ndarray, query: np.ndarray,
+               k: int, nprobe: int = 16) -> Tuple[np.ndarray, np.ndarray]:
+        c_dists = np.einsum("ij,ij->i", self.centroids, self.centroids) - 2.0 * (self.centroids @ query)
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argpartition(c_dists, nprobe - 1)[:nprobe]
+        rows = np.concatenate([self.rows[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+        rows = np.sort(rows[alive[rows]])  # 顺序访问内存映射文件
+        if len(rows) == 0:
+            return rows, np.empty(0, np.float32)
+        return _topk(_sq_l2(vectors[rows], norms[rows], query[None, :])[0], rows, k)
+
+    def save(self, path: Path):
+        with open(path, "wb") as f:
+            np.savez(f, centroids=self.centroids, offsets=self.offsets, rows=self.rows, built=np.int64(self.built))
+
+    @classmethod
+    def load(cls, path: Path, dim: int) -> "_IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["offsets"], data["rows"], int(data["built"]))
+
+
+class _HNSWIndex:
+    """HNSW 图索引（hnswlib），支持增量写入与标记删除"""
+    kind = "hnsw"
+
+    def __init__(self, index: Any, built: int, deleted: int = 0):
+        self.index = index
+        self.built = built
+        self.deleted = deleted
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import hnswlib  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, alive: np.ndarray, count: int, m: int = 16, ef_construction: int = 200,
+              ef: int = 64, block_rows: int = 65536) -> "_HNSWIndex":
+        import hnswlib
+        index = hnswlib.Index(space="l2", dim=vectors.shape[1])
+        index.init_index(max_elements=max(1024, count * 2), M=m, ef_construction=ef_construction)
+        index.set_ef(ef)
+        built = cls(index, 0)
+        for start in range(0, count, block_rows):
+            rows = np.arange(start, min(count, start + block_rows))
+            rows = rows[alive[rows]]
+            if len(rows):
+                built.add(rows, np.asarray(vectors[rows], dtype=np.float32))
+        built.built = count
+        return built
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        needed = self.index.get_current_count() + len(rows)
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(max(needed, self.index.get_max_elements() * 2))
+        self.index.add_items(vectors, rows)
+        self.built = max(self.built, int(rows.max()) + 1)
+
+    def mark_deleted(self, rows: Iterable[int]):
+        for row in rows:
+            try:
+                self.index.mark_deleted(int(row))
+                self.deleted += 1
+            except RuntimeError:  # 该行不在索引中（例如写入后尚未保存就重启）
+                pass
+
+    def search(self, vectors: np.ndarray, norms: np.ndarray, alive: np.ndarray, query: np.ndarray,
+               k: int, nprobe: int = 16) -> Tuple[np.ndarray, np.ndarray]:
+        # 请求数超过未删除元素数时 hnswlib 会报错，此时减小 k 重试
+        k = min(k, self.index.get_current_count() - self.deleted)
+        while k > 0:
+            try:
+                labels, dists = self.index.knn_query(query[None, :], k=k)
+                break
+            except RuntimeError:
+                k //= 2
+        else:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        rows, dists = labels[0].astype(np.int64), dists[0]
+        keep = alive[rows]
+        return rows[keep], dists[keep]
+
+    def save(self, path: Path):
+        self.index.save_index(str(path))
+
+    @classmethod
+    def load(cls, path: Path, dim: int, built: int, ef: int = 64) -> "_HNSWIndex":
+        import hnswlib
+        index = hnswlib.Index(space="l2", dim=dim)
+        index.load_index(str(path))
+        index.set_ef(ef)
+        return cls(index, built)
+
+
+class LocalVectorStore(VectorStore):
+    """进程内向量库：内存映射 float32 矩阵 + SQLite 文本/元数据，可选 IVF/HNSW 近似索引"""
+    def __init__(self, embedding_function: Optional[Embeddings], path: str, ann: str = "auto",
+                 ann_min_rows: int = 100_000, nprobe: int = 16, block_rows: int = 65536,
+                 compact_ratio: float = 0.3, hnsw_m: int = 16, hnsw_ef: int = 64):
+        """
+        Args:
+            path: 存储目录（相对路径基于项目根目录）
+            ann: 近似索引类型 none / ivf / hnsw / auto（auto：已安装 hnswlib 用 HNSW，否则 IVF）
+            ann_min_rows: 存活行数达到该值才建近似索引，之下为精确的暴力检索
+            nprobe: IVF 每次查询扫描的簇数
+            compact_ratio: 删除导致的死行比例超过该值时压缩存储
+        """
+        if ann not in ("none", "ivf", "hnsw", "auto"):
+            raise ValueError(f"不支持的近似索引类型：{ann}")
+        if ann == "auto":
+            ann = "hnsw" if _HNSWIndex.available() else "ivf"
+        elif ann == "hnsw" and not _HNSWIndex.available():
+            print("⚠️  未安装hnswlib，近似索引改用IVF")
+            ann = "ivf"
+        self.embedding_function = embedding_function
+        self.ann_kind = ann
+        self.ann_min_rows = ann_min_rows
+        self.nprobe = nprobe
+        self.block_rows = block_rows
+        self.compact_ratio = compact_ratio
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef = hnsw_ef
+
+        directory = Path(path)
+        if not directory.is_absolute():
+            directory = PROJECT_ROOT / directory
+        directory.mkdir(parents=True, exist_ok=True)
+        self.directory = directory
+        self.lock_path = directory / ".lock"
+        self._lock = threading.RLock()
+        self._building = False
+        self._conn = sqlite3.connect(str(directory / "docs.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+        info = self._info()
+        self.dim: Optional[int] = int(info["dim"]) if "dim" in info else None
+        self._generation = int(info.get("generation", 0))
+        self._version = int(info.get("version", 0))
+        self._deletes = int(info.get("deletes", 0))
+        self._row_by_chunk: Dict[str, int] = {}
+        self._load_rows(info)
+        self._vectors: Optional[_MatrixFile] = None
+        self._norms: Optional[_MatrixFile] = None
+        self._ann: Any = None
+        if self.dim is not None:
+            self._open_files()
+            self._load_ann(info)
+            self._maybe_build_ann()
+        atexit.register(self.close)
+
+    # ---------- 多进程同步 ----------
+    def _info(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT key, value FROM info").fetchall())
+
+    def _load_rows(self, info: Dict[str, str]):
+        """整体读取存活行与 chunk_id 映射（调用方持有线程锁或处于构造阶段）"""
+        row_by_chunk: Dict[str, int] = {}
+        live_rows = []
+        for row, cid in self._conn.execute("SELECT row, chunk_id FROM docs"):
+            live_rows.append(row)
+            if cid is not None:
+                row_by_chunk[cid] = row
+        # 行号只增不减（压缩除外），末尾的行被删除后重启也不会复用旧行号
+        self._count = max(int(info.get("count", 0)), max(live_rows) + 1 if live_rows else 0)
+        # 换新数组而不是原地修改：进行中的检索仍持有旧快照
+        alive = np.zeros(max(1024, self._count), dtype=bool)
+        alive[live_rows] = True
+        self._alive, self._row_by_chunk = alive, row_by_chunk
+
+    def _refresh(self):
+        """读取其他进程提交的增删与压缩（调用方持有线程锁与文件锁）：
+        只有追加时增量读取新行；有删除或压缩（代数变化）时整体重读"""
+        info = self._info()
+        version = int(info.get("version", 0))
+        if version == self._version:
+            return
+        if self.dim is None and "dim" in info:
+            self.dim = int(info["dim"])
+            self._open_files()
+        generation, deletes = int(info.get("generation", 0)), int(info.get("deletes", 0))
+        old_alive, old_count = self._alive, self._count
+        if generation != self._generation:
+            self._generation = generation
+            self._load_rows(info)
+            if self.dim is not None:
+                self._open_files()
+            self._ann = None
+            self._load_ann(info)
+        else:
+            if deletes != self._deletes:
+                self._load_rows(info)
+            else:
+                count = int(info.get("count", 0))
+                if count > self._count:
+                    self._grow_alive(count)
+                    for row, cid in self._conn.execute("SELECT row, chunk_id FROM docs WHERE row >= ?",
+                                                       (self._count,)):
+                        self._alive[row] = True
+                        if cid is not None:
+                            self._row_by_chunk[cid] = row
+                    self._count = count
+            if self._vectors is not None:
+                self._vectors.reopen()
+                self._norms.reopen()
+            if isinstance(self._ann, _HNSWIndex):
+                # HNSW 为本进程内存中的图：补齐其他进程的增删
+                built = min(self._ann.built, old_count)
+                self._ann.mark_deleted(np.flatnonzero(old_alive[:built] & ~self._alive[:built]))
+                added = np.flatnonzero(self._alive[old_count:self._count]) + old_count
+                if len(added):
+                    self._ann.add(added, np.asarray(self._vectors.array[added], dtype=np.float32))
+        self._version, self._deletes = version, deletes
+
+    def _sync(self):
+        """检索前检查版本号（一次 SQLite 点查），有变化时在文件锁内刷新（调用方持有线程锁）"""
+        row = self._conn.execute("SELECT value FROM info WHERE key = 'version'").fetchone()
+        version = int(row[0]) if row else 0
+        if version != self._version:
+            with _locked(self.lock_path):
+                self._refresh()
+
+    def _bump(self, deleted: bool = False):
+        """提交增删前递增版本号（调用方持有文件锁，已刷新到最新版本）"""
+        self._version += 1
+        updates = [("version", str(self._version))]
+        if deleted:
+            self._deletes += 1
+            updates.append(("deletes", str(self._deletes)))
+        self._conn.executemany("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", updates)
+
+    # ---------- 文件与近似索引 ----------
+    def _file(self, name: str, generation: Optional[int] = None) -> Path:
+        return self.directory / f"{name}-{self._generation if generation is None else generation}"
+
+    def _open_files(self):
+        self._vectors = _MatrixFile(self._file("vectors.f32"), self.dim)
+        self._norms = _MatrixFile(self._file("norms.f32"), 1)
+
+    def _ann_path(self, kind: str) -> Path:
+        return self._file(f"{kind}.idx")
+
+    def _load_ann(self, info: Dict[str, str]):
+        state = json.loads(info.get("ann", "{}"))
+        if state.get("kind") != self.ann_kind or state.get("generation") != self._generation:
+            return
+        path = self._ann_path(self.ann_kind)
+        if not path.exists():
+            return
+        if self.ann_kind == "ivf":
+            self._ann = _IVFIndex.load(path, self.dim)
+            return
+        self._ann = _HNSWIndex.load(path, self.dim, state["built"], self.hnsw_ef)
+        # 索引保存之后的增删在重启时补齐
+        built = self._ann.built
+        self._ann.mark_deleted(np.flatnonzero(~self._alive[:built]))
+        missing = np.flatnonzero(self._alive[built:self._count]) + built
+        if len(missing):
+            self._ann.add(missing, np.asarray(self._vectors.array[missing], dtype=np.float32))
+
+    def _maybe_build_ann(self):
+        """存活行数达到阈值时建索引；IVF 在索引后新增行超过一半时重建（HNSW 为增量写入，无需重建）
+        构建在线程锁外进行（检索与写入照常），完成后整体替换；调用方不能持有线程锁"""
+        with self._lock:
+            if self.ann_kind == "none" or self.dim is None or self._building:
+                return
+            live = int(self._alive[:self._count].sum())
+            if live < max(self.ann_min_rows, 16):
+                self._ann = None
+                return
+            if self._ann is not None and (self._ann.kind == "hnsw"
+                                          or self._count - self._ann.built <= self._ann.built // 2):
+                return
+            self._building = True
+            vectors, alive, count, generation = self._vectors.array, self._alive[:self._count].copy(), \
+                self._count, self._generation
+        try:
+            print(f"🧭 正在构建{self.ann_kind.upper()}近似索引：{live}条向量")
+            if self.ann_kind == "ivf":
+                ann = _IVFIndex.build(vectors, alive, count)
+            else:
+                ann = _HNSWIndex.build(vectors, alive, count, m=self.hnsw_m, ef=self.hnsw_ef)
+            with self._lock:
+                if generation != self._generation:
+                    return  # 构建期间发生了压缩，行号已重排，丢弃
+                if isinstance(ann, _HNSWIndex):
+                    # 构建期间的增删补到图中（IVF 之后的行由暴力检索补充，删除由存活位图过滤）
+                    ann.mark_deleted(np.flatnonzero(alive & ~self._alive[:count]))
+                    added = np.flatnonzero(self._alive[count:self._count]) + count
+                    if len(added):
+                        ann.add(added, np.asarray(self._vectors.array[added], dtype=np.float32))
+                self._ann = ann
+                self._save_ann()
+        finally:
+            self._building = False
+
+    def _save_ann(self):
+        if self._ann is None:
+            return
+        self._ann.save(self._ann_path(self._ann.kind))
+        state = {"kind": self._ann.kind, "generation": self._generation, "built": self._ann.built}
+        self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('ann', ?)", (json.dumps(state),))
+        self._conn.commit()
+
+    def _grow_alive(self, rows: int):
+        if rows > len(self._alive):
+            grown = np.zeros(max(rows, len(self._alive) * 2), dtype=bool)
+            grown[:len(self._alive)] = self._alive
+            self._alive = grown
+
+    # ---------- 写入与删除 ----------
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding_function
+
+    def __len__(self) -> int:
+        return int(self._alive[:self._count].sum())
+
+    def add_embeddings(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]],
+                       metadatas: Optional[Sequence[Dict[str, Any]]] = None, **kwargs: Any) -> List[str]:
+        """写入已计算好的向量；带 chunk_id 的块会替换同ID的旧块（幂等）。返回行号ID"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if len(texts) == 0:
+            return []
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("embeddings 必须是与 texts 等长的二维向量列表")
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        with self._lock, _locked(self.lock_path):
+            # 文件锁内先读取其他进程的写入，行号从全局最新的 count 开始分配
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('dim', ?)", (str(self.dim),))
+                self._open_files()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度不一致：期望{self.dim}，实际{vectors.shape[1]}")
+            self._delete_chunk_rows([m["chunk_id"] for m in metadatas if m.get("chunk_id")])
+            start, end = self._count, self._count + len(texts)
+            self._vectors.ensure(end)
+            self._norms.ensure(end)
+            self._vectors.array[start:end] = vectors
+            self._norms.array[start:end, 0] = np.einsum("ij,ij->i", vectors, vectors)
+            # 先落盘向量再提交 SQLite：docs 表中存在的行，其向量一定已写入
+            self._vectors.flush()
+            self._norms.flush()
+            self._conn.executemany(
+                "INSERT INTO docs (row, chunk_id, text, metadata) VALUES (?, ?, ?, ?)",
+                [(row, meta.get("chunk_id"), text, json.dumps(meta, ensure_ascii=False, default=str))
+                 for row, text, meta in zip(range(start, end), texts, metadatas)],
+            )
+            self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('count', ?)", (str(end),))
+            self._bump()
+            self._conn.commit()
+            self._grow_alive(end)
+            self._alive[start:end] = True
+            for row, meta in zip(range(start, end), metadatas):
+                if meta.get("chunk_id"):
+                    self._row_by_chunk[meta["chunk_id"]] = row
+            self._count = end
+            if isinstance(self._ann, _HNSWIndex):
+                self._ann.add(np.arange(start, end), vectors)
+        self._maybe_build_ann()
+        return [str(row) for row in range(start, end)]
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if self.embedding_function is None:
+            raise ValueError("未配置 embedding_function，只能通过 add_embeddings 写入")
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas)
+
+    def _delete_rows(self, rows: List[int]):
+        """按行号删除（调用方持有线程锁与文件锁）"""
+        for start in range(0, len(rows), _SQL_BATCH):
+            batch = rows[start:start + _SQL_BATCH]
+            self._conn.execute(f"DELETE FROM docs WHERE row IN ({','.join('?' * len(batch))})", batch)
+        self._bump(deleted=True)
+        self._conn.commit()
+        self._alive[rows] = False
+        if isinstance(self._ann, _HNSWIndex):
+            self._ann.mark_deleted(rows)
+
+    def _delete_chunk_rows(self, chunk_ids: List[str]) -> bool:
+        """按 chunk_id 删除（调用方持有线程锁与文件锁），返回是否删除了行"""
+        rows = [self._row_by_chunk.pop(cid) for cid in chunk_ids if cid in self._row_by_chunk]
+        if rows:
+            self._delete_rows(rows)
+        return bool(rows)
+
+    def delete_by_chunk_ids(self, chunk_ids: Iterable[str], compact: bool = True) -> int:
+        """按 chunk_id 删除（增量入库使用），返回请求删除的ID个数（与 Milvus 路径一致）"""
+        chunk_ids = list(chunk_ids)
+        with self._lock, _locked(self.lock_path):
+            self._refresh()
+            compacted = self._delete_chunk_rows(chunk_ids) and compact and self._maybe_compact()
+        if compacted:
+            self._maybe_build_ann()
+        return len(chunk_ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """按行号ID删除（add_* 的返回值）；按 chunk_id 删除请使用 delete_by_chunk_ids"""
+        if ids is None:
+            raise ValueError("LocalVectorStore.delete 需要 ids（行号）；按 chunk_id 删除请使用 delete_by_chunk_ids")
+        compacted = False
+        with self._lock, _locked(self.lock_path):
+            self._refresh()
+            rows = [int(i) for i in ids if int(i) < self._count and self._alive[int(i)]]
+            if rows:
+                inverse = {row: cid for cid, row in self._row_by_chunk.items()}
+                for row in rows:
+                    self._row_by_chunk.pop(inverse.get(row), None)
+                self._delete_rows(rows)
+                compacted = self._maybe_compact()
+        if compacted:
+            self._maybe_build_ann()
+        return True
+
+    def _maybe_compact(self) -> bool:
+        """死行比例超过阈值时压缩（调用方持有线程锁与文件锁），返回是否压缩"""
+        dead = self._count - int(self._alive[:self._count].sum())
+        if self._count >= 1024 and dead / self._count >= self.compact_ratio:
+            self._compact()
+            return True
+        return False
+
+    def compact(self):
+        """重写存储去掉死行：新文件写完后在一个事务里重排行号并切换代数，旧文件随后删除"""
+        with self._lock, _locked(self.lock_path):
+            self._refresh()
+            self._compact()
+        self._maybe_build_ann()
+
+    def _compact(self):
+        """压缩实现（调用方持有线程锁与文件锁）；近似索引由调用方在释放锁后重建"""
+        if self.dim is None:
+            return
+        keep = np.flatnonzero(self._alive[:self._count])
+        old_generation, new_generation = self._generation, self._generation + 1
+        vectors = _MatrixFile(self._file("vectors.f32", new_generation), self.dim)
+        norms = _MatrixFile(self._file("norms.f32", new_generation), 1)
+        vectors.ensure(len(keep))
+        norms.ensure(len(keep))
+        for start in range(0, len(keep), self.block_rows):
+            rows = keep[start:start + self.block_rows]
+            vectors.array[start:start + len(rows)] = self._vectors.array[rows]
+            norms.array[start:start + len(rows)] = self._norms.array[rows]
+        vectors.flush()
+        norms.flush()
+        # 行号只会变小，按升序更新不会与尚未移动的行冲突
+        self._conn.executemany("UPDATE docs SET row = ? WHERE row = ?",
+                               [(new, int(old)) for new, old in enumerate(keep) if new != old])
+        self._conn.executemany("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+                               [("generation", str(new_generation)), ("count", str(len(keep)))])
+        self._bump()
+        self._conn.commit()
+        remap = np.full(self._count, -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        self._row_by_chunk = {cid: int(remap[row]) for cid, row in self._row_by_chunk.items()}
+        self._generation, self._vectors, self._norms = new_generation, vectors, norms
+        self._count = len(keep)
+        self._alive = np.zeros(max(1024, self._count), dtype=bool)
+        self._alive[:self._count] = True
+        self._ann = None
+        for name in ("vectors.f32", "norms.f32", "ivf.idx", "hnsw.idx"):
+            self._file(name, old_generation).unlink(missing_ok=True)
+        print(f"🗜️ 本地向量库压缩完成：保留{self._count}条")
+
+    # ---------- 检索 ----------
+    def _filter_rows(self, filter: Dict[str, Any]) -> np.ndarray:
+        """元数据等值过滤（值为列表时表示 IN），返回满足条件的行号"""
+        clauses, params = [], []
+        for key, value in filter.items():
+            if not _FILTER_KEY_RE.match(key):
+                raise ValueError(f"非法的过滤字段：{key}")
+            column = "chunk_id" if key == "chunk_id" else f"json_extract(metadata, '$.{key}')"
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        sql = "SELECT row FROM docs" + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+        with self._lock:
+            rows = [row for (row,) in self._conn.execute(sql, params)]
+        return np.asarray(sorted(rows), dtype=np.int64)
+
+    def _brute_force(self, vectors: np.ndarray, norms: np.ndarray, alive: np.ndarray, queries: np.ndarray,
+                     k: int, start: int, end: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """分块批量点积，对 [start, end) 行做精确检索；queries 可以是多条查询"""
+        best = [(np.empty(0, np.int64), np.empty(0, np.float32)) for _ in range(len(queries))]
+        for block_start in range(start, end, self.block_rows):
+            block_end = min(end, block_start + self.block_rows)
+            dists = _sq_l2(vectors[block_start:block_end], norms[block_start:block_end, 0], queries)
+            dists[:, ~alive[block_start:block_end]] = np.inf
+            block_rows = np.arange(block_start, block_end)
+            for i in range(len(queries)):
+                rows, d = _topk(dists[i], block_rows, k)
+                best[i] = _topk(np.concatenate([best[i][1], d]), np.concatenate([best[i][0], rows]), k)
+        return best
+
+    def _search_subset(self, vectors: np.ndarray, norms: np.ndarray, queries: np.ndarray, rows: np.ndarray,
+                       k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """只在给定行（元数据过滤结果）上精确检索，分块读取避免一次性复制大量向量"""
+        best = [(np.empty(0, np.int64), np.empty(0, np.float32)) for _ in range(len(queries))]
+        for start in range(0, len(rows), self.block_rows):
+            block = rows[start:start + self.block_rows]
+            dists = _sq_l2(vectors[block], norms[block, 0], queries)
+            for i in range(len(queries)):
+                top_rows, top_dists = _topk(dists[i], block, k)
+                best[i] = _topk(np.concatenate([best[i][1], top_dists]), np.concatenate([best[i][0], top_rows]), k)
+        return best
+
+    def search_rows(self, queries: Any, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                    exact: bool = False) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """批量检索，返回每条查询的（行号，平方L2距离），按距离升序；exact=True 时忽略近似索引"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        with self._lock:
+            self._sync()
+            # 快照：检索期间的并发写入只会追加新行，删除通过存活位图生效
+            vectors = self._vectors.array if self._vectors is not None else None
+            norms = self._norms.array if self._norms is not None else None
+            alive, count, ann = self._alive, self._count, self._ann
+        if vectors is None or count == 0:
+            return [(np.empty(0, np.int64), np.empty(0, np.float32)) for _ in queries]
+        if filter:
+            rows = self._filter_rows(filter)
+            rows = rows[rows < count]
+            rows = rows[alive[rows]]
+            return self._search_subset(vectors, norms, queries, rows, k)
+        if ann is None or exact:
+            return self._brute_force(vectors, norms, alive, queries, k, 0, count)
+        results = []
+        for query in queries:
+            if isinstance(ann, _HNSWIndex):
+                with self._lock:
+                    rows, dists = ann.search(vectors, norms[:, 0], alive, query, k, self.nprobe)
+            else:
+                rows, dists = ann.search(vectors, norms[:, 0], alive, query, k, self.nprobe)
+            if ann.built < count:
+                tail_rows, tail_dists = self._brute_force(vectors, norms, alive, query[None, :], k, ann.built, count)[0]
+                rows, dists = _topk(np.concatenate([dists, tail_dists]), np.concatenate([rows, tail_rows]), k)
+            results.append((rows, dists))
+        return results
+
+    def _fetch(self, rows: np.ndarray) -> Dict[int, Document]:
+        if len(rows) == 0:
+            return {}
+        params = [int(r) for r in rows]
+        with self._lock:
+            records = self._conn.execute(
+                f"SELECT row, text, metadata FROM docs WHERE row IN ({','.join('?' * len(params))})", params
+            ).fetchall()
+        return {row: Document(page_content=text, metadata=json.loads(meta)) for row, text, meta in records}
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict[str, Any]] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        while True:
+            generation = self._generation
+            rows, dists = self.search_rows(embedding, k=k, filter=filter)[0]
+            docs = self._fetch(rows)
+            # 检索期间发生压缩（行号重排）时重新检索；检索与读取之间被删除的行直接跳过
+            if generation == self._generation:
+                return [(docs[int(row)], float(dist)) for row, dist in zip(rows, dists) if int(row) in docs]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # 归一化向量的平方L2距离 ∈ [0, 4]，与 Milvus L2 + cosine_similarity_score_fn 的换算一致
+        return lambda distance: 1.0 - distance / 2.0
+
+    @classmethod
+    def from_texts(cls: Type["LocalVectorStore"], texts: List[str], embedding: Embeddings,
+                   metadatas: Optional[List[dict]] = None, path: str = "data/vector_store/default",
+                   **kwargs: Any) -> "LocalVectorStore":
+        store = cls(embedding, path=path, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._norms.flush()
+            if isinstance(self._ann, _HNSWIndex):
+                self._save_ann()  # HNSW 为增量写入，关闭时保存最新状态
+            self._conn.close()
+            self._conn = None
+
+# 代码说明：
+# 1. 功能定位：去掉 RAG 对 Milvus 服务的硬依赖，测试与边缘部署可直接使用本地目录作为向量库；
+# 2. 核心逻辑：
+#    - _MatrixFile：向量与范数各一个内存映射文件，按倍数扩容；写入先落盘向量再提交 SQLite；
+#    - 检索：暴力检索按 block_rows 分块做批量矩阵乘法；IVF/HNSW 只覆盖建索引时的行，之后的行暴力补充；
+#    - 元数据过滤：SQLite json_extract 取出满足条件的行号，再在这些行上做精确检索；
+#    - 删除与压缩：存活位图逻辑删除，死行过多时按新代数重写文件，SQLite 事务内切换；
+# 3. 接口约定：实现 LangChain VectorStore（as_retriever / similarity_search_with_score_by_vector 等），
+#    另提供 add_embeddings 与 delete_by_chunk_ids，与 Milvus 后端在入库流水线中可互换；
+# 4. 应用场景：SimpleRAGConfig.VECTOR_BACKEND = "local" 时由 create_vector_store 创建。
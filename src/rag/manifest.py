@@ -0,0 +1,130 @@
+"""
+知识库入库清单（manifest）- 基于内容哈希的增量索引
+记录每个源文件的文件哈希与其全部文档块的 chunk_id（源路径+文本内容的哈希）：
+    - 文件哈希未变 → 整个文件跳过
+    - 新出现的 chunk_id → 写入（先按ID删除再插入，保证重复执行幂等）
+    - 消失的 chunk_id → 从向量库删除
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """流式计算文件哈希，不把整个文件读入内存"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, text: str) -> str:
+    """文档块ID：同一文件内内容相同的块ID相同，不同文件互不影响"""
+    return hashlib.blake2b(f"{source}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def delete_chunks(vector_store: Any, chunk_ids: Iterable[str], batch_size: int = 1000) -> int:
+    """按 chunk_id 元数据字段分批删除向量（后端提供 delete_by_chunk_ids 时直接调用，否则按 Milvus 表达式删除）"""
+    ids = list(chunk_ids)
+    delete_by_chunk_ids = getattr(vector_store, "delete_by_chunk_ids", None)
+    if delete_by_chunk_ids is not None:
+        return delete_by_chunk_ids(ids)
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        vector_store.delete(expr=f"chunk_id in {json.dumps(batch)}")
+    return len(ids)
+
+
+class IngestManifest:
+    """单个向量集合的入库清单，JSON 文件存储，保存时原子替换"""
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    @classmethod
+    def for_collection(cls, collection_name: str, manifest_dir: str) -> "IngestManifest":
+        directory = Path(manifest_dir)
+        if not directory.is_absolute():
+            directory = PROJECT_ROOT / directory
+        return cls(directory / f"{collection_name}.json")
+
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        return self.files.get(source)
+
+    def is_unchanged(self, source: str, file_hash: str) -> bool:
+        entry = self.files.get(source)
+        return entry is not None and entry.get("file_hash") == file_hash
+
+    def chunk_ids(self, source: str) -> set:
+        entry = self.files.get(source)
+        return set(entry.get("chunks", [])) if entry else set()
+
+    def set(self, source: str, file_hash: str, chunk_ids: List[str]):
+        self.files[source] = {"file_hash": file_hash, "chunks": list(chunk_ids)}
+
+    def remove(self, source: str) -> set:
+        entry = self.files.pop(source, None)
+        return set(entry.get("chunks", [])) if entry else set()
+
+    def sources(self) -> List[str]:
+        return list(self.files.keys())
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.path.parent), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class CollectionVersion:
+    """集合版本号（磁盘计数器）：任一进程（服务或入库命令行）变更集合后递增，其他进程每次读取文件感知变化"""
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._value = 0
+
+    @classmethod
+    def for_collection(cls, collection_name: str, manifest_dir: str) -> "CollectionVersion":
+        directory = Path(manifest_dir)
+        if not directory.is_absolute():
+            directory = PROJECT_ROOT / directory
+        return cls(directory / f"{collection_name}.version")
+
+    def current(self) -> int:
+        """当前版本号：每次都读取文件（只有几个字节）；不按 mtime 缓存，粗粒度 mtime 下同一时刻的两次递增也能感知"""
+        try:
+            self._value = int(self.path.read_text(encoding="utf-8").strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            pass
+        return self._value
+
+    def bump(self) -> int:
+        """版本号加一并原子写回（并发递增时可能合并为一次，但版本号一定发生变化）"""
+        value = self.current() + 1
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.path.parent), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(str(value))
+        os.replace(tmp_path, self.path)
+        return value
+
+# 代码说明：
+# 1. 功能定位：解决重复执行 load_pdf_to_db 导致 auto_id 集合中文档块重复、检索噪声增长的问题；
+# 2. 核心逻辑：
+#    - file_sha256：文件级哈希，未修改的文件直接跳过，无需抽取与向量化；
+#    - chunk_id：块级哈希写入元数据字段 chunk_id，作为增量删除与幂等写入的依据；
+#    - IngestManifest：每个集合一份JSON清单，临时文件+os.replace 原子落盘；
+#    - CollectionVersion：集合版本号落盘，入库命令行变更集合后，服务进程的语义缓存据此失效；
+# 3. 注意事项：chunk_id 需作为集合字段存在（新集合开启 enable_dynamic_field 即可），旧集合需重建一次；
+# 4. 应用场景：由 SimplePDFRAGAgent.load_pdf_to_db 与 src.rag.ingest 批量流水线共用，Milvus 与本地向量库后端通用。
@@ -0,0 +1,121 @@
+"""
+查询向量微批处理 - 合并并发请求的 embed_query，一次批量前向计算后分发结果
+CPU 上批大小为1的前向计算无法发挥矩阵乘法吞吐：
+    - 调用方把查询文本放入队列后等待 Future（同步线程与协程均可等待）；
+    - 后台线程取到第一条后再等待 window_ms 或凑满 max_batch 条，合并为一次 embed_documents 调用；
+    - 模型计算期间到达的请求在队列中自然累积，进入下一批。
+文档向量化（入库）本身已是批量调用，直接透传给底层模型。
+"""
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables.config import run_in_executor
+
+
+class MicroBatchEmbeddings(Embeddings):
+    """embed_query 微批包装器（进程内，线程安全）"""
+    def __init__(self, base: Embeddings, window_ms: float = 5, max_batch: int = 32):
+        self.base = base
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-micro-batch", daemon=True)
+                    self._worker.start()
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                # 窗口到期后仍取走已在队列中的请求（不再等待）
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        # 单批出错只影响该批的调用方，工作线程不退出（否则之后的查询会永远等待）
+        while True:
+            try:
+                self._run_batch(self._collect())
+            except Exception as e:
+                print(f"⚠️ 查询向量微批处理异常：{e}")
+
+    def _run_batch(self, batch: List[Tuple[str, Future]]):
+        # 已取消的请求（协程被取消、调用方超时）跳过；其余标记为运行中，之后不能再被取消
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        # 同一批内相同的问题只计算一次
+        unique: Dict[str, int] = {}
+        for text, _ in batch:
+            unique.setdefault(text, len(unique))
+        try:
+            vectors = self.base.embed_documents(list(unique))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        with self._stats_lock:
+            self.batches += 1
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[unique[text]])
+
+    def _submit(self, text: str) -> Future:
+        self._ensure_worker()
+        future: Future = Future()
+        with self._stats_lock:
+            self.requests += 1
+        self._queue.put((text, future))
+        return future
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # 直接等待 Future，不占用线程池线程：并发数不受执行器线程数限制
+        return await asyncio.wrap_future(self._submit(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await run_in_executor(None, self.base.embed_documents, texts)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+        }
+
+# 代码说明：
+# 1. 功能定位：高并发知识问答时，把多个请求各自的单句 BGE 前向计算合并为一次批量计算，提升 CPU 吞吐；
+# 2. 核心逻辑：
+#    - _collect：以第一条请求为起点，等待 window_ms 或凑满 max_batch 条；
+#    - _run：单个后台线程循环执行批量 embed_documents，结果（或异常）逐个写回 Future；
+#      已取消的 Future 在计算前剔除，单批异常不会结束工作线程；
+#    - aembed_query：协程直接等待 Future，128 个并发请求也只占用一个计算线程；
+# 3. 注意事项：查询按文档方式编码（BGE 在 HuggingFaceEmbeddings 下两者一致，未配置查询指令前缀）；
+# 4. 应用场景：get_embeddings() 中包装 HuggingFaceEmbeddings，位于持久化向量缓存之下（缓存命中不进入批处理）。
@@ -0,0 +1,164 @@
+"""
+PDF 图片并行 OCR 流水线 - 进程池 + 图片去重 + 小图过滤 + 流式产出
+    - 主进程只扫描每页的图片列表：同一 xref 只处理一次（每页重复的 Logo 通常共用 xref），
+      不同 xref 再按原始压缩流的哈希去重，宽高或字节数低于阈值的图标/装饰线直接跳过；
+    - 工作进程各自持有一个 PaddleOCR 模型（initializer 中加载一次），按 (PDF路径, xref) 自行解码图片，
+      主进程不做 PIL/NumPy 解码，也不跨进程传输图片数据；
+    - 配置了二进制存储时，工作进程顺带把图片原件写入内容寻址存储，只把引用返回主进程；
+    - 在途任务数有上限，按提交顺序产出结果，调用方边识别边切片入库，内存占用与页数无关；
+    - 进程池使用 spawn 启动：调用方进程通常已加载 torch/HuggingFace 模型（及其线程池），fork 出的子进程可能死锁。
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+class OCRPipelineConfig:
+    MIN_WIDTH: int = 48            # 宽或高小于该像素数的图片跳过（图标、项目符号、分隔线）
+    MIN_HEIGHT: int = 48
+    MIN_BYTES: int = 2048          # 压缩后小于该字节数的图片跳过
+    IN_FLIGHT_PER_WORKER: int = 2  # 每个工作进程的在途任务数上限
+
+    @staticmethod
+    def default_workers() -> int:
+        return max(1, (os.cpu_count() or 2) - 1)
+
+
+def ocr_text(ocr: Any, img_np: Any) -> str:
+    """PaddleOCR 识别结果按行拼接"""
+    result = ocr.ocr(img_np, cls=True)
+    if not result or not result[0]:
+        return ""
+    return "\n".join(line[1][0] for line in result[0]).strip()
+
+
+def create_ocr(cpu_threads: Optional[int] = None) -> Any:
+    from paddleocr import PaddleOCR  # 百度飞桨OCR
+    kwargs = {"cpu_threads": cpu_threads} if cpu_threads else {}
+    return PaddleOCR(use_angle_cls=True, lang="ch", use_gpu=False, show_log=False, **kwargs)
+
+
+# ---------- 工作进程 ----------
+_worker_ocr: Any = None
+_worker_blobs: Any = None
+_worker_pdf: Dict[str, Any] = {}
+
+
+def _init_worker(cpu_threads: int, blob_root: Optional[str]):
+    global _worker_ocr, _worker_blobs
+    # 多个进程并行时限制每个进程的计算线程数，避免线程数超过核数互相争抢
+    os.environ["OMP_NUM_THREADS"] = str(cpu_threads)
+    _worker_ocr = create_ocr(cpu_threads)
+    if blob_root:
+        from src.rag.blob_store import BlobStore
+        _worker_blobs = BlobStore(blob_root)
+
+
+def _ocr_xref(task: Tuple[str, int]) -> Tuple[Optional[str], str]:
+    import fitz
+    import numpy as np
+    from PIL import Image
+
+    pdf_path, xref = task
+    doc = _worker_pdf.get(pdf_path)
+    if doc is None:
+        for opened in _worker_pdf.values():  # 只缓存当前文件的句柄
+            opened.close()
+        _worker_pdf.clear()
+        doc = _worker_pdf[pdf_path] = fitz.open(pdf_path)
+    image = doc.extract_image(xref)
+    ref = _worker_blobs.put(image["image"]) if _worker_blobs is not None else None
+    img = Image.open(io.BytesIO(image["image"])).convert("RGB")
+    return ref, ocr_text(_worker_ocr, np.array(img))
+
+
+# ---------- 主进程 ----------
+def iter_pdf_image_tasks(pdf_path: str, stats: Dict[str, int], min_width: int = OCRPipelineConfig.MIN_WIDTH,
+                         min_height: int = OCRPipelineConfig.MIN_HEIGHT,
+                         min_bytes: int = OCRPipelineConfig.MIN_BYTES) -> Iterator[Tuple[int, int, int, str]]:
+    """逐页扫描图片，产出需要 OCR 的 (页码从0开始, 页内序号, xref, 内容哈希)，并累计跳过原因"""
+    import fitz
+
+    doc = fitz.open(pdf_path)
+    seen_xrefs, seen_hashes = set(), set()
+    try:
+        for page_num in range(len(doc)):
+            for img_idx, img in enumerate(doc[page_num].get_images(full=True)):
+                xref, width, height = img[0], img[2], img[3]
+                stats["images"] += 1
+                if xref in seen_xrefs:
+                    stats["duplicate_xref"] += 1
+                    continue
+                seen_xrefs.add(xref)
+                if width < min_width or height < min_height:
+                    stats["too_small"] += 1
+                    continue
+                raw = doc.xref_stream_raw(xref) or b""
+                if len(raw) < min_bytes:
+                    stats["too_small"] += 1
+                    continue
+                digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+                if digest in seen_hashes:
+                    stats["duplicate_content"] += 1
+                    continue
+                seen_hashes.add(digest)
+                yield page_num, img_idx, xref, digest
+    finally:
+        doc.close()
+
+
+class ParallelPDFImageOCR:
+    """PDF 图片并行 OCR：进程池在多个文件之间复用（模型只加载一次），close() 时释放"""
+    def __init__(self, workers: Optional[int] = None, min_width: int = OCRPipelineConfig.MIN_WIDTH,
+                 min_height: int = OCRPipelineConfig.MIN_HEIGHT, min_bytes: int = OCRPipelineConfig.MIN_BYTES,
+                 blob_root: Optional[str] = None):
+        self.workers = workers or OCRPipelineConfig.default_workers()
+        self.blob_root = str(blob_root) if blob_root else None
+        self.min_width = min_width
+        self.min_height = min_height
+        self.min_bytes = min_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.stats: Dict[str, int] = {"images": 0, "duplicate_xref": 0, "duplicate_content": 0,
+                                      "too_small": 0, "ocr": 0}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            cpu_threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 initargs=(cpu_threads, self.blob_root),
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def iter_pdf(self, pdf_path: str) -> Iterator[Tuple[int, int, Optional[str], str]]:
+        """按页序产出 (页码从0开始, 页内序号, 图片引用, OCR文本)；重复与过小的图片不产出，未配置存储时引用为 None"""
+        executor = self._pool()
+        pending = deque()
+        limit = self.workers * OCRPipelineConfig.IN_FLIGHT_PER_WORKER
+        tasks = iter_pdf_image_tasks(str(pdf_path), self.stats, self.min_width, self.min_height, self.min_bytes)
+        for page_num, img_idx, xref, _ in tasks:
+            pending.append((page_num, img_idx, executor.submit(_ocr_xref, (str(pdf_path), xref))))
+            if len(pending) >= limit:
+                page_num, img_idx, future = pending.popleft()
+                self.stats["ocr"] += 1
+                yield (page_num, img_idx, *future.result())
+        while pending:
+            page_num, img_idx, future = pending.popleft()
+            self.stats["ocr"] += 1
+            yield (page_num, img_idx, *future.result())
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+# 代码说明：
+# 1. 功能定位：扫描版手册每页都是整页图片，串行 OCR 耗时以小时计；并行化后按核数线性加速；
+# 2. 核心逻辑：
+#    - iter_pdf_image_tasks：只读取图片列表与原始压缩流，xref 去重 → 尺寸/字节过滤 → 内容哈希去重；
+#    - _init_worker / _ocr_xref：每个工作进程一个 PaddleOCR，按 xref 自行解码并写入二进制存储，进程内缓存当前 PDF 句柄；
+#    - ParallelPDFImageOCR.iter_pdf：有界在途任务，按提交顺序产出，stats 记录各类跳过数量；
+# 3. 应用场景：rag_agent0.MultiModalDocumentProcessor 的 PDF 图片抽取，结果流式进入文档块创建与入库。
@@ -0,0 +1,197 @@
+"""
+ONNX 嵌入运行时 - 无GPU节点上 BGE 的 int8 动态量化推理
+    - 导出：transformers 模型经 torch.onnx 导出，再用 onnxruntime 做 int8 动态量化（仅导出时需要 torch）；
+    - 推理：onnxruntime CPU 会话，线程数可配置；按文本长度排序分批，减少 padding 计算；
+    - 池化：与 sentence-transformers 中 bge-base-zh-v1.5 的配置一致，取 [CLS] 向量并 L2 归一化，
+      与已有集合（HuggingFaceEmbeddings + normalize_embeddings）中的向量可直接比较；
+    - 漂移检查：导出时用 PyTorch 计算一组探针文本的参考向量，加载时比对余弦相似度，低于阈值拒绝使用。
+
+导出 / 检查：
+    python -m src.rag.onnx_embeddings export
+    python -m src.rag.onnx_embeddings check
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables.config import run_in_executor
+
+from src.rag.manifest import PROJECT_ROOT
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+PROBE_FILE = "probe.json"
+
+# 漂移检查探针：覆盖故障码、操作步骤、长短句等典型手册内容
+PROBE_TEXTS = [
+    "设备显示008通信故障怎么处理？",
+    "E-203：伺服驱动器过载报警，请检查负载与电机接线。",
+    "更换备件PN-4411A前，先断开主电源并挂牌上锁。",
+    "巡检周期为每月一次，重点检查轴承温度、振动与润滑油位。",
+    "若上下文无相关信息，直接回复无法回答该问题。",
+    "变频器参数P0.03设置为1时，运行指令由外部端子给定；设置为0时由操作面板给定，修改后需重新上电生效。",
+    "冷却水泵",
+    "How to reset the controller after a power failure?",
+]
+
+
+def model_directory(model_name: str, model_dir: str) -> Path:
+    directory = Path(model_dir)
+    if not directory.is_absolute():
+        directory = PROJECT_ROOT / directory
+    return directory / model_name.replace("/", "__")
+
+
+def _cls_normalize(hidden: np.ndarray) -> np.ndarray:
+    cls = hidden[:, 0].astype(np.float32)
+    norms = np.linalg.norm(cls, axis=1, keepdims=True)
+    return cls / np.maximum(norms, 1e-12)
+
+
+def export_onnx(model_name: str, model_dir: str, quantize: bool = True, opset: int = 17) -> Path:
+    """导出 ONNX（可选 int8 动态量化），并保存分词器与探针参考向量，返回模型目录"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    directory = model_directory(model_name, model_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    print(f"📦 正在导出ONNX模型：{model_name} → {directory}")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(str(directory))
+
+    dummy = tokenizer(["示例文本", "用于导出的第二条示例文本"], padding=True, return_tensors="pt")
+    axes = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"]),
+            str(directory / FP32_FILE),
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state", "pooler_output"],
+            dynamic_axes={"input_ids": axes, "attention_mask": axes, "token_type_ids": axes,
+                          "last_hidden_state": axes, "pooler_output": {0: "batch"}},
+            opset_version=opset,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(directory / FP32_FILE), str(directory / INT8_FILE),
+                         weight_type=QuantType.QInt8, per_channel=True)
+
+    # 探针参考向量：与线上 PyTorch 路径相同的 [CLS] + 归一化
+    with torch.no_grad():
+        encoded = tokenizer(PROBE_TEXTS, padding=True, truncation=True, max_length=512, return_tensors="pt")
+        reference = _cls_normalize(model(**encoded).last_hidden_state.numpy())
+    with open(directory / PROBE_FILE, "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "texts": PROBE_TEXTS, "vectors": reference.tolist()}, f)
+    print(f"✅ ONNX导出完成（量化：{quantize}）")
+    return directory
+
+
+class OnnxEmbeddings(Embeddings):
+    """onnxruntime 推理的 BGE 嵌入（[CLS] 池化 + L2 归一化）"""
+    def __init__(self, directory: Path, quantized: bool = True, threads: int = 0, batch_size: int = 32,
+                 max_length: int = 512):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.directory = Path(directory)
+        self.quantized = quantized
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.directory))
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or (os.cpu_count() or 1)
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_path = self.directory / (INT8_FILE if quantized else FP32_FILE)
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self._input_names = [i.name for i in self.session.get_inputs()]
+
+    def _run(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        feeds = {}
+        for name in self._input_names:
+            value = encoded.get(name)
+            if value is None:  # 分词器未返回 token_type_ids 时补零
+                value = np.zeros_like(encoded["input_ids"])
+            feeds[name] = value.astype(np.int64)
+        hidden = self.session.run(["last_hidden_state"], feeds)[0]
+        return _cls_normalize(hidden)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """按长度排序分批推理（同批文本长度接近，padding 少），结果按原顺序返回"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out: Optional[np.ndarray] = None
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            vectors = self._run([texts[i] for i in idx])
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[idx] = vectors
+        return out
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await run_in_executor(None, self.embed_documents, texts)
+
+    def check_drift(self) -> Dict[str, float]:
+        """与导出时 PyTorch 计算的探针参考向量比对，返回余弦相似度的最小值与均值"""
+        with open(self.directory / PROBE_FILE, "r", encoding="utf-8") as f:
+            probe = json.load(f)
+        reference = np.asarray(probe["vectors"], dtype=np.float32)
+        cosines = np.sum(self.encode(probe["texts"]) * reference, axis=1)
+        return {"min_cosine": round(float(cosines.min()), 5), "mean_cosine": round(float(cosines.mean()), 5)}
+
+
+def load_onnx_embeddings(model_name: str, model_dir: str, quantize: bool = True, threads: int = 0,
+                         batch_size: int = 32, drift_threshold: float = 0.99) -> OnnxEmbeddings:
+    """加载 ONNX 嵌入（模型不存在时先导出），并做漂移检查：探针最小余弦相似度低于阈值时拒绝使用"""
+    directory = model_directory(model_name, model_dir)
+    if not (directory / (INT8_FILE if quantize else FP32_FILE)).exists():
+        export_onnx(model_name, model_dir, quantize=quantize)
+    embeddings = OnnxEmbeddings(directory, quantized=quantize, threads=threads, batch_size=batch_size)
+    drift = embeddings.check_drift()
+    print(f"🔧 ONNX嵌入运行时：{'int8' if quantize else 'fp32'}，线程数{threads or os.cpu_count()}，漂移检查{drift}")
+    if drift["min_cosine"] < drift_threshold:
+        raise RuntimeError(f"❌ ONNX嵌入与PyTorch参考向量偏差过大（{drift}，阈值{drift_threshold}），"
+                           f"与已有集合不兼容，请改用 fp32 或 torch 运行时")
+    return embeddings
+
+
+def main():
+    from src.rag.rag_agent import config
+
+    parser = argparse.ArgumentParser(description="BGE ONNX 导出与漂移检查")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--no-quantize", action="store_true", help="只导出/检查 fp32 模型")
+    args = parser.parse_args()
+    quantize = config.ONNX_QUANTIZE and not args.no_quantize
+    if args.command == "export":
+        export_onnx(config.EMBEDDING_MODEL, config.ONNX_MODEL_DIR, quantize=quantize)
+    embeddings = OnnxEmbeddings(model_directory(config.EMBEDDING_MODEL, config.ONNX_MODEL_DIR), quantized=quantize,
+                                threads=config.ONNX_THREADS, batch_size=config.ONNX_BATCH_SIZE)
+    print(f"📏 漂移检查：{embeddings.check_drift()}（阈值 {config.ONNX_DRIFT_THRESHOLD}）")
+
+
+if __name__ == "__main__":
+    main()
+
+# 代码说明：
+# 1. 功能定位：生产节点无GPU时替代 PyTorch 推理，降低 BGE 向量化的延迟与CPU占用；
+# 2. 核心逻辑：
+#    - export_onnx：导出动态 batch/序列长度的 ONNX 图，quantize_dynamic 按通道量化权重为 int8，并保存探针参考向量；
+#    - OnnxEmbeddings：onnxruntime 会话（intra_op 线程数可配），长度排序分批，[CLS] 池化后归一化；
+#    - load_onnx_embeddings：加载即做漂移检查，偏差超阈值直接报错，避免写入与旧集合不兼容的向量；
+# 3. 应用场景：SimpleRAGConfig.EMBEDDING_RUNTIME = "onnx" 时由 get_embeddings() 使用，可与微批处理/持久化缓存叠加。
@@ -5,22 +5,34 @@
 from typing import List, Dict, Any, Optional, Callable, Tuple
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
+import hashlib
 import os
+import threading
+import time
 
 # 核心依赖（使用官方推荐的 langchain-milvus 包）
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_milvus import MilvusVectorStore  # 官方新版Milvus向量库
-from langchain_huggingface import HuggingFaceEmbeddings
+# 注意：pypdf / MilvusVectorStore / HuggingFaceEmbeddings / torch 导入开销大，推迟到首次使用时导入
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.messages import AIMessage, HumanMessage, BaseMessage
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, HumanMessage, BaseMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-from langchain_classic.chains.retrieval import create_retrieval_chain
-from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.vectorstores import VectorStore, VectorStoreRetriever
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.runnables.config import run_in_executor
+
+from src.rag.semantic_cache import SemanticAnswerCache
+from src.rag.manifest import CollectionVersion, IngestManifest, chunk_id, delete_chunks, file_sha256
+from src.rag.embedding_cache import CachedEmbeddings
+from src.rag.micro_batch_embeddings import MicroBatchEmbeddings
+from src.rag.reranker import CrossEncoderReranker
+from src.rag.bm25_index import BM25Index, is_code_dominated, reciprocal_rank_fusion, warmup_tokenizer
+from src.rag.structured_chunker import StructuredChunker, iter_pdf_pages, model_token_counter
 
 # 替换为你的LLM配置
 from llm_db_config.chatmodel import llm_no_think
+from core.tracing import record_retrieval
 
 # ========== 环境配置（国内镜像+超时设置） ==========
 os.environ["TRANSFORMERS_OFFLINE"] = "0"
@@ -28,35 +40,86 @@ os.environ["HF_ENDPOINT"] = "https://hf-mirror.com"
 os.environ["HF_HUB_CONNECT_TIMEOUT"] = "60"
 os.environ["HF_HUB_DOWNLOAD_TIMEOUT"] = "60"
 
-# ========== CUDA自动检测 ==========
-try:
-    import torch
-    HAS_CUDA = torch.cuda.is_available()
-except ImportError:
-    HAS_CUDA = False
-
 # ========== 配置类（适配新版Milvus） ==========
 class SimpleRAGConfig:
+    # 向量库后端：milvus（需要Milvus服务）/ local（进程内NumPy内存映射，适合测试与边缘部署）
+    VECTOR_BACKEND: str = os.getenv("RAG_VECTOR_BACKEND", "milvus")
+    LOCAL_VECTOR_DIR: str = "data/vector_store"  # 本地向量库目录（相对项目根目录），每个集合一个子目录
+    LOCAL_ANN_INDEX: str = "auto"  # 近似索引：none / ivf / hnsw / auto（有hnswlib用HNSW，否则IVF）
+    LOCAL_ANN_MIN_ROWS: int = 100000  # 小于该规模时暴力检索（结果精确）
+    LOCAL_IVF_NPROBE: int = 16
     # Milvus连接配置
     MILVUS_HOST: str = "127.0.0.1"
     MILVUS_PORT: str = "19530"
     COLLECTION_NAME: str = "simple_pdf_rag_bge"  # 向量集合名
     # 嵌入模型配置（BGE中文最优模型）
     EMBEDDING_MODEL: str = "BAAI/bge-base-zh-v1.5"
-    EMBEDDING_DEVICE: str = "cuda" if HAS_CUDA else "cpu"
+    EMBEDDING_DEVICE: str = "auto"  # auto=首次加载模型时检测CUDA；也可直接指定 cuda / cpu
+    # 嵌入运行时：torch（HuggingFaceEmbeddings）/ onnx（onnxruntime，适合无GPU节点）
+    EMBEDDING_RUNTIME: str = os.getenv("RAG_EMBEDDING_RUNTIME", "torch")
+    ONNX_MODEL_DIR: str = "data/onnx_models"  # 导出的ONNX模型目录（相对项目根目录），不存在时首次加载自动导出
+    ONNX_QUANTIZE: bool = True  # int8 动态量化
+    ONNX_THREADS: int = 0  # onnxruntime 算子内线程数，0=CPU核数
+    ONNX_BATCH_SIZE: int = 32
+    ONNX_DRIFT_THRESHOLD: float = 0.99  # 探针文本与PyTorch参考向量的最小余弦相似度
+    # 持久化向量缓存（按 模型名+文本哈希 寻址，目录相对项目根目录）
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = "data/embedding_cache"
+    EMBEDDING_QUERY_CACHE_SIZE: int = 2048  # 查询向量只缓存在进程内（LRU条数），不落盘
+    # 查询向量微批处理：合并并发请求的 embed_query，窗口期内最多 EMBEDDING_MAX_BATCH 条一起前向计算
+    EMBEDDING_MICRO_BATCH: bool = True
+    EMBEDDING_BATCH_WINDOW_MS: float = 5
+    EMBEDDING_MAX_BATCH: int = 32
     # 检索配置
     SEARCH_K: int = 6  # 召回文档数
     SEARCH_SCORE_THRESHOLD: float = 0.3  # 相似度阈值（0-1）
-    # 文本切片配置
-    CHUNK_SIZE: int = 500
-    CHUNK_OVERLAP: int = 50
+    # 文本切片配置（结构感知：按标题/编号步骤/表格切分，块大小按嵌入模型 token 计，含章节路径前缀）
+    CHUNK_TOKENS: int = 384
+    CHUNK_OVERLAP_TOKENS: int = 48  # 同一段落拆分时的句级重叠上限
+    CHUNK_TOKEN_COUNTER: str = "model"  # model=嵌入模型分词器，approx=近似计数（不加载分词器）
+    CHUNK_UPSERT_BATCH: int = 256  # load_pdf_to_db 边切片边写入的批大小
+    # 语义答案缓存配置
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95  # 查询向量余弦相似度阈值
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1024
+    SEMANTIC_CACHE_TTL: int = 3600  # 秒
+    # 增量入库清单目录（相对项目根目录）
+    MANIFEST_DIR: str = "data/rag_manifest"
+    # 混合检索配置（BM25稀疏索引 + 向量检索，倒数排名融合）
+    HYBRID_ENABLED: bool = True
+    BM25_DIR: str = "data/rag_bm25"  # 稀疏索引目录（相对项目根目录）
+    BM25_K: int = 6  # 稀疏检索召回数
+    BM25_K1: float = 1.5
+    BM25_B: float = 0.75
+    RRF_K: int = 60  # 倒数排名融合常数
+    CODE_QUERY_RATIO: float = 0.5  # 代码字符占比达到该值的查询只走稀疏检索（跳过向量化）
+    # 重排序配置（可选阶段：召回 RERANK_CANDIDATES 个候选 → 交叉编码器打分 → 按 token 预算截断）
+    RERANK_ENABLED: bool = False
+    RERANK_MODEL: str = "BAAI/bge-reranker-base"
+    RERANK_CANDIDATES: int = 20  # 开启重排序时的召回候选数（替代 SEARCH_K / BM25_K）
+    RERANK_BATCH_SIZE: int = 16  # CPU 上的打分批大小
+    RERANK_MAX_LENGTH: int = 512  # 单个（问题，文档块）对的最大 token 数
+    RERANK_TOKEN_BUDGET: int = 1500  # 放入提示词的文档块 token 总预算
+    RERANK_MIN_SCORE: float = 0.05  # 低于该分数的块直接丢弃（分数范围0-1）
 
 config = SimpleRAGConfig()
 
-# 打印运行信息
-print(f"🔧 当前运行设备：{config.EMBEDDING_DEVICE}")
-if not HAS_CUDA:
-    print("⚠️  未检测到CUDA，将使用CPU运行（BGE模型CPU运行速度较慢，建议安装GPU环境）")
+# ========== CUDA自动检测（延迟到首次需要时，避免导入本模块就加载torch） ==========
+@lru_cache()
+def get_embedding_device() -> str:
+    if config.EMBEDDING_DEVICE != "auto":
+        return config.EMBEDDING_DEVICE
+    try:
+        import torch
+        has_cuda = torch.cuda.is_available()
+    except ImportError:
+        has_cuda = False
+    device = "cuda" if has_cuda else "cpu"
+    # 打印运行信息
+    print(f"🔧 当前运行设备：{device}")
+    if not has_cuda:
+        print("⚠️  未检测到CUDA，将使用CPU运行（BGE模型CPU运行速度较慢，建议安装GPU环境）")
+    return device
 
 # ========== 相关性评分函数（BGE模型专用） ==========
 def cosine_similarity_score_fn(distance: float) -> float:
@@ -66,92 +129,353 @@ def cosine_similarity_score_fn(distance: float) -> float:
     """
     return 1.0 - (distance / 2.0)
 
-# ========== RAG核心类 ==========
-class SimplePDFRAGAgent:
-    def __init__(self, llm: Any):
-        self.llm = llm
-        self.embeddings = HuggingFaceEmbeddings(
+# ========== 嵌入模型（进程内单例） ==========
+@lru_cache()
+def get_embeddings() -> Embeddings:
+    """进程内共享的BGE嵌入模型，RAG检索与快速意图分类共用，避免重复加载"""
+    cache_key = config.EMBEDDING_MODEL
+    if config.EMBEDDING_RUNTIME == "onnx":
+        from src.rag.onnx_embeddings import load_onnx_embeddings
+        embeddings = load_onnx_embeddings(
+            config.EMBEDDING_MODEL, config.ONNX_MODEL_DIR, quantize=config.ONNX_QUANTIZE,
+            threads=config.ONNX_THREADS, batch_size=config.ONNX_BATCH_SIZE,
+            drift_threshold=config.ONNX_DRIFT_THRESHOLD,
+        )
+        # 量化向量与 PyTorch 向量有微小差异，缓存分开存放
+        cache_key = f"{config.EMBEDDING_MODEL}@onnx-{'int8' if config.ONNX_QUANTIZE else 'fp32'}"
+    elif config.EMBEDDING_RUNTIME == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(
             model_name=config.EMBEDDING_MODEL,
             model_kwargs={
-                "device": config.EMBEDDING_DEVICE,
+                "device": get_embedding_device(),
                 "trust_remote_code": True
             },
             encode_kwargs={
                 "normalize_embeddings": True  # BGE必须归一化，确保相似度计算准确
             },
         )
-        self.vector_store = MilvusVectorStore(
-            embedding_function=self.embeddings,
-            connection_args={
-                "host": config.MILVUS_HOST,
-                "port": config.MILVUS_PORT,
-                "alias": "default"  # 连接别名（新版必填）
-            },
-            collection_name=config.COLLECTION_NAME,
-            auto_id=True,  # 自动生成文档ID
-            distance_metric="L2",  # 与BGE归一化向量兼容
-            drop_old=False,  # 替代旧版overwrite：False=不删除旧集合（True=删除重建）
-        )
+    else:
+        raise ValueError(f"❌ 不支持的嵌入运行时：{config.EMBEDDING_RUNTIME}")
+    if config.EMBEDDING_MICRO_BATCH:
+        # 并发查询合并为批量前向计算（位于缓存之下，缓存命中的查询不进入批处理）
+        embeddings = MicroBatchEmbeddings(embeddings, window_ms=config.EMBEDDING_BATCH_WINDOW_MS,
+                                          max_batch=config.EMBEDDING_MAX_BATCH)
+    if config.EMBEDDING_CACHE_ENABLED:
+        # 向量缓存：入库块持久化、多进程共享；重复提问命中进程内LRU
+        embeddings = CachedEmbeddings(embeddings, cache_key, config.EMBEDDING_CACHE_DIR,
+                                      query_cache_size=config.EMBEDDING_QUERY_CACHE_SIZE)
+    return embeddings
 
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=config.CHUNK_SIZE,
-            chunk_overlap=config.CHUNK_OVERLAP,
-            separators=["\n\n", "\n", "。", "！", "？", "；", "，", " "],
-        )
-        self.retriever = self.vector_store.as_retriever(
-            search_kwargs={
-                "k": config.SEARCH_K,
-                "score_threshold": config.SEARCH_SCORE_THRESHOLD,
-                "relevance_score_fn": cosine_similarity_score_fn  # 显式评分函数
-            },
-            search_type="similarity_score_threshold",
+# ========== 结构感知切片器（进程内单例，首次使用时加载分词器） ==========
+@lru_cache()
+def get_chunker() -> StructuredChunker:
+    counter = model_token_counter(config.EMBEDDING_MODEL) if config.CHUNK_TOKEN_COUNTER == "model" else None
+    return StructuredChunker(config.CHUNK_TOKENS, config.CHUNK_OVERLAP_TOKENS, token_counter=counter)
+
+# ========== 重排序模型（进程内单例，首次打分时加载） ==========
+@lru_cache()
+def get_reranker() -> CrossEncoderReranker:
+    return CrossEncoderReranker(
+        model_name=config.RERANK_MODEL,
+        batch_size=config.RERANK_BATCH_SIZE,
+        max_length=config.RERANK_MAX_LENGTH,
+        device="cpu",
+    )
+
+# ========== 向量库（按 VECTOR_BACKEND 选择后端） ==========
+def create_vector_store(embeddings: Embeddings) -> VectorStore:
+    """
+    创建向量库：各后端都实现 LangChain VectorStore 接口，并提供 add_embeddings（批量入库）
+    与按 chunk_id 删除（manifest.delete_chunks）所需的能力，可互相替换
+    """
+    if config.VECTOR_BACKEND == "local":
+        from src.rag.local_vector_store import LocalVectorStore
+        return LocalVectorStore(
+            embedding_function=embeddings,
+            path=str(Path(config.LOCAL_VECTOR_DIR) / config.COLLECTION_NAME),
+            ann=config.LOCAL_ANN_INDEX,
+            ann_min_rows=config.LOCAL_ANN_MIN_ROWS,
+            nprobe=config.LOCAL_IVF_NPROBE,
         )
-        self.document_prompt = ChatPromptTemplate.from_messages([
-            ("system", """你是设备运维助手，严格基于提供的PDF文档内容回答问题。
-                - 仅使用上下文里的信息，不编造额外内容
-                - 技术问题按「问题分析→解决方案→操作步骤」的结构回答
-                - 若上下文无相关信息，直接回复"无法回答该问题"
-                <context>
-                {context}
-                </context>"""),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}")
-        ])
+    if config.VECTOR_BACKEND != "milvus":
+        raise ValueError(f"❌ 不支持的向量库后端：{config.VECTOR_BACKEND}")
+    from langchain_milvus import MilvusVectorStore  # 官方新版Milvus向量库
+    return MilvusVectorStore(
+        embedding_function=embeddings,
+        connection_args={
+            "host": config.MILVUS_HOST,
+            "port": config.MILVUS_PORT,
+            "alias": "default"  # 连接别名（新版必填）
+        },
+        collection_name=config.COLLECTION_NAME,
+        auto_id=True,  # 自动生成文档ID
+        enable_dynamic_field=True,  # 允许元数据新增字段（如增量同步使用的chunk_id）
+        distance_metric="L2",  # 与BGE归一化向量兼容
+        drop_old=False,  # 替代旧版overwrite：False=不删除旧集合（True=删除重建）
+    )
+
+# ========== 提示词（模块级预编译，所有Agent实例共享） ==========
+# 系统消息为静态文本（不含检索上下文），检索结果放在最后一条用户消息中：
+# 系统提示词 + 历史对话 构成稳定前缀，服务端前缀/KV缓存在多轮对话中可以逐轮命中
+RAG_SYSTEM_PROMPT = """你是设备运维助手，严格基于提供的PDF文档内容回答问题。
+- 仅使用用户消息中<context>标签内的信息，不编造额外内容
+- 技术问题按「问题分析→解决方案→操作步骤」的结构回答
+- 若上下文无相关信息，直接回复“无法回答该问题”"""
+RAG_QA_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=RAG_SYSTEM_PROMPT),
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("human", "<context>\n{context}\n</context>\n\n问题：{input}")
+])
+# 单个文档块的格式（create_stuff_documents_chain 以元数据字段与 page_content 作为变量）
+RAG_DOCUMENT_PROMPT = PromptTemplate.from_template("[文档来源：{source}] {page_content}")
+
+
+def history_key(chat_history: List[Any], user_input: str) -> str:
+    """对话历史的哈希（语义缓存的上下文键）：忽略意图分类消息与末尾的当前问题，无历史时为空串"""
+    messages = [m for m in chat_history if getattr(m, "name", None) != "intent_cls"]
+    if messages and isinstance(messages[-1], HumanMessage) and messages[-1].content == user_input:
+        messages = messages[:-1]
+    if not messages:
+        return ""
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message.type}\0{message.content}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+# ========== RAG核心类 ==========
+class SimplePDFRAGAgent:
+    def __init__(self, llm: Any, answer_cache: Optional[SemanticAnswerCache] = None):
+        self.llm = llm
+        self.embeddings = get_embeddings()
+        self.vector_store = create_vector_store(self.embeddings)
+
+        self.chunker = get_chunker()
+        # 检索由 _retrieve（向量+BM25融合、可选重排序）完成，这里只构建“文档塞入提示词+生成”的链
+        self.document_prompt = RAG_QA_PROMPT
         self.document_chain = create_stuff_documents_chain(
             self.llm,
             self.document_prompt,
-            document_prompt=ChatPromptTemplate.from_messages([
-                ("system", "[文档来源：{{doc.metadata.source}}] {{doc.page_content}}")
-            ])
+            document_prompt=RAG_DOCUMENT_PROMPT,
+        )
+        # 语义答案缓存：键为查询向量+集合版本号+对话上下文键，入库新文档时版本号递增并清空缓存
+        self.answer_cache = answer_cache if answer_cache is not None else SemanticAnswerCache(
+            threshold=config.SEMANTIC_CACHE_THRESHOLD,
+            max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES,
+            ttl_seconds=config.SEMANTIC_CACHE_TTL,
         )
-        self.rag_chain = create_retrieval_chain(self.retriever, self.document_chain, rephrase_question=False) # 关闭问题重写功能
+        # 集合版本号落盘：入库命令行（src.rag.ingest）在其他进程变更集合时，本进程查询缓存前即可感知
+        self.version = CollectionVersion.for_collection(config.COLLECTION_NAME, config.MANIFEST_DIR)
+        # 入库清单：记录每个文件及其文档块的内容哈希，用于增量同步
+        self.manifest = IngestManifest.for_collection(config.COLLECTION_NAME, config.MANIFEST_DIR)
+        # BM25稀疏索引：与清单同步维护，检索时与向量结果做倒数排名融合
+        self.bm25: Optional[BM25Index] = None
+        if config.HYBRID_ENABLED:
+            self.bm25 = BM25Index.for_collection(config.COLLECTION_NAME, config.BM25_DIR,
+                                                 k1=config.BM25_K1, b=config.BM25_B)
+            warmup_tokenizer()
+            if not self.bm25 and self.manifest.sources():
+                print("⚠️  BM25稀疏索引为空，重新执行入库即可补齐（未变化的块不会重新向量化）")
+
+    @property
+    def collection_version(self) -> int:
+        return self.version.current()
+
+    # 知识库内容变更：递增集合版本号（写入磁盘），旧版本的缓存答案全部失效
+    def _on_collection_changed(self):
+        self.version.bump()
+        self.answer_cache.invalidate()
 
-    # 加载PDF并入库
-    def load_pdf_to_db(self, pdf_path: str) -> int:
+    # 文件是否已完整同步：文件哈希未变，且（启用混合检索时）全部块都已进入稀疏索引
+    def is_source_synced(self, source: str, file_hash: str) -> bool:
+        if not self.manifest.is_unchanged(source, file_hash):
+            return False
+        return self.bm25 is None or self.bm25.has_all(self.manifest.chunk_ids(source))
+
+    # 加载PDF并入库（基于内容哈希增量同步：未变化的块跳过，新增块写入，消失的块删除）
+    # save_sparse=False 时不落盘BM25索引（整份重写，与语料规模成正比），由调用方在一批文件结束后统一保存
+    def load_pdf_to_db(self, pdf_path: str, save_sparse: bool = True) -> int:
         pdf_path = Path(pdf_path)
         if not pdf_path.exists() or pdf_path.suffix != ".pdf":
             raise ValueError(f"❌ 无效PDF路径：{pdf_path}")
 
-        print(f"📄 正在加载PDF：{pdf_path.name}")
-        loader = PyPDFLoader(str(pdf_path))
-        documents = loader.load()
-        print(f"✂️ PDF共{len(documents)}页，正在切片...")
+        source = str(pdf_path)
+        file_hash = file_sha256(source)
+        if self.is_source_synced(source, file_hash):
+            print(f"⏭️ PDF未变化，跳过：{pdf_path.name}")
+            return 0
 
-        split_docs = self.text_splitter.split_documents(documents)
-        print(f"✅ 切片完成：{len(split_docs)}个文档块")
+        print(f"📄 正在逐页加载并切片PDF：{pdf_path.name}")
+        # 逐页抽取→结构感知切片→按批写入，整本PDF不会同时驻留内存
+        chunks = self.chunker.iter_chunks(iter_pdf_pages(source), {"source": source})
 
-        # 补充元数据
-        for doc in split_docs:
+        # 计算块ID并与清单比对（同一文件内重复的块只保留一份）
+        old_ids = self.manifest.chunk_ids(source)
+        seen_ids, seen_set, batch = [], set(), []
+        added = 0
+        load_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for doc in chunks:
+            cid = chunk_id(source, doc.page_content)
+            if cid in seen_set:
+                continue
+            seen_ids.append(cid)
+            seen_set.add(cid)
+            if cid in old_ids:
+                # 未变化的块无需向量化，仅在稀疏索引缺失时补齐
+                if self.bm25 is not None and cid not in self.bm25:
+                    self.bm25.add(cid, doc.page_content, dict(doc.metadata, chunk_id=cid))
+                continue
+            # 补充元数据
             doc.metadata.update({
-                "load_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "chunk_id": cid,
+                "load_time": load_time,
                 "content_type": "text",
                 "embedding_model": config.EMBEDDING_MODEL
             })
+            batch.append(doc)
+            if len(batch) >= config.CHUNK_UPSERT_BATCH:
+                self._upsert_chunks(batch)
+                added += len(batch)
+                batch = []
+        if batch:
+            self._upsert_chunks(batch)
+            added += len(batch)
+        removed_ids = old_ids - seen_set
+
+        # 删除消失的块
+        print(f"📥 已同步向量集合（{config.VECTOR_BACKEND}）：{config.COLLECTION_NAME}（新增{added}，删除{len(removed_ids)}，"
+              f"未变化{len(seen_ids) - added}）")
+        if removed_ids:
+            delete_chunks(self.vector_store, removed_ids)
+        if self.bm25 is not None:
+            self.bm25.remove(removed_ids)
+            if save_sparse:
+                self.bm25.save()
+        self.manifest.set(source, file_hash, seen_ids)
+        self.manifest.save()
+        if added or removed_ids:
+            self._on_collection_changed()
+        return added
+
+    # 批量加载多个PDF：BM25索引只在全部文件处理完（或中途失败）时落盘一次
+    def load_pdfs_to_db(self, pdf_paths: List[str]) -> int:
+        added = 0
+        try:
+            for pdf_path in pdf_paths:
+                added += self.load_pdf_to_db(pdf_path, save_sparse=False)
+        finally:
+            if self.bm25 is not None:
+                self.bm25.save()
+        return added
 
-        # 存入Milvus
-        print(f"📥 正在写入Milvus集合：{config.COLLECTION_NAME}")
-        self.vector_store.add_documents(split_docs)
-        return len(split_docs)
+    # 新块写入：先按ID删除再插入（upsert，重复执行不产生重复数据），写入成功后同步稀疏索引
+    def _upsert_chunks(self, docs: List[Document]):
+        delete_chunks(self.vector_store, [d.metadata["chunk_id"] for d in docs])
+        self.vector_store.add_documents(docs)
+        if self.bm25 is not None:
+            self.bm25.add_documents(docs)
+
+    # 按查询向量检索：取 SEARCH_K 个结果并按 SEARCH_SCORE_THRESHOLD 过滤，复用已计算的查询向量
+    def _retrieve_by_vector(self, query_vector: List[float], k: Optional[int] = None) -> List[Document]:
+        docs_and_scores = self.vector_store.similarity_search_with_score_by_vector(query_vector, k=k or config.SEARCH_K)
+        return [doc for doc, distance in docs_and_scores
+                if cosine_similarity_score_fn(distance) >= config.SEARCH_SCORE_THRESHOLD]
+
+    # 稀疏检索：BM25召回（仅返回命中查询词的块）
+    def _retrieve_sparse(self, query: str, k: Optional[int] = None) -> List[Document]:
+        return [doc for doc, _ in self.bm25.search(query, k=k or config.BM25_K)]
+
+    # 重排序：开启时对候选精排并按 token 预算截断，未开启时原样返回
+    def _rerank(self, query: str, docs: List[Document]) -> List[Document]:
+        if not config.RERANK_ENABLED or not docs:
+            return docs
+        kept = get_reranker().rerank(query, docs, token_budget=config.RERANK_TOKEN_BUDGET,
+                                     min_score=config.RERANK_MIN_SCORE)
+        print(f"🎯 重排序：{len(docs)}个候选 → 保留{len(kept)}个")
+        return [doc for doc, _ in kept]
+
+    # 混合检索：向量结果与BM25结果做倒数排名融合（未启用混合检索时为纯向量检索），再按需重排序
+    def _retrieve(self, query: str, query_vector: List[float]) -> List[Document]:
+        start = time.perf_counter()
+        k = config.RERANK_CANDIDATES if config.RERANK_ENABLED else None
+        docs = self._retrieve_by_vector(query_vector, k)
+        if self.bm25 is not None:
+            docs = reciprocal_rank_fusion([docs, self._retrieve_sparse(query, k)],
+                                          k=config.RRF_K, top_n=k or config.SEARCH_K)
+        docs = self._rerank(query, docs)
+        # 链路追踪：检索耗时（含重排序）与最终文档数，归属到当前图节点
+        record_retrieval(time.perf_counter() - start, len(docs), "hybrid" if self.bm25 is not None else "vector")
+        return docs
+
+    # 精确代码类查询（如"E-203"、"008报警"）：只用稀疏索引，命中时返回文档，无需向量化；未命中返回None
+    def _code_query_docs(self, query: str) -> Optional[List[Document]]:
+        if self.bm25 is None or not is_code_dominated(query, config.CODE_QUERY_RATIO):
+            return None
+        start = time.perf_counter()
+        docs = self._retrieve_sparse(query, config.RERANK_CANDIDATES if config.RERANK_ENABLED else None)
+        if docs:
+            print(f"🔎 精确代码查询，仅使用BM25稀疏检索：{len(docs)}个文档块")
+            docs = self._rerank(query, docs)
+        record_retrieval(time.perf_counter() - start, len(docs), "sparse")
+        # 未命中或重排序后一个都不剩时回退到混合检索
+        return docs or None
+
+    # 检索+生成（带语义缓存）
+    def _answer(self, user_input: str, chat_history: List[Any]) -> str:
+        docs = self._code_query_docs(user_input)
+        if docs is not None:
+            # 跳过向量化，也就不查语义缓存（缓存以查询向量为键）
+            return self.document_chain.invoke({
+                "input": user_input,
+                "chat_history": chat_history,
+                "context": docs,
+            }) or "无法回答该问题"
+        query_vector = self.embeddings.embed_query(user_input)
+        version = self.collection_version
+        context = history_key(chat_history, user_input)
+        if config.SEMANTIC_CACHE_ENABLED:
+            cached = self.answer_cache.lookup(query_vector, version, context)
+            if cached is not None:
+                print(f"⚡ 语义缓存命中：{self.answer_cache.stats()}")
+                return cached
+        start = time.perf_counter()
+        docs = self._retrieve(user_input, query_vector)
+        answer = self.document_chain.invoke({
+            "input": user_input,
+            "chat_history": chat_history,
+            "context": docs,
+        }) or "无法回答该问题"
+        if config.SEMANTIC_CACHE_ENABLED:
+            self.answer_cache.put(query_vector, version, answer, time.perf_counter() - start, context=context)
+        return answer
+
+    # 检索+生成（异步版本）
+    async def _aanswer(self, user_input: str, chat_history: List[Any]) -> str:
+        docs = await run_in_executor(None, self._code_query_docs, user_input)
+        if docs is not None:
+            return await self.document_chain.ainvoke({
+                "input": user_input,
+                "chat_history": chat_history,
+                "context": docs,
+            }) or "无法回答该问题"
+        query_vector = await self.embeddings.aembed_query(user_input)
+        version = self.collection_version
+        context = history_key(chat_history, user_input)
+        if config.SEMANTIC_CACHE_ENABLED:
+            cached = self.answer_cache.lookup(query_vector, version, context)
+            if cached is not None:
+                print(f"⚡ 语义缓存命中：{self.answer_cache.stats()}")
+                return cached
+        start = time.perf_counter()
+        docs = await run_in_executor(None, self._retrieve, user_input, query_vector)
+        answer = await self.document_chain.ainvoke({
+            "input": user_input,
+            "chat_history": chat_history,
+            "context": docs,
+        }) or "无法回答该问题"
+        if config.SEMANTIC_CACHE_ENABLED:
+            self.answer_cache.put(query_vector, version, answer, time.perf_counter() - start, context=context)
+        return answer
 
     # 问答入口（适配Graph节点）
     def run(self, state: Dict[str, Any]) -> Dict[str, List[BaseMessage]]:
@@ -163,34 +487,78 @@ class SimplePDFRAGAgent:
             return {"messages": [AIMessage(content="未获取到有效问题，请重新输入")]}
 
         print(f"🔍 检索查询：{user_input}")
-        result = self.rag_chain.invoke({
-            "input": user_input,
-            "chat_history": chat_history
-        })
+        return {"messages": [AIMessage(content=self._answer(user_input, chat_history))]}
+
+    # 异步问答入口（graph.astream 使用，检索与LLM调用均不阻塞事件循环）
+    async def arun(self, state: Dict[str, Any]) -> Dict[str, List[BaseMessage]]:
+        messages = state.get("messages", [])
+        chat_history = messages[:-1] if len(messages) > 1 else []
+        user_input = next((msg.content for msg in reversed(messages) if isinstance(msg, HumanMessage)), "")
 
-        return {"messages": [AIMessage(content=result.get("answer", "无法回答该问题"))]}
+        if not user_input:
+            return {"messages": [AIMessage(content="未获取到有效问题，请重新输入")]}
+
+        print(f"🔍 检索查询：{user_input}")
+        return {"messages": [AIMessage(content=await self._aanswer(user_input, chat_history))]}
 
     # 简化问答接口
     def ask(self, query: str, chat_history: List[Any] = None) -> str:
         chat_history = chat_history or []
         print(f"🔍 检索查询：{query}")
-        result = self.rag_chain.invoke({
-            "input": query,
-            "chat_history": chat_history
-        })
-        return result.get("answer", "无法回答该问题")
+        return self._answer(query, chat_history)
+
+# ========== 延迟构建（首次使用或后台预热时才加载BGE/连接Milvus） ==========
+class LazySimplePDFRAGAgent:
+    """SimplePDFRAGAgent 的延迟构建器：构图时不加载模型，首个知识问答请求或 warmup() 时才真正初始化"""
+    def __init__(self, llm: Any, answer_cache: Optional[SemanticAnswerCache] = None):
+        self.llm = llm
+        self.answer_cache = answer_cache
+        self._agent: Optional[SimplePDFRAGAgent] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._agent is not None
+
+    def get(self) -> SimplePDFRAGAgent:
+        if self._agent is None:
+            with self._lock:
+                if self._agent is None:
+                    start = time.perf_counter()
+                    self._agent = SimplePDFRAGAgent(llm=self.llm, answer_cache=self.answer_cache)
+                    print(f"✅ RAG Agent 初始化完成，耗时{time.perf_counter() - start:.2f}s")
+        return self._agent
+
+    async def aget(self) -> SimplePDFRAGAgent:
+        # 初始化涉及模型加载与网络连接，放到线程池执行，不阻塞事件循环
+        if self._agent is not None:
+            return self._agent
+        return await run_in_executor(None, self.get)
+
+    def warmup(self):
+        self.get()
+        if config.RERANK_ENABLED:
+            get_reranker().warmup()
 
 # ========== Graph节点创建函数（适配LangChain） ==========
-def create_simple_rag_node(llm: Any) -> Callable[[Dict[str, Any], Optional[Dict[str, Any]]], Dict[str, Any]]:
-    rag_agent = SimplePDFRAGAgent(llm=llm)
+def create_simple_rag_node(llm: Any, answer_cache: Optional[SemanticAnswerCache] = None,
+                           lazy_agent: Optional[LazySimplePDFRAGAgent] = None) -> Runnable:
+    lazy_agent = lazy_agent or LazySimplePDFRAGAgent(llm, answer_cache=answer_cache)
 
     def rag_node(
         state: Dict[str, Any],
         config: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
-        return rag_agent.run(state)
+        return lazy_agent.get().run(state)
+
+    async def arag_node(
+        state: Dict[str, Any],
+        config: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        rag_agent = await lazy_agent.aget()
+        return await rag_agent.arun(state)
 
-    return rag_node
+    return RunnableLambda(rag_node, afunc=arag_node, name="rag_agent")
 
 # ========== 运行示例 ==========
 if __name__ == "__main__":
@@ -214,7 +582,7 @@ if __name__ == "__main__":
         print("=== 测试Graph节点模式 ===")
         rag_node = create_simple_rag_node(llm=llm_no_think)
         state = {"messages": [HumanMessage(content=query)]}
-        result_state = rag_node(state)
+        result_state = rag_node.invoke(state)
         print(f"🤖 Graph节点回复：{result_state['messages'][0].content}")
 
     except Exception as e:
@@ -3,11 +3,10 @@
 核心框架：文本+图片+PDF多模态检索增强生成
 核心调整：所有配置内联，无中间变量，极简风格
 """
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator
+from itertools import islice
 from pathlib import Path
 from datetime import datetime
-import base64
-import io
 import numpy as np
 
 # 核心依赖
@@ -15,60 +14,63 @@ from PIL import Image
 import fitz  # PyMuPDF：PDF图片提取
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
 from langchain_classic.chains.retrieval import create_retrieval_chain
-from paddleocr import PaddleOCR  # 百度飞桨OCR
-from langchain_core.messages import AIMessage, HumanMessage, BaseMessage
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import AIMessage, HumanMessage, BaseMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
 from langchain_community.vectorstores import Milvus
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from llm_db_config.chatmodel import llm_no_think
 from src.utils import get_last_user_input
+from src.rag.blob_store import get_blob_store
+from src.rag.embedding_cache import CachedEmbeddings
+from src.rag.ocr_pipeline import ParallelPDFImageOCR, create_ocr, ocr_text as run_ocr
+from src.rag.structured_chunker import StructuredChunker
 
 # ========== 核心：多模态文档处理器（极简版） ==========
 class MultiModalDocumentProcessor:
     """多模态文档处理核心逻辑：文本/图片/PDF加载→预处理→标准化"""
-    def __init__(self, embeddings: HuggingFaceEmbeddings, vector_store: Milvus):
+    def __init__(self, embeddings: Embeddings, vector_store: Milvus):
         self.embeddings = embeddings
         self.vector_store = vector_store
 
-        # 文本切片器（配置直接内联）
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50,
-            separators=["\n\n", "\n", "。", "！", "？", "；", "，", " "],
-        )
+        # 文本切片器（配置直接内联）：按标题/编号步骤/表格切分，逐页流式处理，块大小按近似token计
+        self.chunker = StructuredChunker(chunk_tokens=384, overlap_tokens=48)
 
-        # PaddleOCR初始化（配置直接内联）
-        self.ocr = PaddleOCR(
-            use_angle_cls=True,
-            lang="ch",
-            use_gpu=False,
-            show_log=False
-        )
+        # PaddleOCR：单张图片在主进程识别（首次使用时加载）；PDF图片交给进程池并行识别，每个工作进程各持一个模型
+        self._ocr = None
+        self.blobs = get_blob_store()  # 图片原件落盘，元数据只保存 image_ref 引用
+        self.pdf_ocr = ParallelPDFImageOCR(blob_root=self.blobs.root)
+        self.insert_batch_size = 64  # 流式入库：每凑满一批文档块写入一次向量库
 
-    # 1. 文本处理
-    def load_text_document(self, file_path: str) -> List[Document]:
+    @property
+    def ocr(self):
+        if self._ocr is None:
+            self._ocr = create_ocr()
+        return self._ocr
+
+    # 1. 文本处理（PDF逐页读取，不拼接整本文本）
+    def iter_text_document(self, file_path: str) -> Iterator[Document]:
         file_path = Path(file_path)
+        metadata = {
+            "file_name": file_path.name,
+            "file_path": str(file_path),
+            "load_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "content_type": "text",
+        }
         if file_path.suffix == ".pdf":
             doc = fitz.open(file_path)
-            text = "\n".join([page.get_text() for page in doc])
-            doc.close()
+            try:
+                yield from self.chunker.iter_chunks(((i, page.get_text()) for i, page in enumerate(doc)), metadata)
+            finally:
+                doc.close()
         else:
             with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
+                yield from self.chunker.iter_chunks([(0, f.read())], metadata)
 
-        documents = [Document(
-            page_content=text,
-            metadata={
-                "file_name": file_path.name,
-                "file_path": str(file_path),
-                "load_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "content_type": "text",
-            }
-        )]
-        return self.text_splitter.split_documents(documents)
+    def load_text_document(self, file_path: str) -> List[Document]:
+        return list(self.iter_text_document(file_path))
 
     # 2. 图片处理
     def process_image(self, file_path: str) -> List[Document]:
@@ -77,17 +79,10 @@ class MultiModalDocumentProcessor:
         img_np = np.array(img)
 
         # PaddleOCR识别
-        ocr_result = self.ocr.ocr(img_np, cls=True)
-        ocr_text = ""
-        if ocr_result and ocr_result[0]:
-            for line in ocr_result[0]:
-                ocr_text += line[1][0] + "\n"
-        ocr_text = ocr_text.strip() or "图片无可识别文字"
-
-        # 图片转base64
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG")
-        img_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
+        ocr_text = run_ocr(self.ocr, img_np) or "图片无可识别文字"
+
+        # 原图写入内容寻址存储（不再以base64写入元数据）
+        image_ref = self.blobs.put_file(file_path)
 
         doc = Document(
             page_content=ocr_text,
@@ -96,74 +91,75 @@ class MultiModalDocumentProcessor:
                 "file_path": str(file_path),
                 "load_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "content_type": "image",
-                "image_base64": img_base64,
+                "image_ref": image_ref,
                 "ocr_engine": "PaddleOCR",
             }
         )
         return [doc]
 
-    # 3. PDF图片提取
-    def extract_images_from_pdf(self, file_path: str) -> List[Document]:
+    # 3. PDF图片提取（进程池并行OCR；重复图片与小图标跳过；按页序流式产出）
+    def iter_pdf_image_documents(self, file_path: str) -> Iterator[Document]:
         file_path = Path(file_path)
-        pdf_doc = fitz.open(file_path)
-        image_docs = []
-
-        for page_num in range(len(pdf_doc)):
-            page = pdf_doc[page_num]
-            images = page.get_images(full=True)
-            for img_idx, img in enumerate(images):
-                xref = img[0]
-                base_image = pdf_doc.extract_image(xref)
-                img = Image.open(io.BytesIO(base_image["image"])).convert("RGB")
-                img_np = np.array(img)
-
-                ocr_result = self.ocr.ocr(img_np, cls=True)
-                ocr_text = ""
-                if ocr_result and ocr_result[0]:
-                    for line in ocr_result[0]:
-                        ocr_text += line[1][0] + "\n"
-                ocr_text = ocr_text.strip() or "PDF图片无可识别文字"
-
-                doc = Document(
-                    page_content=ocr_text,
-                    metadata={
-                        "file_name": f"{file_path.name}_page{page_num+1}_img{img_idx+1}",
-                        "content_type": "image",
-                        "pdf_page": page_num + 1,
-                        "ocr_engine": "PaddleOCR",
-                    }
-                )
-                image_docs.append(doc)
-
-        pdf_doc.close()
-        return image_docs
+        for page_num, img_idx, image_ref, ocr_text in self.pdf_ocr.iter_pdf(file_path):
+            yield Document(
+                page_content=ocr_text or "PDF图片无可识别文字",
+                metadata={
+                    "file_name": f"{file_path.name}_page{page_num+1}_img{img_idx+1}",
+                    "content_type": "image",
+                    "pdf_page": page_num + 1,
+                    "image_ref": image_ref,
+                    "ocr_engine": "PaddleOCR",
+                }
+            )
+
+    def extract_images_from_pdf(self, file_path: str) -> List[Document]:
+        return list(self.iter_pdf_image_documents(file_path))
 
     # 4. 统一入口：加载任意类型文档
-    def load_document(self, file_path: str) -> List[Document]:
+    def iter_document(self, file_path: str) -> Iterator[Document]:
         file_path = Path(file_path)
         file_ext = file_path.suffix.lower()
         # 支持的文件类型直接内联判断
         if file_ext in [".txt", ".pdf", ".docx", ".md"]:
+            yield from self.iter_text_document(file_path)
             if file_ext == ".pdf":
-                text_docs = self.load_text_document(file_path)
-                image_docs = self.extract_images_from_pdf(file_path)
-                return text_docs + image_docs
-            else:
-                return self.load_text_document(file_path)
+                yield from self.iter_pdf_image_documents(file_path)
         elif file_ext in [".jpg", ".jpeg", ".png", ".bmp"]:
-            return self.process_image(file_path)
-        else:
-            return []
+            yield from self.process_image(file_path)
+
+    def load_document(self, file_path: str) -> List[Document]:
+        return list(self.iter_document(file_path))
 
     # 5. 批量入库
     def add_documents_to_db(self, file_paths: List[str]) -> int:
         total_chunks = 0
         for file_path in file_paths:
-            docs = self.load_document(file_path)
-            self.vector_store.add_documents(docs)
-            total_chunks += len(docs)
+            before = dict(self.pdf_ocr.stats)  # stats 在多个文件间累计，按文件输出增量
+            docs = self.iter_document(file_path)
+            # OCR结果边产出边入库：整本扫描手册不必全部识别完才开始写入
+            while batch := list(islice(docs, self.insert_batch_size)):
+                self.vector_store.add_documents(batch)
+                total_chunks += len(batch)
+            file_stats = {key: value - before.get(key, 0) for key, value in self.pdf_ocr.stats.items()}
+            print(f"🖼️ {Path(file_path).name} 图片OCR统计：{file_stats}")
         return total_chunks
 
+    def close(self):
+        self.pdf_ocr.close()
+
+# ========== 提示词（模块级预编译：系统消息为静态前缀，检索上下文放在用户消息中） ==========
+MULTIMODAL_QA_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content="""你是设备运维助手，基于用户消息中<context>标签内的上下文回答：
+规则：
+1. 图片信息（来源标注为 image 的OCR内容）优先于文本
+2. 仅用上下文信息，不编造内容
+3. 技术问题按「问题分析→解决方案→操作步骤」回答"""),
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("human", "<context>\n{context}\n</context>\n\n问题：{input}")
+])
+# 文本块与图片块统一格式：content_type 为 text / image
+MULTIMODAL_DOCUMENT_PROMPT = PromptTemplate.from_template("[来源：{file_name}（{content_type}）] {page_content}")
+
 # ========== 核心：多模态RAG Agent（极简版） ==========
 class MultiModalRAGAgent:
     """多模态RAG核心类：整合Embedding→向量库→检索→生成"""
@@ -171,10 +167,14 @@ class MultiModalRAGAgent:
         self.llm = llm
 
         # 初始化核心组件（极简风格：所有配置直接内联，无中间变量）
-        self.embeddings = HuggingFaceEmbeddings(
+        self.embeddings = CachedEmbeddings(  # 持久化向量缓存：重复入库/重复提问不再重复前向计算
+            HuggingFaceEmbeddings(
+                model_name="openai/clip-vit-base-patch16",
+                model_kwargs={"device": "cpu", "trust_remote_code": True},
+                encode_kwargs={"normalize_embeddings": True},
+            ),
             model_name="openai/clip-vit-base-patch16",
-            model_kwargs={"device": "cpu", "trust_remote_code": True},
-            encode_kwargs={"normalize_embeddings": True},
+            cache_dir="data/embedding_cache",
         )
         self.vector_store = Milvus(
             embedding_function=self.embeddings,
@@ -200,27 +200,8 @@ class MultiModalRAGAgent:
         # 文档组合链
         document_chain = create_stuff_documents_chain(
             self.llm,
-            ChatPromptTemplate.from_messages([ # 多模态Prompt
-                ("system", """你是设备运维助手，基于以下上下文回答：
-                <context>
-                {context}
-                </context>
-                规则：
-                1. 图片信息（标注[图片来源]）优先于文本
-                2. 仅用上下文信息，不编造内容
-                3. 技术问题按「问题分析→解决方案→操作步骤」回答
-                """),MessagesPlaceholder(variable_name="chat_history"),
-                ("human", "{input}")
-                ]),
-            document_prompt=ChatPromptTemplate.from_messages([
-                ("system", """
-                {% if doc.metadata.content_type == 'text' %}
-                [文本来源：{{doc.metadata.file_name}}] {{doc.page_content}}
-                {% else %}
-                [图片来源：{{doc.metadata.file_name}}] OCR内容：{{doc.page_content}}
-                {% endif %}
-                """)
-            ])
+            MULTIMODAL_QA_PROMPT,  # 多模态Prompt（模块级预编译）
+            document_prompt=MULTIMODAL_DOCUMENT_PROMPT,
         )
 
         # 完整RAG链
@@ -230,6 +211,10 @@ class MultiModalRAGAgent:
             rephrase_question=False
         )
 
+    # 按引用加载图片原件（仅在多模态回答确实需要原图时调用）
+    def load_image(self, image_ref: str) -> Image.Image:
+        return self.document_processor.blobs.open_image(image_ref)
+
     # 核心运行逻辑
     def run(self, state: Dict[str, Any]) -> Dict[str, List[BaseMessage]]:
         messages = state.get("messages", [])
@@ -241,7 +226,12 @@ class MultiModalRAGAgent:
             "chat_history": chat_history,
         })
 
-        return {"messages": [AIMessage(content=result.get("answer", "无法回答该问题"))]}
+        # 回答只附带参考图片的引用，需要展示或送入视觉模型时再调用 load_image
+        image_refs = list(dict.fromkeys(
+            doc.metadata["image_ref"] for doc in result.get("context", []) if doc.metadata.get("image_ref")
+        ))
+        return {"messages": [AIMessage(content=result.get("answer", "无法回答该问题"),
+                                       additional_kwargs={"image_refs": image_refs} if image_refs else {})]}
 
 # ========== 兼容接口：创建Graph节点 ==========
 def create_multimodal_rag_agent_node(llm: Any, retriever: Optional[Any] = None) -> callable:
@@ -262,6 +252,7 @@ if __name__ == "__main__":
         "docs/维护规范.txt"
     ]
     mm_rag_agent.document_processor.add_documents_to_db(knowledge_files)
+    mm_rag_agent.document_processor.close()
 
     # 问答示例
     query = "设备显示008通信故障怎么处理？"
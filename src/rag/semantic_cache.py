@@ -0,0 +1,119 @@
+"""
+RAG 语义答案缓存
+以归一化的 BGE 查询向量 + 知识库集合版本号 + 对话上下文键为键：新问题与缓存问题的余弦相似度 ≥ 阈值，
+且版本号与上下文键都一致时直接返回缓存答案，跳过 Milvus 检索与 LLM 生成。
+上下文键为此前对话历史的哈希（无历史时为空串），追问只会命中同一段对话下的答案。
+淘汰策略为 LRU + TTL，知识库入库新文档时整体失效。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """基于向量相似度的答案缓存（进程内，线程安全）"""
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # 槽位 → 条目信息，按最近使用顺序排列（队首为最久未使用）
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._free_slots: List[int] = list(range(max_entries - 1, -1, -1))
+        self._matrix: Optional[np.ndarray] = None  # max_entries × dim，空槽位为零向量
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vec)) or 1.0
+        return vec / norm
+
+    def _release(self, slot: int):
+        """释放槽位（调用方持有锁）"""
+        self._entries.pop(slot, None)
+        self._matrix[slot] = 0.0
+        self._free_slots.append(slot)
+
+    def _evict_expired(self, now: float):
+        expired = [slot for slot, entry in self._entries.items() if now - entry["created_at"] > self.ttl_seconds]
+        for slot in expired:
+            self._release(slot)
+
+    def lookup(self, vector, version: int, context: str = "") -> Optional[str]:
+        """查找相似问题的缓存答案（版本号与上下文键须一致），未命中返回None"""
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            if self._matrix is not None and self._entries:
+                self._evict_expired(now)
+            if self._matrix is None or not self._entries:
+                self.misses += 1
+                return None
+            scores = self._matrix @ query
+            best_slot, best_score = -1, -1.0
+            # 只在当前集合版本、同一对话上下文的有效条目中选最相似的一条
+            for slot, entry in self._entries.items():
+                score = float(scores[slot])
+                if entry["version"] == version and entry["context"] == context and score > best_score:
+                    best_slot, best_score = slot, score
+            if best_slot < 0 or best_score < self.threshold:
+                self.misses += 1
+                return None
+            entry = self._entries[best_slot]
+            self._entries.move_to_end(best_slot)
+            self.hits += 1
+            self.saved_seconds += entry["compute_seconds"]
+            return entry["answer"]
+
+    def put(self, vector, version: int, answer: str, compute_seconds: float = 0.0, context: str = ""):
+        """写入缓存；容量满时淘汰最久未使用的条目"""
+        query = self._normalize(vector)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+            if not self._free_slots:
+                self._evict_expired(time.time())
+            if not self._free_slots:
+                lru_slot = next(iter(self._entries))
+                self._release(lru_slot)
+            slot = self._free_slots.pop()
+            self._matrix[slot] = query
+            self._entries[slot] = {
+                "version": version,
+                "context": context,
+                "answer": answer,
+                "created_at": time.time(),
+                "compute_seconds": compute_seconds,
+            }
+
+    def invalidate(self):
+        """清空缓存（知识库内容变更时调用）"""
+        with self._lock:
+            for slot in list(self._entries.keys()):
+                self._release(slot)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+# 代码说明：
+# 1. 功能定位：为RAG节点提供语义级答案缓存，运维人员高频重复的问题（如“008通信故障怎么处理”）无需重复检索与生成；
+# 2. 核心逻辑：
+#    - 缓存向量存放在预分配的float32矩阵中，一次矩阵乘法即可得到与全部缓存问题的相似度；
+#    - 条目记录集合版本号与对话上下文键，任一不一致的条目不会被命中（追问不会拿到其他会话的答案）；
+#    - OrderedDict维护LRU顺序，查找时顺带清理超过TTL的条目；
+# 3. 可观测性：stats() 返回命中/未命中次数、命中率以及命中所节省的累计耗时（秒）；
+# 4. 应用场景：由SimplePDFRAGAgent在检索之前调用，load_pdf_to_db入库后自动失效。
@@ -0,0 +1,278 @@
+"""
+结构感知的流式PDF切片器 - 逐页输入，按标题/编号步骤/表格切分，块大小按 token 计
+    - 逐行识别：标题（第X章/节、一、、1.2/1.2.3、Markdown #）维护章节路径；编号步骤以步骤为最小单位；
+      连续的多列行识别为表格，以行为最小单位，表格跨块时在新块开头重复表头；
+    - 装箱：同一章节内的单位按 token 预算合并为块，章节变化时立即结束当前块，块不跨章节；
+      超长段落按句拆分，普通段落之间保留少量句级重叠；
+    - 元数据：page（起始页，从0开始，与 PyPDFLoader 一致）、page_end、section_path、block_type；
+      块正文以【章节路径】开头，向量与BM25都能利用标题信息；
+    - 流式：状态只包含当前未完成的块与当前段落，内存占用与PDF页数无关。
+"""
+import math
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+_CJK_RANGE = "\u3400-\u9fff\uf900-\ufaff"
+_CJK = re.compile(f"[{_CJK_RANGE}]")
+_WORD = re.compile(r"[A-Za-z]+|\d+")
+_PUNCT = re.compile(rf"[^\sA-Za-z\d{_CJK_RANGE}]")
+_SENTENCE_END = re.compile(r"(?<=[。！？；!?;\n])")
+
+_CN_NUM = "一二三四五六七八九十百零〇"
+# 数字后紧跟的计量单位：3.5 V、1.5mm、10.5 kg 是参数值而不是 1.2 形式的编号标题
+_UNITS = (r"(?:[kKmMu\u00b5\u03bc]?(?:V|A|W|Hz|[\u03a9\u2126]|Pa|N)|kWh|Ah|mAh|VA|kVA|[kcm\u00b5\u03bc]?m|[km]?g|t|"
+          r"m[lL]|L|s|ms|min|h|rpm|bar|dB|in|ft|lb|psi|%|\u00b0C?|\u2103)(?![A-Za-z\d])"
+          r"|(?:毫米|厘米|千克|公斤|毫升|千瓦|赫兹|小时|分钟|伏特|安培)"
+          r"|[米克秒度升瓦伏安倍](?=$|[\s，,。；;、/)）])")
+_HEADINGS = [
+    (re.compile(r"^(#{1,6})\s+\S"), None),  # Markdown 标题：级别为 # 个数
+    (re.compile(rf"^第[{_CN_NUM}\d]+[章篇部]"), 1),
+    (re.compile(rf"^第[{_CN_NUM}\d]+节"), 2),
+    (re.compile(rf"^[{_CN_NUM}]+[、．.]\s*\S"), 2),
+    (re.compile(rf"^[（(][{_CN_NUM}]+[）)]\s*\S"), 3),
+    # 1.2 / 1.2.3：级别为层数；编号后须是中文或字母开头的标题词，且不能是计量单位
+    (re.compile(rf"^([1-9]\d?(?:\.\d{{1,2}})+)\.?\s*(?!{_UNITS})(?=[A-Za-z{_CJK_RANGE}])"), None),
+]
+_STEP = re.compile(r"^(?:\d{1,2}[.、．)）](?!\d)|[（(]\d{1,2}[）)]|[①-⑳]|步骤\s*\d+|第[一二三四五六七八九十\d]+步|[Ss]tep\s*\d+)")
+_HEADING_MAX_CHARS = 40
+_HEADING_BAD_END = tuple("。；;，,：:？?！!")
+
+
+def approx_token_count(text: str) -> int:
+    """近似 token 数：中文每字一个，英文单词/数字按每4字符一个，标点各一个"""
+    words = sum(math.ceil(len(w) / 4) for w in _WORD.findall(text))
+    return len(_CJK.findall(text)) + words + len(_PUNCT.findall(text))
+
+
+def model_token_counter(model_name: str) -> Callable[[str], int]:
+    """使用嵌入模型自带分词器计数（与模型最大长度一致）；transformers 不可用时退回近似计数"""
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        print(f"⚠️  加载分词器失败（{e}），切片改用近似 token 计数")
+        return approx_token_count
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def classify_line(line: str) -> Tuple[str, int]:
+    """行类型：heading（附级别）/ table / step / text"""
+    if line.count("|") >= 2 or "\t" in line or len(re.findall(r"\S {2,}(?=\S)", line)) >= 2:
+        return "table", 0
+    if len(line) <= _HEADING_MAX_CHARS and not line.endswith(_HEADING_BAD_END):
+        for pattern, level in _HEADINGS:
+            match = pattern.match(line)
+            if match:
+                if level is None:
+                    level = len(match.group(1)) if line.startswith("#") else match.group(1).count(".") + 1
+                return "heading", level
+    if _STEP.match(line):
+        return "step", 0
+    return "text", 0
+
+
+def iter_pdf_pages(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """逐页抽取文本（pypdf，与 PyPDFLoader 结果一致），不整本读入内存"""
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    for page_no, page in enumerate(reader.pages):
+        yield page_no, page.extract_text() or ""
+
+
+class _Unit:
+    __slots__ = ("kind", "text", "tokens", "page", "page_end", "header", "glue")
+
+    def __init__(self, kind: str, text: str, tokens: int, page: int, page_end: int):
+        self.kind, self.text, self.tokens = kind, text, tokens
+        self.page, self.page_end = page, page_end
+        self.header: Optional[_Unit] = None  # 表格行所属表格的表头
+        self.glue = False  # 与前一单位同属一段（拆句产生），拼接时不换行
+
+
+class ChunkStream:
+    """单个文件的切片状态：feed() 逐页输入并返回已完成的块，close() 输出剩余内容"""
+    def __init__(self, chunker: "StructuredChunker", metadata: Dict[str, Any]):
+        self.chunker = chunker
+        self.metadata = metadata
+        self.sections: List[Tuple[int, str]] = []
+        self.prefix = ""
+        self.budget = chunker.chunk_tokens
+        # 当前章节标题所在页：章节下还没有任何内容时非 None（只有标题的页也要产出一个块）
+        self.heading_page: Optional[int] = None
+        # 当前块（行级）：每项为 (行列表, [起始页, 结束页])，段落只有一项，步骤/表格每步/每行一项
+        self.block_kind: Optional[str] = None
+        self.block_items: List[Tuple[List[str], List[int]]] = []
+        # 当前块（装箱中）
+        self.units: List[_Unit] = []
+        self.unit_tokens = 0
+        self.ready: List[Document] = []
+
+    # ---------- 行 → 块 ----------
+    def feed(self, page_no: int, text: str) -> List[Document]:
+        for raw in text.splitlines():
+            line = raw.strip()
+            if not line:
+                if self.block_kind != "table":  # 空行结束段落/步骤；表格允许中间空行
+                    self._end_block()
+                continue
+            kind, level = self.chunker.classify(line)
+            if kind == "heading":
+                self._end_block()
+                self._set_section(level, line.lstrip("#").strip(), page_no)
+                continue
+            if kind in ("table", "step"):
+                self._start_block("steps" if kind == "step" else "table")
+                self.block_items.append(([], [page_no, page_no]))
+            elif self.block_kind != "steps":  # 非步骤续行即普通段落
+                self._start_block("text")
+                if not self.block_items:
+                    self.block_items.append(([], [page_no, page_no]))
+            lines, pages = self.block_items[-1]
+            lines.append(line)
+            pages[1] = page_no
+        ready, self.ready = self.ready, []
+        return ready
+
+    def close(self) -> List[Document]:
+        self._end_block()
+        self._flush()
+        self._emit_heading()
+        ready, self.ready = self.ready, []
+        return ready
+
+    def _start_block(self, kind: str):
+        if self.block_kind != kind:
+            self._end_block()
+            self.block_kind = kind
+
+    def _set_section(self, level: int, title: str, page: int):
+        self._flush()
+        # 空章节被同级或更高级标题结束时单独产出标题块；下级标题会在自己的章节路径中带上它，不必产出
+        if self.sections and level <= self.sections[-1][0]:
+            self._emit_heading()
+        while self.sections and self.sections[-1][0] >= level:
+            self.sections.pop()
+        self.sections.append((level, title))
+        self.prefix = f"【{' > '.join(t for _, t in self.sections)}】\n"
+        self.budget = max(32, self.chunker.chunk_tokens - self.chunker.count(self.prefix))
+        self.heading_page = page
+
+    def _emit_heading(self):
+        """章节下没有任何正文时，以章节路径作为块正文产出（block_type=heading）"""
+        if self.heading_page is None or not self.sections:
+            return
+        self.ready.append(Document(
+            page_content=self.prefix.rstrip("\n"),
+            metadata=dict(self.metadata, page=self.heading_page, page_end=self.heading_page,
+                          section_path=" > ".join(t for _, t in self.sections), block_type="heading"),
+        ))
+        self.heading_page = None
+
+    # ---------- 块 → 单位 ----------
+    def _end_block(self):
+        kind, items = self.block_kind, self.block_items
+        self.block_kind, self.block_items = None, []
+        if not items:
+            return
+        if kind == "table" and len(items) < 2:  # 单行不构成表格
+            kind = "text"
+        if kind == "table":
+            header = self._unit("table", items[0][0][0], *items[0][1])
+            self._add(header)
+            for (row,), pages in items[1:]:
+                unit = self._unit("table", row, *pages)
+                unit.header = header
+                self._add(unit)
+        else:
+            for lines, pages in items:
+                for n, piece in enumerate(self._split_long("\n".join(lines))):
+                    unit = self._unit("steps" if kind == "steps" else "text", piece, *pages)
+                    unit.glue = n > 0
+                    self._add(unit)
+
+    def _unit(self, kind: str, text: str, page: int, page_end: int) -> _Unit:
+        return _Unit(kind, text, self.chunker.count(text), page, page_end)
+
+    def _split_long(self, text: str) -> List[str]:
+        """超出预算的文本拆为句子（装箱时再合并，句级重叠由此实现），单句仍超长时按字符比例硬切"""
+        if self.chunker.count(text) <= self.budget:
+            return [text]
+        pieces = []
+        for sentence in filter(None, (s.strip() for s in _SENTENCE_END.split(text))):
+            tokens = self.chunker.count(sentence)
+            if tokens > self.budget:
+                step = max(1, int(len(sentence) * self.budget / tokens))
+                pieces.extend(sentence[i:i + step] for i in range(0, len(sentence), step))
+            else:
+                pieces.append(sentence)
+        return pieces
+
+    # ---------- 单位 → 文档块 ----------
+    def _add(self, unit: _Unit):
+        self.heading_page = None
+        if self.units and self.unit_tokens + unit.tokens > self.budget:
+            self._flush(carry=True)
+            if self.unit_tokens + unit.tokens > self.budget:  # 重叠部分放不下时放弃重叠
+                self.units, self.unit_tokens = [], 0
+        if not self.units and unit.header is not None:  # 表格跨块：新块以表头开始
+            self.units.append(unit.header)
+            self.unit_tokens += unit.header.tokens
+        self.units.append(unit)
+        self.unit_tokens += unit.tokens
+
+    def _flush(self, carry: bool = False):
+        if not self.units:
+            return
+        units = self.units
+        kinds = {u.kind for u in units}
+        block_type = "table" if "table" in kinds else "steps" if "steps" in kinds else "text"
+        # 表格续块开头重复的表头不计入起始页
+        first = units[1] if len(units) > 1 and units[1].header is units[0] else units[0]
+        self.ready.append(Document(
+            page_content=self.prefix + "".join(("" if i == 0 or u.glue else "\n") + u.text for i, u in enumerate(units)),
+            metadata=dict(self.metadata, page=first.page, page_end=max(u.page_end for u in units),
+                          section_path=" > ".join(t for _, t in self.sections), block_type=block_type),
+        ))
+        self.units, self.unit_tokens = [], 0
+        if carry:
+            # 只有普通段落保留句级重叠；步骤与表格行本身是完整单位，不重复
+            tail: List[_Unit] = []
+            for unit in reversed(units[1:]):
+                if unit.kind != "text" or self.unit_tokens + unit.tokens > self.chunker.overlap_tokens:
+                    break
+                tail.insert(0, unit)
+                self.unit_tokens += unit.tokens
+            self.units = tail
+
+
+class StructuredChunker:
+    """结构感知切片器：chunk_tokens 为单块 token 上限（含章节路径前缀），overlap_tokens 为段落重叠上限"""
+    def __init__(self, chunk_tokens: int = 384, overlap_tokens: int = 48,
+                 token_counter: Optional[Callable[[str], int]] = None):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count = token_counter or approx_token_count
+        self.classify = classify_line
+
+    def stream(self, metadata: Dict[str, Any]) -> ChunkStream:
+        return ChunkStream(self, metadata)
+
+    def iter_chunks(self, pages: Iterable[Tuple[int, str]], metadata: Dict[str, Any]) -> Iterator[Document]:
+        """逐页切片：pages 为 (页码, 页面文本) 的可迭代对象（可以是生成器）"""
+        stream = self.stream(metadata)
+        for page_no, text in pages:
+            yield from stream.feed(page_no, text)
+        yield from stream.close()
+
+# 代码说明：
+# 1. 功能定位：替代按字符数的 RecursiveCharacterTextSplitter，切片不再截断表格与操作步骤，检索到的块语义完整；
+# 2. 核心逻辑：
+#    - classify_line：表格行 → 标题（长度与结尾标点约束，避免把正文误判为标题；1.2 形式的编号排除 3.5 V 等带单位的数值）
+#      → 编号步骤 → 普通文本；
+#    - ChunkStream：行合并为段落/步骤/表格，再拆为最小单位，按 token 预算装箱，章节切换时结束当前块；
+#      没有正文的章节（如只有标题的页）单独产出一个标题块，标题不会丢失；
+#    - token 计数：默认近似计数，可注入嵌入模型分词器（model_token_counter）；
+# 3. 技术特点：跨页的段落与表格不会被页边界截断，块元数据记录起止页；状态只保留一个未完成块，1000页PDF内存占用不变；
+# 4. 应用场景：SimplePDFRAGAgent.load_pdf_to_db、批量入库 ingest 与 rag_agent0 的文本文档加载。
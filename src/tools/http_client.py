@@ -0,0 +1,126 @@
+"""
+工具层共享HTTP客户端 - 连接池 + 重试退避 + 按主机并发限制
+同一进程内所有工具调用复用一个 httpx.Client 连接池，
+突发的多次工具调用复用 keep-alive 连接，不再每次重新做 TCP+TLS 握手。
+配置来源：
+    mcp.timeout / mcp.retry_count                 单次请求超时与最大重试次数
+    mcp.connection_pool.*                         连接池大小、keep-alive 连接数与过期时间、单主机并发上限
+    workflow.retry_policy.backoff_factor/max_backoff  指数退避参数
+"""
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from core.config import get_settings
+from core.config_model import MCPConfig, WorkflowRetryConfig
+
+# 可重试的HTTP状态码：限流与网关类临时错误
+RETRYABLE_STATUS = {429, 502, 503, 504}
+# 服务端明确未处理请求的状态码，非幂等请求也可重试
+REJECTED_STATUS = {429, 503}
+# 幂等方法：请求可能已被处理（读超时、网关超时）时重发也不会产生副作用
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# 请求尚未发出的网络错误（连接失败、等待连接池超时），任何方法都可安全重试
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class PooledHttpClient:
+    """带连接池、重试与单主机并发限制的HTTP客户端"""
+    def __init__(self, mcp_config: MCPConfig, retry_policy: WorkflowRetryConfig):
+        pool = mcp_config.connection_pool
+        self.retry_count = max(0, mcp_config.retry_count)
+        self.backoff_factor = retry_policy.backoff_factor
+        self.max_backoff = retry_policy.max_backoff
+        self.max_per_host = max(1, pool.max_per_host)
+        self._timeout = httpx.Timeout(mcp_config.timeout)
+        self._limits = httpx.Limits(
+            max_connections=pool.max_connections,
+            max_keepalive_connections=pool.max_keepalive_connections,
+            keepalive_expiry=pool.keepalive_expiry,
+        )
+        self._client = httpx.Client(timeout=self._timeout, limits=self._limits)
+        self._lock = threading.Lock()
+        self._host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+    # ---------- 内部工具 ----------
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlsplit(url).netloc
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = self._host(url)
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_semaphores[host]
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """指数退避（带少量抖动）；429/503 携带 Retry-After 时优先使用服务端建议值"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        delay = min(self.backoff_factor * (2 ** attempt), self.max_backoff)
+        return delay + random.uniform(0, delay * 0.1)
+
+    def _should_retry(self, attempt: int, method: str, response: Optional[httpx.Response] = None,
+                      error: Optional[Exception] = None) -> bool:
+        """非幂等请求（如 POST）只在确定未被处理时重试：连接错误或 429/503"""
+        if attempt >= self.retry_count:
+            return False
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        if error is not None:
+            return idempotent or isinstance(error, CONNECT_ERRORS)
+        if response is None:
+            return False
+        if idempotent:
+            return response.status_code in RETRYABLE_STATUS
+        return response.status_code in REJECTED_STATUS
+
+    # ---------- 请求接口 ----------
+    def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """发送请求：网络错误与可重试状态码按退避策略重试，最终仍失败时抛出异常"""
+        attempt = 0
+        while True:
+            response = None
+            try:
+                with self._host_semaphore(url):
+                    response = self._client.request(method, url, **kwargs)
+                if response.status_code not in RETRYABLE_STATUS:
+                    return response
+            except httpx.TransportError as e:
+                if not self._should_retry(attempt, method, error=e):
+                    raise
+            if response is not None and not self._should_retry(attempt, method, response):
+                return response
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    # ---------- 资源释放 ----------
+    def close(self):
+        self._client.close()
+
+
+@lru_cache()
+def get_http_client() -> PooledHttpClient:
+    """进程内共享的HTTP客户端（单例）"""
+    settings = get_settings()
+    return PooledHttpClient(settings.mcp, settings.workflow.retry_policy)
+
+# 代码说明：
+# 1. 功能定位：为 post_external_api 等工具函数提供共享连接池，替代每次调用 requests.post 新建连接；
+# 2. 核心逻辑：
+#    - 连接池：httpx.Limits 使用 mcp.connection_pool 的连接数与 keep-alive 配置；
+#    - 重试：网络错误与 429/502/503/504 按 backoff_factor * 2^n（不超过 max_backoff）退避重试 mcp.retry_count 次；
+#      非幂等方法（POST/PATCH）只重试连接错误与 429/503，读超时、502/504 时请求可能已生效，不重发；
+#    - 单主机并发：按 host 维护信号量，突发调用不会压垮单个下游服务；
+# 3. 技术特点：工具函数均为同步实现（异步节点中由 LangChain 放到线程池执行），共享一个线程安全的 httpx.Client；
+# 4. 应用场景：工具层调用外部业务系统接口，由 get_http_client() 获取单例。
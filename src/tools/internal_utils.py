@@ -1,8 +1,8 @@
-import requests
 import json
 from typing import Optional
 from pydantic import BaseModel, Field
 from core.config import get_settings
+from src.tools.http_client import get_http_client
 
 # 加载项目配置，获取外部API的域名前缀
 settings = get_settings()
@@ -36,8 +36,9 @@ def get_auth_and_payload(params: BaseModel) -> tuple[dict, str]:
 '''
 外部API的POST请求工具函数
 功能：封装HTTP POST请求，自动处理请求头、认证信息，返回API响应（或错误信息）
+请求经共享连接池发送，超时/重试/退避/单主机并发上限取自 mcp 与 workflow.retry_policy 配置
 '''
-def post_external_api(url_suffix: str, params: dict, authorization: str = "") -> dict:
+def _build_request(url_suffix: str, authorization: str) -> tuple[str, dict]:
     # 基础请求头（指定JSON格式）
     headers = {"Content-Type": "application/json"}
     # 若有认证信息，添加到请求头
@@ -45,14 +46,17 @@ def post_external_api(url_suffix: str, params: dict, authorization: str = "") ->
         headers["Authorization"] = authorization
     # 拼接完整请求URL（若配置了域名前缀则拼接，否则直接使用传入的后缀）
     req_url = f"{REQ_DOMAIN_URL}{url_suffix}" if REQ_DOMAIN_URL else url_suffix
+    return req_url, headers
 
+def post_external_api(url_suffix: str, params: dict, authorization: str = "") -> dict:
+    req_url, headers = _build_request(url_suffix, authorization)
     try:
-        # 发送POST请求（超时60秒）
-        response = requests.post(req_url, headers=headers, json=params, timeout=60)
+        # 发送POST请求（复用连接池中的keep-alive连接）
+        response = get_http_client().post(req_url, headers=headers, json=params)
         # 检查请求是否成功（非2xx状态码会抛出异常）
         response.raise_for_status()
         # 返回JSON格式的响应结果
         return response.json()
     except Exception as e:
         # 捕获异常并返回错误信息
-        return {'error': f"请求失败: {str(e)}"}
\ No newline at end of file
+        return {'error': f"请求失败: {str(e)}"}
@@ -2,9 +2,11 @@
 from src.utils.auth_injection import authToken_inject
 # 导入上下文消息裁剪工具函数
 from src.utils.model_hook import trim_msg, get_last_user_input
+# 导入增量上下文窗口
+from src.utils.context_window import build_context
 
 # 定义utils包对外暴露的核心工具接口
-__all__ = ["authToken_inject", "trim_msg", "get_last_user_input"]
+__all__ = ["authToken_inject", "trim_msg", "get_last_user_input", "build_context"]
 
 # 代码说明：
 # 1. 核心作用：该文件是`utils`工具包的初始化文件，负责统一对外暴露包内的核心工具函数，简化其他模块的导入操作；
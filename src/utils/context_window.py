@@ -0,0 +1,152 @@
+"""
+增量上下文窗口 - 按会话缓存每条消息的 token 数，避免每个节点都对整段历史重新裁剪
+窗口始终是 messages 的一个后缀，保存在图状态 context_window 字段中（随检查点持久化）：
+    seen      上次更新时的消息总数（messages[:seen] 已计数）
+    last_id   messages[seen-1] 的消息ID，用于发现历史被改写（删除/替换）时重建
+    counts    窗口内每条消息的 token 数（窗口 = messages[seen-len(counts):seen]）
+    total     counts 之和
+    summary   被淘汰轮次的摘要（配置了摘要钩子时）
+每次更新只对新增消息计数，并从窗口前端按整轮淘汰，组装提示词的开销为 O(新增消息数)。
+淘汰时不拆散工具调用组（带 tool_calls 的 AI 消息与其 ToolMessage 一起移出），最后一条用户消息始终保留。
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+# 摘要钩子：(原摘要, 本次被淘汰的消息) → 新摘要
+Summarizer = Callable[[Optional[str], List[BaseMessage]], str]
+
+
+class ContextWindowConfig:
+    MAX_TOKENS: int = 16384   # 窗口 token 上限（含摘要）
+    MAX_MESSAGES: int = 15    # 窗口消息条数上限
+
+
+def _count(message: BaseMessage) -> int:
+    return count_tokens_approximately([message])
+
+
+def _floor(messages: List[BaseMessage], start: int, end: int) -> Tuple[int, bool]:
+    """窗口 messages[start:end] 的淘汰下限：最后一条用户消息；没有用户消息时为最后一个工具调用组的起点
+    返回 (下限下标, 窗口内是否有用户消息)"""
+    group = end - 1
+    for i in range(end - 1, start - 1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return i, True
+        if group == i and isinstance(messages[i], ToolMessage):
+            group = i - 1
+    return max(start, group), False
+
+
+def _is_boundary(message: BaseMessage, has_human: bool) -> bool:
+    """窗口可以从这条消息开始：有用户消息时必须以用户消息开头，否则不能以孤立的 ToolMessage 开头"""
+    if has_human:
+        return isinstance(message, HumanMessage)
+    return not isinstance(message, ToolMessage)
+
+
+def _last_human(messages: List[BaseMessage]) -> Optional[int]:
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return i
+    return None
+
+
+def _is_valid(window: Optional[Dict[str, Any]], messages: List[BaseMessage]) -> bool:
+    if not window:
+        return False
+    seen = window.get("seen", 0)
+    if seen > len(messages) or len(window.get("counts", [])) > seen:
+        return False
+    return seen == 0 or getattr(messages[seen - 1], "id", None) == window.get("last_id")
+
+
+def update_context_window(window: Optional[Dict[str, Any]], messages: List[BaseMessage],
+                          max_tokens: int = ContextWindowConfig.MAX_TOKENS,
+                          max_messages: int = ContextWindowConfig.MAX_MESSAGES,
+                          summarizer: Optional[Summarizer] = None) -> Dict[str, Any]:
+    """根据最新消息列表增量更新窗口，返回新的窗口字典（不修改入参）"""
+    if _is_valid(window, messages):
+        counts = list(window["counts"])
+        total = window["total"]
+        summary = window.get("summary")
+        summary_tokens = window.get("summary_tokens", 0)
+        start = window["seen"] - len(counts)
+        new_messages = messages[window["seen"]:]
+    else:
+        # 首次使用或历史被改写：从末尾向前计数，覆盖到窗口上限为止（至少覆盖到最后一条用户消息）
+        counts, total, summary, summary_tokens = [], 0, None, 0
+        last_human = _last_human(messages)
+        start = len(messages)
+        while start > 0:
+            c = _count(messages[start - 1])
+            required = last_human is not None and start - 1 >= last_human
+            if not required and (len(counts) >= max_messages or (counts and total + c > max_tokens)):
+                break
+            counts.insert(0, c)
+            total += c
+            start -= 1
+        new_messages = []
+
+    for message in new_messages:
+        c = _count(message)
+        counts.append(c)
+        total += c
+
+    # 从前端淘汰：超出条数/token上限，或窗口不在轮次边界上（以AI/工具消息开头）
+    # 淘汰到下一条用户消息为止，工具调用组随所在轮次整体移出；最后一条用户消息及其后的消息不淘汰（宁可超限）
+    evicted_from = start
+    floor, has_human = _floor(messages, start, len(messages))
+    while start < floor and (
+            len(counts) > max_messages
+            or total + summary_tokens > max_tokens
+            or not _is_boundary(messages[start], has_human)):
+        total -= counts.pop(0)
+        start += 1
+    if summarizer is not None and start > evicted_from:
+        summary = summarizer(summary, list(messages[evicted_from:start]))
+        summary_tokens = count_tokens_approximately([SystemMessage(content=summary)]) if summary else 0
+
+    return {
+        "seen": len(messages),
+        "last_id": getattr(messages[-1], "id", None) if messages else None,
+        "counts": counts,
+        "total": total,
+        "summary": summary,
+        "summary_tokens": summary_tokens,
+    }
+
+
+def window_messages(window: Dict[str, Any], messages: List[BaseMessage],
+                    last_n: Optional[int] = None) -> List[BaseMessage]:
+    """取出窗口内的消息（可再限制为最近 last_n 条，仍保证以用户消息开头、保留最后一条用户消息），有摘要时置于最前"""
+    seen = window["seen"]
+    start = seen - len(window["counts"])
+    if last_n is not None and seen - start > last_n:
+        floor, has_human = _floor(messages, start, seen)
+        start = min(seen - last_n, floor)
+        while start < floor and not _is_boundary(messages[start], has_human):
+            start += 1
+    selected = list(messages[start:seen])
+    if window.get("summary"):
+        selected.insert(0, SystemMessage(content=f"此前对话摘要：{window['summary']}"))
+    return selected
+
+
+def build_context(state: Dict[str, Any], last_n: Optional[int] = None,
+                  summarizer: Optional[Summarizer] = None) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+    """节点使用的便捷入口：返回 (提示词消息列表, 更新后的窗口)；节点应把窗口写回状态 context_window"""
+    messages = state.get("messages", [])
+    window = update_context_window(state.get("context_window"), messages, summarizer=summarizer)
+    return window_messages(window, messages, last_n=last_n), window
+
+# 代码说明：
+# 1. 功能定位：替代各节点对整段历史重复执行 trim_messages + count_tokens_approximately 的做法；
+# 2. 核心逻辑：
+#    - update_context_window：校验窗口与消息列表是否一致（seen/last_id），一致时只计数新增消息，否则从末尾重建；
+#    - 淘汰：超过条数/token上限时从前端按整轮移出，窗口以用户消息开头，不留下孤立的 ToolMessage 或缺少结果的 tool_calls；
+#      最后一条用户消息始终保留；可选摘要钩子把移出的轮次折叠为摘要；
+#    - window_messages / build_context：按窗口切片取消息，节点把新窗口写回状态，下个节点/下一轮即可复用；
+# 3. 技术特点：窗口为纯字典，随检查点持久化；只缓存 token 数而不复制消息；
+# 4. 应用场景：trim_msg、闲聊节点、工具链 Agent 组装提示词时使用。
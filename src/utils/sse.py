@@ -0,0 +1,109 @@
+"""
+SSE（Server-Sent Events）会话事件日志 - 支持心跳与断线续传
+每个会话一份有界事件日志（deque），事件ID在会话内单调递增：
+    - 图执行在后台任务中运行，把事件写入日志，与HTTP连接解耦；
+    - 订阅方从指定事件ID之后读取：先回放日志中的历史事件，再等待新事件；
+    - 断线重连时携带 Last-Event-ID，即可从断点继续接收，不会重复执行图；
+    - 长时间无事件时发送注释行心跳，防止代理/负载均衡断开空闲连接。
+"""
+import asyncio
+import json
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Optional, Tuple
+
+# 终止事件：订阅方收到后，若没有新的执行在进行则结束本次响应
+TERMINAL_EVENTS = {"end", "error", "cancel"}
+
+
+def format_sse(event_id: Optional[int], event: str, data: Any) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class SessionEventLog:
+    """单个会话的事件日志：发布方追加事件，订阅方按事件ID增量读取"""
+    def __init__(self, max_events: int = 512):
+        self.events: Deque[Tuple[int, str, Any]] = deque(maxlen=max_events)
+        self.last_id = 0
+        self.active = False
+        self._cond: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def publish(self, event: str, data: Any) -> int:
+        cond = self._condition()
+        async with cond:
+            self.last_id += 1
+            self.events.append((self.last_id, event, data))
+            if event == "start":
+                self.active = True
+            elif event in TERMINAL_EVENTS:
+                self.active = False
+            cond.notify_all()
+            return self.last_id
+
+    def _after(self, cursor: int):
+        return [e for e in self.events if e[0] > cursor]
+
+    async def subscribe(self, last_event_id: int, heartbeat: float) -> AsyncIterator[str]:
+        """输出 last_event_id 之后的事件（SSE 文本格式）；执行结束且无新事件时返回"""
+        cond = self._condition()
+        cursor = last_event_id
+        if self.events and cursor < self.events[0][0] - 1:
+            # 断点之后的部分事件已被淘汰，提示客户端内容不完整
+            yield format_sse(None, "gap", {"from": cursor, "oldest": self.events[0][0]})
+        while True:
+            async with cond:
+                pending = self._after(cursor)
+                if not pending:
+                    if not self.active:
+                        return
+                    try:
+                        await asyncio.wait_for(cond.wait(), heartbeat)
+                    except asyncio.TimeoutError:
+                        pass
+                    pending = self._after(cursor)
+            if not pending:
+                yield ": ping\n\n"
+                continue
+            for event_id, event, data in pending:
+                cursor = event_id
+                yield format_sse(event_id, event, data)
+
+
+class SSEHub:
+    """会话 → 事件日志，按最近使用淘汰，限制内存占用"""
+    def __init__(self, max_sessions: int = 1024, max_events: int = 512):
+        self.max_sessions = max_sessions
+        self.max_events = max_events
+        self._logs: "OrderedDict[str, SessionEventLog]" = OrderedDict()
+
+    def get(self, session_id: str, create: bool = True) -> Optional[SessionEventLog]:
+        log = self._logs.get(session_id)
+        if log is None and create:
+            log = SessionEventLog(self.max_events)
+            self._logs[session_id] = log
+            # 淘汰最久未使用且没有进行中执行的会话（刚创建的会话尚未 start，不能被淘汰）
+            for sid in list(self._logs):
+                if len(self._logs) <= self.max_sessions:
+                    break
+                if sid != session_id and not self._logs[sid].active:
+                    del self._logs[sid]
+        elif log is not None:
+            self._logs.move_to_end(session_id)
+        return log
+
+# 代码说明：
+# 1. 功能定位：为 /api/chat/stream 提供可续传的事件流，首字节时间从“整段回答生成完”缩短为“第一个事件产生”；
+# 2. 核心逻辑：
+#    - SessionEventLog.publish：追加事件并唤醒订阅方；start/end/error/cancel 维护执行状态；
+#    - SessionEventLog.subscribe：先回放再等待，超时未收到事件时输出心跳注释行；
+#    - SSEHub：按会话维护日志，LRU 淘汰空闲会话；
+# 3. 应用场景：app.py 中的 SSE 接口（POST 发起对话，GET + Last-Event-ID 断线续传）。
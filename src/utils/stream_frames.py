@@ -0,0 +1,118 @@
+"""
+流式输出分帧工具 - 按时间/大小窗口合并 token，配合有界队列实现背压
+    coalesce_chunks：把逐 token 的异步流合并成帧（默认 30ms 或 256 字节先到者触发）；
+    coalesce_events：同样的合并规则作用于 (事件类型, 数据) 流，只合并连续的文本增量，其他事件原样透传；
+    delta_frame / end_frame / error_frame / cancelled_frame：紧凑的增量帧格式（WebSocket delta 协议）。
+读取端与发送端通过有界队列解耦：客户端消费慢时发送端阻塞、队列写满，读取端停止从图中拉取，
+图执行随之暂停，而不是在服务端无限堆积 token。
+"""
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Optional, Tuple
+
+_DONE = object()
+
+
+def _dumps(payload: dict) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def delta_frame(text: str) -> str:
+    return _dumps({"t": "d", "v": text})
+
+
+def end_frame(session_id: str) -> str:
+    return _dumps({"t": "end", "sid": session_id})
+
+
+def error_frame(message: str) -> str:
+    return _dumps({"t": "err", "v": message})
+
+
+def cancelled_frame(session_id: str) -> str:
+    return _dumps({"t": "cancel", "sid": session_id})
+
+
+async def coalesce_events(source: AsyncIterator[Tuple[str, Any]], window_ms: float = 30, max_bytes: int = 256,
+                          max_pending: int = 1024, merge: str = "delta") -> AsyncIterator[Tuple[str, Any]]:
+    """合并事件流中连续的 merge 类型文本事件：自第一段起满 window_ms 毫秒或累计 max_bytes 字节即输出；
+    其他类型的事件作为帧边界，先输出已合并的文本再原样输出，保证事件顺序不变"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+    error: Optional[BaseException] = None
+
+    async def pump():
+        nonlocal error
+        try:
+            async for item in source:
+                await queue.put(item)  # 队列满时在此等待：背压传递到图执行
+        except Exception as e:
+            error = e
+        # 被取消时 CancelledError 直接向上抛出，不再写入结束标记
+        await queue.put(_DONE)
+
+    reader = asyncio.ensure_future(pump())
+    window = window_ms / 1000
+    try:
+        done = False
+        while not done:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if item[0] != merge:
+                yield item
+                continue
+            parts, size = [item[1]], len(item[1].encode("utf-8"))
+            held = None
+            deadline = time.monotonic() + window
+            while size < max_bytes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                if item[0] != merge:
+                    held = item
+                    break
+                parts.append(item[1])
+                size += len(item[1].encode("utf-8"))
+            yield merge, "".join(parts)
+            if held is not None:
+                yield held
+        if error is not None:
+            raise error
+    finally:
+        # 等读取协程真正结束，调用方随后才能安全地关闭源流
+        reader.cancel()
+        await asyncio.wait([reader])
+
+
+async def _as_events(source: AsyncIterator[str]) -> AsyncIterator[Tuple[str, str]]:
+    async for chunk in source:
+        if chunk:
+            yield "delta", chunk
+
+
+async def coalesce_chunks(source: AsyncIterator[str], window_ms: float = 30, max_bytes: int = 256,
+                          max_pending: int = 1024) -> AsyncIterator[str]:
+    """把文本块流合并为帧：自第一个块起满 window_ms 毫秒或累计 max_bytes 字节即输出一帧"""
+    events = coalesce_events(_as_events(source), window_ms, max_bytes, max_pending)
+    try:
+        async for _, text in events:
+            yield text
+    finally:
+        await events.aclose()
+
+# 代码说明：
+# 1. 功能定位：减少长回答的 WebSocket 帧数与每帧的 JSON 包装开销；
+# 2. 核心逻辑：
+#    - pump 协程从源流读取文本块写入有界队列，发送端阻塞时队列写满，自动停止拉取；
+#    - 合并循环以第一个块到达为起点，窗口到期或字节数达到上限即输出一帧；
+#    - coalesce_events 遇到非文本事件（工具/自定义）时先输出已合并的文本，事件顺序与原流一致；
+#    - 增量帧仅含类型与文本（{"t":"d","v":"..."}），结束/错误/取消各有独立的紧凑帧；
+# 3. 应用场景：app.py 中 /ws/chat 的 delta 协议模式，以及 SSE 接口写入事件日志前的增量合并。
@@ -0,0 +1,7 @@
+"""pytest 公共配置：把项目根目录加入 sys.path，测试中按 `src.xxx` / `core.xxx` 导入"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
@@ -0,0 +1,63 @@
+"""BM25稀疏索引：代码类词整体匹配、增删、落盘后其他实例按 mtime 重新加载、倒数排名融合"""
+import os
+
+import pytest
+
+bm25_index = pytest.importorskip("src.rag.bm25_index")
+from langchain_core.documents import Document  # noqa: E402
+
+BM25Index = bm25_index.BM25Index
+
+
+def test_tokenize_keeps_codes_and_compact_form():
+    terms = bm25_index.tokenize("报错 E-203 与 008")
+    assert "e-203" in terms and "e203" in terms and "008" in terms
+
+
+def test_search_matches_codes_and_remove():
+    index = BM25Index()
+    index.add("c1", "故障码 E-203 表示通信中断")
+    index.add("c2", "故障码 008 表示过温保护")
+    assert [doc.page_content for doc, _ in index.search("E203")] == ["故障码 E-203 表示通信中断"]
+    assert index.remove(["c1"]) == 1
+    assert index.search("E-203") == []
+    assert len(index) == 1
+
+
+def test_reloads_when_file_changes(tmp_path):
+    path = tmp_path / "kb.json"
+    writer = BM25Index(path)
+    writer.add("c1", "故障码 008 表示过温保护")
+    writer.save()
+    reader = BM25Index(path)
+    assert len(reader.search("008")) == 1
+
+    writer.add("c2", "备件 PN-4411A 为散热风扇")
+    writer.save()
+    # 部分文件系统 mtime 精度较低，显式推进以保证可比较
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert "c2" not in reader
+    assert len(reader.search("PN-4411A")) == 1
+    assert reader.has_all(["c1", "c2"])
+
+
+def test_unsaved_changes_are_not_overwritten_by_reload(tmp_path):
+    path = tmp_path / "kb.json"
+    writer = BM25Index(path)
+    writer.add("c1", "故障码 008")
+    writer.save()
+    reader = BM25Index(path)
+    reader.add("local", "本地未保存 E-203")
+    writer.add("c2", "备件 PN-4411A")
+    writer.save()
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert reader.refresh() is False
+    assert "local" in reader
+
+
+def test_reciprocal_rank_fusion_prefers_docs_in_both_lists():
+    a, b, c = (Document(page_content=t, metadata={"chunk_id": t}) for t in "abc")
+    fused = bm25_index.reciprocal_rank_fusion([[a, b], [b, c]])
+    assert [d.page_content for d in fused] == ["b", "a", "c"]
@@ -0,0 +1,194 @@
+"""LLM 请求合并：相同请求只调用一次上游、后到者回放、中途离开不影响其他等待者、
+全部离开时停止上游且不写缓存、缓存命中不重复计 token、同步与异步等待者共享一次调用"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+coalescing = pytest.importorskip("llm_db_config.coalescing")
+from langchain_core.messages import AIMessageChunk, HumanMessage  # noqa: E402
+from langchain_core.outputs import ChatGenerationChunk  # noqa: E402
+
+TOKENS = ["设备", "离线", "请检查", "网络"]
+USAGE = {"input_tokens": 10, "output_tokens": 4, "total_tokens": 14}
+
+
+class Upstream:
+    """替代限流后的上游流：按 delay 逐块产出，末块携带 usage；记录调用次数与是否完整结束"""
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.calls = 0
+        self.completed = 0
+        self.stopped = 0
+
+    def _chunk(self, i):
+        usage = USAGE if i == len(TOKENS) - 1 else None
+        return ChatGenerationChunk(message=AIMessageChunk(content=TOKENS[i], usage_metadata=usage))
+
+    def stream(self, messages, stop, run_manager, priority, kwargs):
+        self.calls += 1
+        finished = False
+        try:
+            for i in range(len(TOKENS)):
+                time.sleep(self.delay)
+                yield self._chunk(i)
+            finished = True
+            self.completed += 1
+        finally:
+            if not finished:
+                self.stopped += 1
+
+    async def astream(self, messages, stop, run_manager, priority, kwargs):
+        self.calls += 1
+        finished = False
+        try:
+            for i in range(len(TOKENS)):
+                await asyncio.sleep(self.delay)
+                yield self._chunk(i)
+            finished = True
+            self.completed += 1
+        finally:
+            if not finished:
+                self.stopped += 1
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    upstream = Upstream()
+    coalescer = coalescing.LLMResponseCoalescer(cache_max_entries=8, cache_ttl_seconds=60)
+    monkeypatch.setattr(coalescing, "get_llm_coalescer", lambda: coalescer)
+    monkeypatch.setattr(coalescing.CoalescingChatOpenAI, "_limited_stream", upstream.stream)
+    monkeypatch.setattr(coalescing.CoalescingChatOpenAI, "_alimited_stream", upstream.astream)
+    upstream.coalescer = coalescer
+    return upstream
+
+
+def make_model(temperature=0.7):
+    return coalescing.CoalescingChatOpenAI(model="test-model", api_key="sk-test", base_url="http://127.0.0.1:9/v1",
+                                           temperature=temperature)
+
+
+MESSAGES = [HumanMessage(content="设备离线怎么办")]
+
+
+async def collect(model, after=None):
+    chunks = []
+    async for chunk in model.astream(MESSAGES):
+        chunks.append(chunk)
+        if after is not None:
+            after.set()
+    return chunks
+
+
+def text(chunks):
+    return "".join(c.content for c in chunks)
+
+
+def usage(chunks):
+    return [c.usage_metadata for c in chunks if c.usage_metadata]
+
+
+def test_concurrent_identical_requests_share_one_upstream_call(upstream):
+    model = make_model()
+
+    async def main():
+        first_chunk = asyncio.Event()
+        leader = asyncio.create_task(collect(model, after=first_chunk))
+        await first_chunk.wait()  # 后到者从已生成的块开始回放
+        follower = await collect(model)
+        return await leader, follower
+
+    leader, follower = asyncio.run(main())
+    assert text(leader) == text(follower) == "".join(TOKENS)
+    assert upstream.calls == 1
+    # token 用量只归属发起上游调用的请求
+    assert usage(leader) and not usage(follower)
+    stats = upstream.coalescer.stats()
+    assert stats["coalesced"] == 1 and stats["inflight"] == 0
+
+
+def test_waiter_leaving_mid_stream_does_not_break_others(upstream):
+    model = make_model()
+
+    async def quitter(started):
+        stream = model.astream(MESSAGES)
+        await stream.__anext__()
+        started.set()
+        await stream.aclose()
+
+    async def main():
+        started = asyncio.Event()
+        leaving = asyncio.create_task(quitter(started))
+        await started.wait()
+        staying = await collect(model)
+        await leaving
+        return staying
+
+    staying = asyncio.run(main())
+    assert text(staying) == "".join(TOKENS)
+    assert upstream.calls == 1 and upstream.completed == 1 and upstream.stopped == 0
+
+
+def test_abandoned_async_stream_stops_upstream_and_is_not_cached(upstream):
+    model = make_model(temperature=0)
+
+    async def main():
+        stream = model.astream(MESSAGES)
+        await stream.__anext__()
+        await stream.aclose()
+        for _ in range(50):  # 等待上游任务被取消
+            if upstream.stopped:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert upstream.stopped == 1 and upstream.completed == 0
+    assert upstream.coalescer.stats()["cache_entries"] == 0
+    # 未完成的回复没有写缓存，下一次请求重新调用上游
+    assert text(asyncio.run(collect(model))) == "".join(TOKENS)
+    assert upstream.calls == 2
+
+
+def test_abandoned_sync_stream_stops_upstream_and_is_not_cached(upstream):
+    model = make_model(temperature=0)
+    stream = model.stream(MESSAGES)
+    next(stream)
+    stream.close()
+    deadline = time.monotonic() + 2
+    while not upstream.stopped and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert upstream.stopped == 1 and upstream.completed == 0
+    assert upstream.coalescer.stats()["cache_entries"] == 0
+
+
+def test_cache_hits_carry_no_usage_metadata(upstream):
+    model = make_model(temperature=0)
+    first = list(model.stream(MESSAGES))
+    assert [u["total_tokens"] for u in usage(first)] == [USAGE["total_tokens"]]
+    second = list(model.stream(MESSAGES))
+    third = asyncio.run(collect(model))
+    assert text(second) == text(third) == "".join(TOKENS)
+    assert not usage(second) and not usage(third)
+    assert upstream.calls == 1
+    assert upstream.coalescer.stats()["cache_hits"] == 2
+
+
+def test_sync_and_async_waiters_share_one_broadcast(upstream):
+    model = make_model()
+    results = {}
+
+    async def main():
+        first_chunk = asyncio.Event()
+        leader = asyncio.create_task(collect(model, after=first_chunk))
+        await first_chunk.wait()
+        thread = threading.Thread(target=lambda: results.setdefault("sync", list(model.stream(MESSAGES))))
+        thread.start()
+        chunks = await leader
+        await asyncio.to_thread(thread.join, 5)
+        return chunks
+
+    leader = asyncio.run(main())
+    assert text(leader) == text(results["sync"]) == "".join(TOKENS)
+    assert upstream.calls == 1
+    assert usage(leader) and not usage(results["sync"])
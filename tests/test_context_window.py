@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage  # noqa: E402
+
+from src.utils.context_window import update_context_window, window_messages  # noqa: E402
+
+
+def tool_turn(i):
+    """一轮工具调用：用户提问 → AI 发起两个工具调用 → 两条工具结果 → AI 回答"""
+    return [
+        HumanMessage(content=f"问题{i}", id=f"h{i}"),
+        AIMessage(content="", id=f"a{i}", tool_calls=[
+            {"name": "query", "args": {"n": i}, "id": f"c{i}-1"},
+            {"name": "query", "args": {"n": i}, "id": f"c{i}-2"},
+        ]),
+        ToolMessage(content="结果1", tool_call_id=f"c{i}-1", id=f"t{i}-1"),
+        ToolMessage(content="结果2", tool_call_id=f"c{i}-2", id=f"t{i}-2"),
+        AIMessage(content=f"回答{i}", id=f"r{i}"),
+    ]
+
+
+def assert_tool_groups_intact(selected):
+    assert not isinstance(selected[0], ToolMessage)
+    answered = {m.tool_call_id for m in selected if isinstance(m, ToolMessage)}
+    for message in selected:
+        if isinstance(message, AIMessage):
+            assert {call["id"] for call in message.tool_calls} <= answered
+    for message in selected:
+        if isinstance(message, ToolMessage):
+            assert any(isinstance(m, AIMessage) and message.tool_call_id in {c["id"] for c in m.tool_calls}
+                       for m in selected)
+
+
+def test_incremental_update_evicts_whole_turns():
+    messages, window = [], None
+    for i in range(6):
+        messages += tool_turn(i)
+        window = update_context_window(window, messages, max_messages=7)
+        selected = window_messages(window, messages)
+        assert isinstance(selected[0], HumanMessage)
+        assert_tool_groups_intact(selected)
+    assert [m.id for m in window_messages(window, messages)] == ["h5", "a5", "t5-1", "t5-2", "r5"]
+
+
+def test_rebuild_does_not_start_inside_tool_group():
+    messages = tool_turn(0) + tool_turn(1)
+    window = update_context_window(None, messages, max_messages=7)
+    selected = window_messages(window, messages)
+    assert selected[0].id == "h1"
+    assert_tool_groups_intact(selected)
+
+
+def test_last_human_message_is_always_kept():
+    messages = tool_turn(0) + [HumanMessage(content="最新问题", id="h-last")]
+    messages += tool_turn(1)[1:]
+    window = update_context_window(None, messages, max_messages=2, max_tokens=10)
+    selected = window_messages(window, messages)
+    assert selected[0].id == "h-last"
+    assert_tool_groups_intact(selected)
+    assert window_messages(window, messages, last_n=2)[0].id == "h-last"
+
+
+def test_without_human_messages_evicts_by_tool_group():
+    messages = tool_turn(0)[1:] + tool_turn(1)[1:]
+    window = update_context_window(None, messages, max_messages=4)
+    selected = window_messages(window, messages)
+    assert selected[0].id == "a1"
+    assert_tool_groups_intact(selected)
@@ -0,0 +1,74 @@
+"""快速意图分类：规则层各类规则的判定与置信度、冷启动时异步路径不阻塞、质心就绪后走向量层"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.intent_demo.fast_intent import CentroidIntentClassifier, KeywordIntentMatcher
+
+
+@pytest.mark.parametrize("text, intent_key, confidence", [
+    ("你好", "chit_chat", 0.95),
+    ("谢谢！", "chit_chat", 0.95),
+    ("讲个笑话", "chit_chat", 0.9),
+    ("今天天气怎么样", "chit_chat", 0.9),
+    ("今天天气怎么样？", "question", 0.9),  # 以问号结尾归为提问，与提示词规则一致
+    ("Autel Europe UK Ltd的电话是什么？", "question", 0.9),
+    ("帮我看看设备分析列表", "devicesList", 0.95),
+    ("这个充电桩为什么离线？", "question", 0.6),  # 含业务对象，置信度不足交给下一层
+])
+def test_keyword_tier(text, intent_key, confidence):
+    match = KeywordIntentMatcher({"设备分析列表": "devicesList"}).match(text)
+    assert (match.intent_key, match.confidence, match.tier) == (intent_key, confidence, "keyword")
+
+
+@pytest.mark.parametrize("text", ["", "   ", "帮我处理一下"])
+def test_keyword_tier_no_match(text):
+    assert KeywordIntentMatcher({"设备分析列表": "devicesList"}).match(text) is None
+
+
+class SlowEmbeddings:
+    """按关键字构造二维向量；构造时模拟模型加载耗时"""
+    def __init__(self, gate: threading.Event):
+        gate.wait(5)
+
+    @staticmethod
+    def _vec(text):
+        return [1.0, 0.0] if "设备" in text else [0.0, 1.0]
+
+    def embed_documents(self, texts):
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vec(text)
+
+    async def aembed_query(self, text):
+        return self._vec(text)
+
+
+EXAMPLES = {"devicesList": ["查询设备列表", "设备分析"], "chit_chat": ["你好", "讲个笑话"]}
+
+
+def test_aclassify_falls_through_while_centroids_build():
+    gate = threading.Event()
+    clf = CentroidIntentClassifier(lambda: SlowEmbeddings(gate), examples=EXAMPLES,
+                                   intent_str_key={"设备分析列表": "devicesList"})
+
+    async def first_call():
+        start = time.perf_counter()
+        result = await clf.aclassify("看看设备")
+        return result, time.perf_counter() - start
+
+    result, elapsed = asyncio.run(first_call())
+    assert result is None  # 交给LLM层
+    assert elapsed < 1.0  # 没有等待模型加载
+    assert not clf.ready
+
+    gate.set()
+    deadline = time.time() + 5
+    while not clf.ready and time.time() < deadline:
+        time.sleep(0.01)
+    assert clf.ready
+    match = asyncio.run(clf.aclassify("看看设备"))
+    assert match.intent_key == "devicesList" and match.tier == "embedding"
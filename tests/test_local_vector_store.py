@@ -0,0 +1,127 @@
+"""本地向量库：写入/检索/删除/压缩/重新打开、chunk_id 幂等写入、元数据过滤、多实例同步、IVF 召回率"""
+import pytest
+
+np = pytest.importorskip("numpy")
+LocalVectorStore = pytest.importorskip("src.rag.local_vector_store").LocalVectorStore
+
+
+def unit_vectors(n, dim=8, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def add_chunks(store, vectors, offset=0):
+    n = len(vectors)
+    metadatas = [{"chunk_id": f"c{i}", "source": "a.pdf" if i % 2 else "b.pdf", "page": i % 5}
+                 for i in range(offset, offset + n)]
+    return store.add_embeddings([f"text {i}" for i in range(offset, offset + n)], vectors, metadatas)
+
+
+def top_chunk(store, vector, **kwargs):
+    results = store.similarity_search_with_score_by_vector(list(vector), k=1, **kwargs)
+    return results[0][0].metadata["chunk_id"] if results else None
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "store")
+
+
+def test_add_search_delete_compact_reopen(path):
+    store = LocalVectorStore(None, path=path, ann="none")
+    vectors = unit_vectors(1100)
+    add_chunks(store, vectors)
+    assert len(store) == 1100
+    doc, distance = store.similarity_search_with_score_by_vector(list(vectors[3]), k=1)[0]
+    assert doc.metadata["chunk_id"] == "c3" and doc.page_content == "text 3"
+    assert distance == pytest.approx(0.0, abs=1e-5)
+
+    assert store.delete_by_chunk_ids([f"c{i}" for i in range(400)], compact=False) == 400
+    assert len(store) == 700
+    assert top_chunk(store, vectors[3]) != "c3"
+
+    store.compact()
+    assert store._generation == 1 and store._count == 700
+    assert not list(store.directory.glob("vectors.f32-0"))
+    assert top_chunk(store, vectors[500]) == "c500"
+    # 压缩后行号重排，chunk_id 映射随之更新，按 chunk_id 删除仍然有效
+    store.delete_by_chunk_ids(["c500"])
+    assert top_chunk(store, vectors[500]) != "c500"
+    store.close()
+
+    reopened = LocalVectorStore(None, path=path, ann="none")
+    assert len(reopened) == 699
+    assert top_chunk(reopened, vectors[1099]) == "c1099"
+    assert top_chunk(reopened, vectors[500]) != "c500"
+    reopened.close()
+
+
+def test_same_chunk_id_replaces_previous_row(path):
+    store = LocalVectorStore(None, path=path, ann="none")
+    old, new = unit_vectors(2, seed=1)
+    store.add_embeddings(["old"], [old], [{"chunk_id": "c1"}])
+    store.add_embeddings(["new"], [new], [{"chunk_id": "c1"}])
+    assert len(store) == 1
+    doc, _ = store.similarity_search_with_score_by_vector(list(old), k=5)[0]
+    assert doc.page_content == "new"
+    store.close()
+
+
+def test_metadata_filter(path):
+    store = LocalVectorStore(None, path=path, ann="none")
+    vectors = unit_vectors(50, seed=2)
+    add_chunks(store, vectors)
+    results = store.similarity_search_with_score_by_vector(list(vectors[4]), k=10, filter={"source": "a.pdf"})
+    assert len(results) == 10
+    assert all(doc.metadata["source"] == "a.pdf" for doc, _ in results)
+    assert "c4" not in {doc.metadata["chunk_id"] for doc, _ in results}  # c4 属于 b.pdf
+    results = store.similarity_search_with_score_by_vector(list(vectors[4]), k=50,
+                                                           filter={"source": "b.pdf", "page": [0, 4]})
+    assert {doc.metadata["chunk_id"] for doc, _ in results} == {f"c{i}" for i in range(0, 50, 2) if i % 5 in (0, 4)}
+    assert top_chunk(store, vectors[4], filter={"chunk_id": "c7"}) == "c7"
+    with pytest.raises(ValueError):
+        store.similarity_search_with_score_by_vector(list(vectors[4]), k=1, filter={"source') OR 1=1 --": "x"})
+    store.close()
+
+
+def test_second_instance_sees_other_writes(path):
+    writer = LocalVectorStore(None, path=path, ann="none")
+    reader = LocalVectorStore(None, path=path, ann="none")
+    vectors = unit_vectors(20, seed=3)
+    add_chunks(writer, vectors[:10])
+    assert top_chunk(reader, vectors[7]) == "c7"
+    # 读取方写入时行号从全局最新位置分配，不覆盖对方的行
+    add_chunks(reader, vectors[10:], offset=10)
+    assert top_chunk(writer, vectors[15]) == "c15"
+    assert top_chunk(writer, vectors[7]) == "c7"
+    reader.delete_by_chunk_ids(["c7"])
+    assert top_chunk(writer, vectors[7]) != "c7"
+    # 其他实例压缩（代数变化、行号重排）后整体重读
+    writer.compact()
+    assert top_chunk(reader, vectors[15]) == "c15"
+    assert reader._generation == 1 and len(reader) == 19
+    writer.close()
+    reader.close()
+
+
+def test_ivf_recall_matches_brute_force(path):
+    rng = np.random.default_rng(4)
+    centers = unit_vectors(40, dim=16, seed=5)
+    vectors = centers[rng.integers(0, 40, 4000)] + rng.normal(scale=0.1, size=(4000, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    store = LocalVectorStore(None, path=path, ann="ivf", ann_min_rows=1000)
+    add_chunks(store, vectors)
+    assert store._ann is not None and store._ann.kind == "ivf"
+
+    queries = vectors[rng.choice(4000, 50, replace=False)] + rng.normal(scale=0.05, size=(50, 16)).astype(np.float32)
+    approx = store.search_rows(queries, k=10)
+    exact = store.search_rows(queries, k=10, exact=True)
+    recall = np.mean([len(set(a[0]) & set(e[0])) / 10 for a, e in zip(approx, exact)])
+    assert recall >= 0.9
+
+    # 建索引之后追加的行不在 IVF 中，由暴力检索补充
+    extra = unit_vectors(1, dim=16, seed=6)
+    add_chunks(store, extra, offset=4000)
+    assert store._ann.built == 4000
+    assert top_chunk(store, extra[0]) == "c4000"
+    store.close()
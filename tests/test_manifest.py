@@ -0,0 +1,30 @@
+"""集合版本号：跨进程（另一个实例）递增后，当前实例读到新版本，mtime 未变化时也不例外"""
+import os
+
+import pytest
+
+# src.rag 包初始化会导入 RAG Agent（依赖 langchain 等），依赖缺失的环境中跳过
+CollectionVersion = pytest.importorskip("src.rag.manifest").CollectionVersion
+
+
+def test_version_seen_by_other_instance(tmp_path):
+    server = CollectionVersion.for_collection("docs", str(tmp_path))
+    ingest_cli = CollectionVersion.for_collection("docs", str(tmp_path))
+    assert server.current() == 0
+    assert ingest_cli.bump() == 1
+    assert server.current() == 1
+    assert ingest_cli.bump() == 2
+    assert server.current() == 2
+    assert server.bump() == 3
+
+
+def test_bump_within_same_mtime_tick(tmp_path):
+    server = CollectionVersion.for_collection("docs", str(tmp_path))
+    ingest_cli = CollectionVersion.for_collection("docs", str(tmp_path))
+    ingest_cli.bump()
+    assert server.current() == 1
+    # 粗粒度 mtime 的文件系统上，同一时刻内的再次递增不会改变 mtime
+    stat = os.stat(ingest_cli.path)
+    ingest_cli.bump()
+    os.utime(ingest_cli.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert server.current() == 2
@@ -0,0 +1,67 @@
+"""查询向量微批处理：并发请求合并、已取消请求跳过、单批异常不影响工作线程"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+MicroBatchEmbeddings = pytest.importorskip("src.rag.micro_batch_embeddings").MicroBatchEmbeddings
+
+
+class GatedEmbeddings:
+    """第一批计算等待 gate；记录每次批量调用的文本"""
+    def __init__(self):
+        self.gate = threading.Event()
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        self.gate.wait(5)
+        if "bad" in texts:
+            raise ValueError("boom")
+        return [[float(len(t))] for t in texts]
+
+
+def test_concurrent_queries_are_batched():
+    base = GatedEmbeddings()
+    embeddings = MicroBatchEmbeddings(base, window_ms=50, max_batch=8)
+    base.gate.set()
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(embeddings.embed_query, ["a", "bb", "a", "ccc"] * 2))
+    assert results == [[1.0], [2.0], [1.0], [3.0]] * 2
+    stats = embeddings.stats()
+    assert stats["requests"] == 8
+    assert stats["batches"] < 8
+
+
+def test_cancelled_query_is_skipped_and_worker_survives():
+    base = GatedEmbeddings()
+    embeddings = MicroBatchEmbeddings(base, window_ms=1)
+    blocker = threading.Thread(target=embeddings.embed_query, args=("first",))
+    blocker.start()
+    while not base.calls:  # 等第一批进入计算
+        time.sleep(0.001)
+
+    async def cancel_pending():
+        task = asyncio.ensure_future(embeddings.aembed_query("cancelled"))
+        await asyncio.sleep(0.05)  # 工作线程仍卡在第一批，该请求在队列中等待
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_pending())
+    base.gate.set()
+    blocker.join(5)
+    # 工作线程若已退出，这里会超时而不是一直等待
+    assert embeddings._submit("after").result(timeout=5) == [5.0]
+    assert all("cancelled" not in call for call in base.calls)
+
+
+def test_batch_error_is_delivered_and_worker_survives():
+    base = GatedEmbeddings()
+    base.gate.set()
+    embeddings = MicroBatchEmbeddings(base, window_ms=1)
+    with pytest.raises(ValueError):
+        embeddings.embed_query("bad")
+    assert embeddings._submit("ok").result(timeout=5) == [2.0]
@@ -0,0 +1,133 @@
+"""计划执行器：依赖顺序与并发、单步超时、失败步骤的下游跳过、循环依赖、节点取消时回收在途步骤"""
+import asyncio
+import time
+
+import pytest
+
+plan_executor = pytest.importorskip("src.intent_demo.plan_executor")
+from langchain_core.messages import AIMessage, ToolMessage  # noqa: E402
+
+PlanExecutor = plan_executor.PlanExecutor
+
+
+class FakeTool:
+    """按 delay 模拟耗时，记录开始/结束时间；fail=True 时返回错误 ToolMessage"""
+    def __init__(self, name, delay=0.0, fail=False):
+        self.name, self.delay, self.fail = name, delay, fail
+        self.started = self.ended = None
+        self.cancelled = False
+
+    def _message(self, call):
+        self.ended = time.monotonic()
+        return ToolMessage(content=f"{self.name} ok", name=self.name, tool_call_id=call["id"],
+                           status="error" if self.fail else "success")
+
+    def invoke(self, call, config=None):
+        self.started = time.monotonic()
+        time.sleep(self.delay)
+        return self._message(call)
+
+    async def ainvoke(self, call, config=None):
+        self.started = time.monotonic()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self._message(call)
+
+
+def make_state(deps):
+    """deps: {step_id: [依赖的 step_id]}，step_id 同时作为工具名"""
+    calls = [{"name": sid, "args": {}, "id": sid} for sid in deps]
+    steps = [{"id": sid, "depends_on": d} for sid, d in deps.items()]
+    return {"messages": [AIMessage(content="", tool_calls=calls)], "plan": {"steps": steps}}
+
+
+def run_sync(executor, state):
+    return executor.run(state)
+
+
+def run_async(executor, state):
+    return asyncio.run(executor.arun(state))
+
+
+runners = pytest.mark.parametrize("run", [run_sync, run_async], ids=["sync", "async"])
+
+
+def by_id(result):
+    return {m.tool_call_id: m for m in result["messages"]}
+
+
+@runners
+def test_dependencies_run_in_order_and_independent_steps_in_parallel(run):
+    tools = [FakeTool("a", delay=0.2), FakeTool("b"), FakeTool("c", delay=0.2)]
+    a, b, c = tools
+    executor = PlanExecutor(tools, max_concurrent=4, step_timeout=5)
+    start = time.monotonic()
+    result = run(executor, make_state({"a": [], "b": ["a"], "c": []}))
+    assert time.monotonic() - start < 0.35  # a 与 c 并发
+    assert [m.tool_call_id for m in result["messages"]] == ["a", "b", "c"]
+    assert all(m.status == "success" for m in result["messages"])
+    assert b.started >= a.ended
+    assert c.started < a.ended
+
+
+@runners
+def test_timeout_fails_step_and_skips_dependents(run):
+    tools = [FakeTool("slow", delay=1.0), FakeTool("after"), FakeTool("other")]
+    executor = PlanExecutor(tools, max_concurrent=4, step_timeout=0.1)
+    messages = by_id(run(executor, make_state({"slow": [], "after": ["slow"], "other": []})))
+    assert messages["slow"].status == "error" and "超时" in messages["slow"].content
+    assert messages["after"].status == "error" and "已跳过" in messages["after"].content
+    assert messages["other"].status == "success"
+    assert tools[1].started is None
+
+
+@runners
+def test_failed_step_skips_direct_and_indirect_dependents(run):
+    tools = [FakeTool("bad", fail=True), FakeTool("child"), FakeTool("grandchild"), FakeTool("sibling")]
+    executor = PlanExecutor(tools, max_concurrent=4, step_timeout=5)
+    state = make_state({"bad": [], "child": ["bad"], "grandchild": ["child"], "sibling": []})
+    messages = by_id(run(executor, state))
+    assert [messages[k].status for k in ("bad", "child", "grandchild", "sibling")] == \
+        ["error", "error", "error", "success"]
+    assert "已跳过" in messages["grandchild"].content
+    assert tools[1].started is None and tools[2].started is None
+
+
+@runners
+def test_cyclic_dependencies_are_reported(run):
+    tools = [FakeTool("x"), FakeTool("y"), FakeTool("z")]
+    executor = PlanExecutor(tools, max_concurrent=4, step_timeout=5)
+    messages = by_id(run(executor, make_state({"x": ["y"], "y": ["x"], "z": []})))
+    assert "循环依赖" in messages["x"].content and "循环依赖" in messages["y"].content
+    assert messages["z"].status == "success"
+
+
+def test_cancelled_node_cancels_running_steps():
+    slow = FakeTool("slow", delay=5.0)
+    executor = PlanExecutor([slow], max_concurrent=4, step_timeout=10)
+
+    async def main():
+        before = asyncio.all_tasks()
+        node = asyncio.ensure_future(executor.arun(make_state({"slow": []})))
+        while slow.started is None:
+            await asyncio.sleep(0.01)
+        node.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await node
+        # finally 中已等待子任务结束，不会遗留孤儿任务
+        return [t for t in asyncio.all_tasks() - before if not t.done()]
+
+    leftover = asyncio.run(main())
+    assert slow.cancelled
+    assert leftover == []
+
+
+def test_unknown_tool_returns_error():
+    executor = PlanExecutor([FakeTool("a")], max_concurrent=1, step_timeout=5)
+    state = make_state({"a": []})
+    state["messages"][0].tool_calls.append({"name": "missing", "args": {}, "id": "m"})
+    messages = by_id(executor.run(state))
+    assert messages["m"].status == "error" and "not a valid tool" in messages["m"].content
@@ -0,0 +1,136 @@
+"""LLM 限流器：令牌桶补充与突发、AIMD 并发上限调整、429 暂停放行、优先级排队与排队超时"""
+import threading
+import time
+
+import pytest
+
+rate_limit = pytest.importorskip("llm_db_config.rate_limit")
+import httpx  # noqa: E402
+import openai  # noqa: E402
+
+TokenBucket = rate_limit.TokenBucket
+AdaptiveRateLimiter = rate_limit.AdaptiveRateLimiter
+
+
+def rate_limit_error(retry_after=None):
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "http://llm.test/v1/chat"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def make_limiter(**kwargs):
+    kwargs.setdefault("requests_per_minute", 0)
+    kwargs.setdefault("tokens_per_minute", 0)
+    kwargs.setdefault("initial_concurrency", 4)
+    kwargs.setdefault("max_concurrency", 8)
+    return AdaptiveRateLimiter(**kwargs)
+
+
+def test_bucket_burst_then_refill():
+    bucket = TokenBucket(rate_per_minute=60, burst_seconds=5)
+    now = bucket.updated
+    assert bucket.capacity == 5
+    for _ in range(5):
+        assert bucket.wait_time(1, now) == 0
+        bucket.take(1, now)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    # 每秒补充一个，且不超过容量
+    assert bucket.wait_time(1, now + 1) == 0
+    bucket._refill(now + 100)
+    assert bucket.tokens == 5
+
+
+def test_bucket_oversized_request_waits_for_full_bucket_and_goes_negative():
+    bucket = TokenBucket(rate_per_minute=60, burst_seconds=2)
+    now = bucket.updated
+    bucket.take(2, now)
+    assert bucket.wait_time(10, now) == pytest.approx(2.0)
+    bucket.take(10, now + 2)
+    assert bucket.tokens == pytest.approx(-8)
+    # 按实际用量退还，余额不超过容量
+    bucket.adjust(20, now + 2)
+    assert bucket.tokens == 2
+
+
+def test_bucket_unlimited():
+    bucket = TokenBucket(rate_per_minute=0, burst_seconds=10)
+    assert bucket.unlimited
+    bucket.take(1_000_000, bucket.updated)
+    assert bucket.wait_time(1_000_000, bucket.updated) == 0
+
+
+def test_fast_response_increases_limit_additively():
+    limiter = make_limiter()
+    waiter = limiter.acquire(1, 100)
+    limiter.release(waiter, ttft=0.5)
+    assert limiter.limit == pytest.approx(4.25)
+    assert limiter.inflight == 0
+
+
+def test_slow_response_decreases_limit_once_per_window():
+    limiter = make_limiter(initial_concurrency=8, latency_target_seconds=1.0)
+    first, second = limiter.acquire(1, 100), limiter.acquire(1, 100)
+    limiter.release(first, ttft=5.0)
+    limiter.release(second, ttft=5.0)
+    assert limiter.limit == pytest.approx(7.2)
+
+
+def test_429_halves_limit_and_blocks_dispatch():
+    limiter = make_limiter(initial_concurrency=8, queue_timeout_seconds=0.05)
+    waiter = limiter.acquire(1, 100)
+    limiter.release(waiter, error=rate_limit_error(retry_after=2))
+    assert limiter.limit == 4
+    stats = limiter.stats()
+    assert stats["throttled_429"] == 1
+    assert 1.5 < stats["blocked_seconds"] <= 2
+    # Retry-After 期间排队的请求不被放行
+    with pytest.raises(TimeoutError):
+        limiter.acquire(1, 100)
+
+
+def test_429_does_not_drop_below_min_concurrency():
+    limiter = make_limiter(initial_concurrency=3, min_concurrency=2)
+    waiter = limiter.acquire(1, 100)
+    limiter.release(waiter, error=rate_limit_error(retry_after=0))
+    assert limiter.limit == 2
+
+
+def test_release_refunds_unused_tokens():
+    limiter = make_limiter(tokens_per_minute=600, burst_seconds=60)
+    waiter = limiter.acquire(1, 500)
+    assert limiter.tpm.tokens == pytest.approx(100, abs=1)
+    limiter.release(waiter, ttft=0.1, used_tokens=200)
+    assert limiter.tpm.tokens == pytest.approx(400, abs=1)
+
+
+def test_high_priority_granted_first():
+    limiter = make_limiter(initial_concurrency=1, max_concurrency=1)
+    holder = limiter.acquire(1, 10)
+    order, threads = [], []
+    for priority in (2, 0):
+        def run(priority=priority):
+            waiter = limiter.acquire(priority, 10)
+            order.append(priority)
+            limiter.release(waiter)
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        deadline = time.monotonic() + 2
+        while limiter.stats()["queued"] < len(threads) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    limiter.release(holder)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == [0, 2]
+
+
+def test_queue_timeout_drops_waiter():
+    limiter = make_limiter(initial_concurrency=1, max_concurrency=1, queue_timeout_seconds=0.05)
+    holder = limiter.acquire(1, 10)
+    with pytest.raises(TimeoutError):
+        limiter.acquire(1, 10)
+    stats = limiter.stats()
+    assert stats["queue_timeouts"] == 1
+    assert stats["queued"] == 0
+    limiter.release(holder)
+    assert limiter.inflight == 0
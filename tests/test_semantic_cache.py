@@ -0,0 +1,49 @@
+"""RAG语义答案缓存：相似度阈值、版本号与对话上下文隔离、LRU/TTL淘汰"""
+import time
+
+import pytest
+
+SemanticAnswerCache = pytest.importorskip("src.rag.semantic_cache").SemanticAnswerCache
+
+
+def test_similar_query_hits_and_distinct_misses():
+    cache = SemanticAnswerCache(threshold=0.95, max_entries=4)
+    cache.put([1.0, 0.0, 0.0], version=1, answer="A")
+    assert cache.lookup([0.99, 0.05, 0.0], version=1) == "A"
+    assert cache.lookup([0.0, 1.0, 0.0], version=1) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_version_and_context_must_match():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=4)
+    cache.put([1.0, 0.0], version=1, answer="会话A的第二步", context="history-a")
+    assert cache.lookup([1.0, 0.0], version=2, context="history-a") is None
+    assert cache.lookup([1.0, 0.0], version=1, context="history-b") is None
+    assert cache.lookup([1.0, 0.0], version=1) is None
+    assert cache.lookup([1.0, 0.0], version=1, context="history-a") == "会话A的第二步"
+
+
+def test_lru_eviction_and_ttl():
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=2, ttl_seconds=3600)
+    cache.put([1.0, 0.0, 0.0], 1, "x")
+    cache.put([0.0, 1.0, 0.0], 1, "y")
+    assert cache.lookup([1.0, 0.0, 0.0], 1) == "x"  # x 变为最近使用
+    cache.put([0.0, 0.0, 1.0], 1, "z")  # 淘汰 y
+    assert cache.lookup([0.0, 1.0, 0.0], 1) is None
+    assert cache.lookup([1.0, 0.0, 0.0], 1) == "x"
+
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=2, ttl_seconds=0.01)
+    cache.put([1.0, 0.0], 1, "old")
+    time.sleep(0.02)
+    assert cache.lookup([1.0, 0.0], 1) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_clears_entries():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=2)
+    cache.put([1.0, 0.0], 1, "x")
+    cache.invalidate()
+    assert cache.lookup([1.0, 0.0], 1) is None
+    cache.put([1.0, 0.0], 1, "y")  # 槽位已归还
+    cache.put([0.0, 1.0], 1, "z")
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,107 @@
+import sqlite3
+import time
+
+import pytest
+
+SqliteCheckpointSaver = pytest.importorskip("llm_db_config.sqlite_saver").SqliteCheckpointSaver
+from langgraph.checkpoint.base import empty_checkpoint  # noqa: E402
+
+
+def make_saver(tmp_path, **kwargs):
+    # 后台线程间隔调大，落盘时机完全由测试控制
+    kwargs.setdefault("flush_interval", 60)
+    kwargs.setdefault("evict_interval", 3600)
+    return SqliteCheckpointSaver(str(tmp_path / "checkpoints.db"), **kwargs)
+
+
+def put(saver, thread_id, step):
+    checkpoint = empty_checkpoint()
+    checkpoint["id"] = f"{step:06d}"
+    saver.put({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}, checkpoint, {"step": step}, {})
+
+
+def count(saver, table):
+    with sqlite3.connect(saver.path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_flush_batches_buffered_checkpoints(tmp_path):
+    saver = make_saver(tmp_path)
+    put(saver, "t1", 1)
+    put(saver, "t1", 2)
+    assert count(saver, "checkpoints") == 0
+    # 读取前落盘，读到最新检查点
+    latest = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    assert latest.checkpoint["id"] == "000002"
+    assert count(saver, "checkpoints") == 2
+    saver.close()
+
+
+def test_batch_size_triggers_flush(tmp_path):
+    saver = make_saver(tmp_path, batch_size=2)
+    put(saver, "t1", 1)
+    assert count(saver, "checkpoints") == 0
+    put(saver, "t1", 2)
+    assert count(saver, "checkpoints") == 2
+    saver.close()
+
+
+def test_prune_keeps_last_checkpoints(tmp_path):
+    saver = make_saver(tmp_path, keep_last=3)
+    for step in range(1, 6):
+        put(saver, "t1", step)
+    put(saver, "t2", 1)
+    ids = [item.checkpoint["id"] for item in saver.list({"configurable": {"thread_id": "t1"}})]
+    assert ids == ["000005", "000004", "000003"]
+    assert len(list(saver.list({"configurable": {"thread_id": "t2"}}))) == 1
+    saver.close()
+
+
+def test_evict_idle_threads(tmp_path):
+    saver = make_saver(tmp_path, ttl_seconds=100)
+    put(saver, "t1", 1)
+    put(saver, "t2", 1)
+    saver.flush()
+    assert saver.evict_idle(now=time.time() + 50) == 0
+    assert saver.evict_idle(now=time.time() + 101) == 2
+    assert saver.get_tuple({"configurable": {"thread_id": "t1"}}) is None
+    assert count(saver, "threads") == 0
+    saver.close()
+
+
+def test_flush_keeps_buffer_when_database_locked(tmp_path):
+    saver = make_saver(tmp_path, busy_timeout_ms=50)
+    put(saver, "t1", 1)
+    other = sqlite3.connect(saver.path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")  # 模拟其他进程长时间持有写锁
+    with pytest.raises(sqlite3.OperationalError):
+        saver.flush()
+    assert saver._buffered() == 1
+    other.execute("ROLLBACK")
+    other.close()
+    saver.flush()
+    assert saver._buffered() == 0
+    assert saver.get_tuple({"configurable": {"thread_id": "t1"}}).checkpoint["id"] == "000001"
+    saver.close()
+
+
+def test_put_and_read_survive_locked_database(tmp_path):
+    saver = make_saver(tmp_path, batch_size=2, busy_timeout_ms=50)
+    other = sqlite3.connect(saver.path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")  # 其他进程持有写锁超过 busy_timeout
+    put(saver, "t1", 1)
+    put(saver, "t1", 2)  # 达到 batch_size 触发落盘失败，put 仍正常返回
+    config = {"configurable": {"thread_id": "t1", "checkpoint_ns": "", "checkpoint_id": "000002"}}
+    saver.put_writes(config, [("messages", "hi")], task_id="task-1")
+    assert saver._buffered() == 3
+    # 读取从缓冲区补读最新检查点及其 pending writes
+    latest = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    assert latest.checkpoint["id"] == "000002"
+    assert latest.pending_writes == [("task-1", "messages", "hi")]
+    assert saver.get_tuple(config).checkpoint["id"] == "000002"
+    other.execute("ROLLBACK")
+    other.close()
+    saver.flush()
+    assert count(saver, "checkpoints") == 2 and count(saver, "writes") == 1
+    assert saver.get_tuple({"configurable": {"thread_id": "t1"}}).pending_writes == [("task-1", "messages", "hi")]
+    saver.close()
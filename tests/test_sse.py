@@ -0,0 +1,79 @@
+"""SSE 会话事件日志：断点续传回放、事件淘汰后的 gap 提示、会话 LRU 淘汰"""
+import asyncio
+
+import pytest
+
+sse = pytest.importorskip("src.utils.sse")
+
+
+async def collect(log, last_event_id):
+    return [frame async for frame in log.subscribe(last_event_id, heartbeat=0.05)]
+
+
+def run_to_end(log, events):
+    async def main():
+        await log.publish("start", {})
+        for data in events:
+            await log.publish("delta", {"v": data})
+        await log.publish("end", {})
+    asyncio.run(main())
+
+
+def test_replay_from_last_event_id():
+    log = sse.SessionEventLog(max_events=16)
+    run_to_end(log, ["a", "b", "c"])
+    frames = asyncio.run(collect(log, 2))
+    assert [f.splitlines()[0] for f in frames] == ["id: 3", "id: 4", "id: 5"]
+    assert 'data: {"v":"b"}' in frames[0]
+    assert frames[-1].startswith("id: 5\nevent: end")
+
+
+def test_gap_when_events_were_evicted():
+    log = sse.SessionEventLog(max_events=3)
+    run_to_end(log, ["a", "b", "c", "d"])
+    frames = asyncio.run(collect(log, 0))
+    assert frames[0].startswith("event: gap")
+    assert '"oldest":4' in frames[0]
+    assert [f.splitlines()[0] for f in frames[1:]] == ["id: 4", "id: 5", "id: 6"]
+
+
+def test_subscriber_receives_live_events_and_heartbeat():
+    log = sse.SessionEventLog()
+
+    async def main():
+        await log.publish("start", {})
+        frames = []
+
+        async def consume():
+            async for frame in log.subscribe(1, heartbeat=0.02):
+                frames.append(frame)
+
+        consumer = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        await log.publish("delta", {"v": "x"})
+        await log.publish("end", {})
+        await asyncio.wait_for(consumer, 1)
+        return frames
+
+    frames = asyncio.run(main())
+    assert ": ping\n\n" in frames
+    assert [f for f in frames if f.startswith("id:")][-1].startswith("id: 3\nevent: end")
+
+
+def test_hub_evicts_idle_sessions_but_not_new_or_active():
+    hub = sse.SSEHub(max_sessions=2)
+    active = hub.get("active")
+    asyncio.run(active.publish("start", {}))
+    hub.get("idle")
+    hub.get("new")
+    assert hub.get("idle", create=False) is None
+    assert hub.get("active", create=False) is active
+    assert hub.get("new", create=False) is not None
+
+
+def test_hub_keeps_new_session_when_all_others_active():
+    hub = sse.SSEHub(max_sessions=1)
+    asyncio.run(hub.get("running").publish("start", {}))
+    log = hub.get("fresh")
+    assert hub.get("fresh", create=False) is log
+    assert hub.get("running", create=False) is not None
@@ -0,0 +1,48 @@
+"""流式分帧：按时间/字节窗口合并文本，非文本事件作为帧边界且保持顺序"""
+import asyncio
+
+import pytest
+
+stream_frames = pytest.importorskip("src.utils.stream_frames")
+
+
+async def produce(items, delay=0.0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+async def collect(agen):
+    return [item async for item in agen]
+
+
+def test_coalesce_chunks_merges_within_window():
+    frames = asyncio.run(collect(stream_frames.coalesce_chunks(produce(["a", "b", "", "c"]), window_ms=200)))
+    assert frames == ["abc"]
+
+
+def test_coalesce_chunks_splits_on_max_bytes():
+    frames = asyncio.run(collect(stream_frames.coalesce_chunks(produce(["ab", "cd", "ef"]), window_ms=200,
+                                                                max_bytes=4)))
+    assert frames == ["abcd", "ef"]
+
+
+def test_coalesce_chunks_splits_on_window():
+    frames = asyncio.run(collect(stream_frames.coalesce_chunks(produce(["a", "b", "c"], delay=0.05), window_ms=10)))
+    assert frames == ["a", "b", "c"]
+
+
+def test_coalesce_chunks_reraises_source_error():
+    async def failing():
+        yield "a"
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        asyncio.run(collect(stream_frames.coalesce_chunks(failing(), window_ms=10)))
+
+
+def test_coalesce_events_keeps_order_around_other_events():
+    events = [("delta", "a"), ("delta", "b"), ("tool", "search"), ("delta", "c"), ("custom", {"k": 1})]
+    merged = asyncio.run(collect(stream_frames.coalesce_events(produce(events), window_ms=200)))
+    assert merged == [("delta", "ab"), ("tool", "search"), ("delta", "c"), ("custom", {"k": 1})]
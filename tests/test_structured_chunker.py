@@ -0,0 +1,60 @@
+"""结构感知切片：编号标题与带单位数值的区分、只有标题的页也产出块"""
+import pytest
+
+structured_chunker = pytest.importorskip("src.rag.structured_chunker")
+classify_line = structured_chunker.classify_line
+
+
+@pytest.mark.parametrize("line, level", [
+    ("第三章 故障处理", 1),
+    ("第二节 通信故障", 2),
+    ("一、安装说明", 2),
+    ("（二）接线要求", 3),
+    ("1.2 安装说明", 2),
+    ("1.2.3 故障排查", 3),
+    ("2.1 Overview", 2),
+    ("## 维护保养", 2),
+])
+def test_headings(line, level):
+    assert classify_line(line) == ("heading", level)
+
+
+@pytest.mark.parametrize("line", [
+    "3.5 V 电压",
+    "1.5mm 间隙调整",
+    "10.5 kg",
+    "3.5 米",
+    "2.2 °C 以下停止充电",
+    "1.2 3.5V",
+    "检查1.2 安装说明。",
+])
+def test_numeric_values_are_not_headings(line):
+    assert classify_line(line)[0] != "heading"
+
+
+def test_steps_and_tables():
+    assert classify_line("1. 断开电源")[0] == "step"
+    assert classify_line("| 故障码 | 含义 |")[0] == "table"
+
+
+def test_heading_only_page_is_emitted():
+    chunker = structured_chunker.StructuredChunker(chunk_tokens=128)
+    pages = [(0, "第一章 概述\n本设备用于直流充电。"), (1, "第二章 附录"), (2, "第三章 维护\n定期清洁散热风扇。")]
+    docs = list(chunker.iter_chunks(pages, {"source": "manual.pdf"}))
+    headings = [d for d in docs if d.metadata["block_type"] == "heading"]
+    assert [(d.page_content, d.metadata["page"]) for d in headings] == [("【第二章 附录】", 1)]
+    assert docs[-1].page_content.startswith("【第三章 维护】")
+
+
+def test_trailing_heading_is_emitted_on_close():
+    chunker = structured_chunker.StructuredChunker(chunk_tokens=128)
+    docs = list(chunker.iter_chunks([(0, "第一章 概述\n正文。\n1.1 术语")], {}))
+    assert docs[-1].page_content == "【第一章 概述 > 1.1 术语】"
+    assert docs[-1].metadata["section_path"] == "第一章 概述 > 1.1 术语"
+
+
+def test_parent_heading_followed_by_child_is_not_emitted_alone():
+    chunker = structured_chunker.StructuredChunker(chunk_tokens=128)
+    docs = list(chunker.iter_chunks([(0, "第一章 概述\n1.1 术语\n直流桩指……")], {}))
+    assert [d.metadata["block_type"] for d in docs] == ["text"]
+    assert docs[0].page_content.startswith("【第一章 概述 > 1.1 术语】")